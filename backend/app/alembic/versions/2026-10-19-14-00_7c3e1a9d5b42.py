@@ -0,0 +1,48 @@
+"""add UserFollow pair indexes
+
+Revision ID: 7c3e1a9d5b42
+Revises: 2f4b9c1d7a3e
+Create Date: 2026-10-19 14:00:00.000000
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = "7c3e1a9d5b42"
+down_revision = "2f4b9c1d7a3e"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Keep the oldest row of any duplicated pair so the unique index can be
+    # built. The follow counters are fixed by the reconcile_follow_counts job.
+    op.execute(
+        """
+        DELETE FROM "UserFollow" a
+        USING "UserFollow" b
+        WHERE a.user_id = b.user_id
+          AND a.target_user_id = b.target_user_id
+          AND a.id > b.id
+        """
+    )
+    op.create_index(
+        "ix_UserFollow_user_id_target_user_id",
+        "UserFollow",
+        ["user_id", "target_user_id"],
+        unique=True,
+        postgresql_include=["is_mutual"],
+    )
+    op.create_index(
+        "ix_UserFollow_target_user_id_user_id",
+        "UserFollow",
+        ["target_user_id", "user_id"],
+        unique=False,
+        postgresql_include=["is_mutual"],
+    )
+
+
+def downgrade():
+    op.drop_index("ix_UserFollow_target_user_id_user_id", table_name="UserFollow")
+    op.drop_index("ix_UserFollow_user_id_target_user_id", table_name="UserFollow")
@@ -0,0 +1,31 @@
+"""add User full name trigram index
+
+Revision ID: 4e8a2f6c1d93
+Revises: 7c3e1a9d5b42
+Create Date: 2026-10-19 14:30:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = "4e8a2f6c1d93"
+down_revision = "7c3e1a9d5b42"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+    op.create_index(
+        "ix_User_full_name_trgm",
+        "User",
+        [sa.text("(first_name || ' ' || last_name) gin_trgm_ops")],
+        unique=False,
+        postgresql_using="gin",
+    )
+
+
+def downgrade():
+    op.drop_index("ix_User_full_name_trgm", table_name="User")
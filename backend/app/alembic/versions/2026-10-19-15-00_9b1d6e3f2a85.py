@@ -0,0 +1,47 @@
+"""add Hero and Team name prefix and trigram indexes
+
+Revision ID: 9b1d6e3f2a85
+Revises: 4e8a2f6c1d93
+Create Date: 2026-10-19 15:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = "9b1d6e3f2a85"
+down_revision = "4e8a2f6c1d93"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_index(
+        "ix_Hero_name_prefix",
+        "Hero",
+        [sa.text('lower(name) COLLATE "C" text_ops'), "id"],
+        unique=False,
+        postgresql_include=["name"],
+    )
+    op.create_index(
+        "ix_Hero_name_trgm",
+        "Hero",
+        ["name"],
+        unique=False,
+        postgresql_using="gin",
+        postgresql_ops={"name": "gin_trgm_ops"},
+    )
+    op.create_index(
+        "ix_Team_name_prefix",
+        "Team",
+        [sa.text('lower(name) COLLATE "C" text_ops'), "id"],
+        unique=False,
+        postgresql_include=["name"],
+    )
+
+
+def downgrade():
+    op.drop_index("ix_Team_name_prefix", table_name="Team")
+    op.drop_index("ix_Hero_name_trgm", table_name="Hero")
+    op.drop_index("ix_Hero_name_prefix", table_name="Hero")
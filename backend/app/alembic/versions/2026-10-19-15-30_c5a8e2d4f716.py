@@ -0,0 +1,43 @@
+"""add ChatMessage full text search vector
+
+Revision ID: c5a8e2d4f716
+Revises: 9b1d6e3f2a85
+Create Date: 2026-10-19 15:30:00.000000
+
+Adding a stored generated column rewrites ChatMessage, holding an
+exclusive lock on it for the duration.
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision = "c5a8e2d4f716"
+down_revision = "9b1d6e3f2a85"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column(
+        "ChatMessage",
+        sa.Column(
+            "search_vector",
+            postgresql.TSVECTOR(),
+            sa.Computed("to_tsvector('english', content)", persisted=True),
+            nullable=True,
+        ),
+    )
+    op.create_index(
+        "ix_ChatMessage_search_vector",
+        "ChatMessage",
+        ["search_vector"],
+        unique=False,
+        postgresql_using="gin",
+    )
+
+
+def downgrade():
+    op.drop_index("ix_ChatMessage_search_vector", table_name="ChatMessage")
+    op.drop_column("ChatMessage", "search_vector")
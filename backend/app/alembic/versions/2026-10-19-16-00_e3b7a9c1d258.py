@@ -0,0 +1,49 @@
+"""add HeroStat hourly rollup
+
+Revision ID: e3b7a9c1d258
+Revises: c5a8e2d4f716
+Create Date: 2026-10-19 16:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+import sqlmodel
+
+
+# revision identifiers, used by Alembic.
+revision = "e3b7a9c1d258"
+down_revision = "c5a8e2d4f716"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        "HeroStat",
+        sa.Column("id", sa.Integer(), nullable=False),
+        sa.Column("hour", sa.DateTime(), nullable=False),
+        sa.Column("team_id", sqlmodel.sql.sqltypes.GUID(), nullable=True),
+        sa.Column("count", sa.Integer(), nullable=False),
+        sa.PrimaryKeyConstraint("id"),
+    )
+    op.create_index(
+        "ix_HeroStat_hour_team_id",
+        "HeroStat",
+        ["hour", "team_id"],
+        unique=True,
+        postgresql_nulls_not_distinct=True,
+    )
+    op.execute(
+        """
+        INSERT INTO "HeroStat" (hour, team_id, count)
+        SELECT date_trunc('hour', created_at), team_id, count(*)
+        FROM "Hero"
+        WHERE created_at IS NOT NULL
+        GROUP BY 1, 2
+        """
+    )
+
+
+def downgrade():
+    op.drop_index("ix_HeroStat_hour_team_id", table_name="HeroStat")
+    op.drop_table("HeroStat")
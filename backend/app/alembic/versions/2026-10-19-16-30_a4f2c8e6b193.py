@@ -0,0 +1,28 @@
+"""index Hero by creator
+
+Revision ID: a4f2c8e6b193
+Revises: e3b7a9c1d258
+Create Date: 2026-10-19 16:30:00.000000
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = "a4f2c8e6b193"
+down_revision = "e3b7a9c1d258"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_index(
+        "ix_Hero_created_by_id_id",
+        "Hero",
+        ["created_by_id", "id"],
+        unique=False,
+    )
+
+
+def downgrade():
+    op.drop_index("ix_Hero_created_by_id_id", table_name="Hero")
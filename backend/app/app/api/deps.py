@@ -1,21 +1,24 @@
+import asyncio
 from collections.abc import AsyncGenerator
-from typing import Callable
+from typing import Any, Callable
 
 import redis.asyncio as aioredis
-from fastapi import Depends, HTTPException, status
+from fastapi import Depends, HTTPException, Request, status
 from fastapi.security import OAuth2PasswordBearer
-from jwt import DecodeError, ExpiredSignatureError, MissingRequiredClaimError
 from redis.asyncio import Redis
+from sqlalchemy.orm.attributes import set_committed_value
 from sqlmodel.ext.asyncio.session import AsyncSession
 
 from app import crud
 from app.core.config import settings
-from app.core.security import decode_token
 from app.db.session import SessionLocal
+from app.models.role_model import Role
 from app.models.user_model import User
 from app.schemas.common_schema import IMetaGeneral, TokenType
+from app.utils.auth_context import get_auth_context
+from app.utils.metrics import MeteredConnection
 from app.utils.storage_client_factory import get_storage_client
-from app.utils.token import get_valid_tokens
+from app.utils.token import check_token, has_current_role
 
 reusable_oauth2 = OAuth2PasswordBearer(
     tokenUrl=f"{settings.API_V1_STR}/login/access-token"
@@ -28,6 +31,7 @@ async def get_redis_client() -> Redis:
         max_connections=10,
         encoding="utf8",
         decode_responses=True,
+        connection_class=MeteredConnection,
     )
     return redis
 
@@ -38,65 +42,111 @@ async def get_db() -> AsyncGenerator[AsyncSession, None]:
 
 
 async def get_general_meta() -> IMetaGeneral:
-    current_roles = await crud.role.get_multi(skip=0, limit=100)
-    return IMetaGeneral(roles=current_roles)
+    current_roles = await crud.role.get_table()
+    return IMetaGeneral(roles=list(current_roles.values()))
+
+
+def check_role(role: Role | None, required_roles: list[str]) -> None:
+    if role is None or role.name not in required_roles:
+        raise HTTPException(
+            status_code=403,
+            detail=f"""Role "{required_roles}" is required for this action""",
+        )
 
 
 def get_current_user(required_roles: list[str] = None) -> Callable[[], User]:
     async def current_user(
+        request: Request,
         access_token: str = Depends(reusable_oauth2),
         redis_client: Redis = Depends(get_redis_client),
     ) -> User:
-        try:
-            payload = decode_token(access_token)
-        except ExpiredSignatureError:
-            raise HTTPException(
-                status_code=status.HTTP_403_FORBIDDEN,
-                detail="Your token has expired. Please log in again.",
-            )
-        except DecodeError:
-            raise HTTPException(
-                status_code=status.HTTP_403_FORBIDDEN,
-                detail="Error when decoding the token. Please check your request.",
-            )
-        except MissingRequiredClaimError:
-            raise HTTPException(
-                status_code=status.HTTP_403_FORBIDDEN,
-                detail="There is no required field in your token. Please contact the administrator.",
-            )
+        payload = get_auth_context(request).verified_claims()
 
         user_id = payload["sub"]
-        valid_access_tokens = await get_valid_tokens(
-            redis_client, user_id, TokenType.ACCESS
+        is_valid, role_version = await check_token(
+            redis_client, access_token, payload, TokenType.ACCESS
         )
-        if valid_access_tokens and access_token not in valid_access_tokens:
+        if not is_valid:
             raise HTTPException(
                 status_code=status.HTTP_403_FORBIDDEN,
                 detail="Could not validate credentials",
             )
-        user: User = await crud.user.get(id=user_id)
+
+        # A current role claim answers the role check without the database.
+        # The role comes from the cached Role table instead of a join, which
+        # also loads the role names the authorization rules read
+        role, role_known = None, has_current_role(payload, role_version)
+        if role_known and payload["role"] is not None:
+            role = await crud.role.get_cached(id=payload["role"])
+            role_known = role is not None
+        if required_roles and role_known:
+            check_role(role, required_roles)
+
+        user: User = await crud.user.get(
+            id=user_id, options=crud.user.without_role_options
+        )
         if not user:
             raise HTTPException(status_code=404, detail="User not found")
 
         if not user.is_active:
             raise HTTPException(status_code=400, detail="Inactive user")
 
-        if required_roles:
-            is_valid_role = False
-            for role in required_roles:
-                if role == user.role.name:
-                    is_valid_role = True
-
-            if not is_valid_role:
-                raise HTTPException(
-                    status_code=403,
-                    detail=f"""Role "{required_roles}" is required for this action""",
-                )
+        if not role_known:
+            if user.role_id is not None:
+                role = await crud.role.get_cached(id=user.role_id)
+            if required_roles:
+                check_role(role, required_roles)
+        if role is not None:
+            role = await crud.role.merge(role=role)
+        set_committed_value(user, "role", role)
 
         return user
 
     return current_user
 
 
+async def verify_pubsub_token(request: Request) -> dict[str, Any]:
+    """
+    Verifies the OIDC token Pub/Sub push subscriptions send (configured with
+    the PUBSUB_SERVICE_ACCOUNT service account and the PUBSUB_AUDIENCE
+    audience). Returns its claims, or raises 403.
+    """
+    if not settings.PUBSUB_AUDIENCE or not settings.PUBSUB_SERVICE_ACCOUNT:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Pub/Sub push authentication is not configured",
+        )
+    token = get_auth_context(request).token
+    if token is None:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN, detail="Not authenticated"
+        )
+    # Imported here: google.auth is slow to import and only used by this route
+    from google.oauth2 import id_token
+
+    from app.utils.google_certs import google_request
+
+    try:
+        # Blocking when the cached public keys of Google have expired
+        claims = await asyncio.to_thread(
+            id_token.verify_oauth2_token,
+            token,
+            google_request,
+            audience=settings.PUBSUB_AUDIENCE,
+        )
+    except ValueError:
+        claims = None
+    if (
+        claims is None
+        or claims.get("email") != settings.PUBSUB_SERVICE_ACCOUNT
+        or not claims.get("email_verified")
+    ):
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Could not validate credentials",
+        )
+    return claims
+
+
 def storage_client():
     return get_storage_client()
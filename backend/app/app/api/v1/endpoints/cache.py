@@ -3,13 +3,13 @@ from app import crud
 from app.schemas.response_schema import IGetResponseBase, create_response
 from datetime import datetime, timedelta, date
 from fastapi import APIRouter, Query
-from fastapi_cache.decorator import cache
+from app.utils.cache import cached
 
 router = APIRouter()
 
 
 @router.get("/cached")
-@cache(expire=10)
+@cached(ttl=10)
 async def get_a_cached_response() -> IGetResponseBase[str | datetime]:
     """
     Gets cached datetime
@@ -26,18 +26,22 @@ async def get_a_normal_response() -> IGetResponseBase[str | datetime]:
 
 
 @router.get("/heroe_count/cached")
-@cache(expire=20)
+@cached(ttl=20, stale_ttl=60, tags=["hero"])
 async def get_count_of_heroes_created_cached(
-    start_date: Annotated[date, Query(title="start date for get data")] = (
-        datetime.now() - timedelta(days=7)
-    ).date(),
+    start_date: Annotated[
+        date | None,
+        Query(title="start date for get data", description="Default is 7 days ago"),
+    ] = None,
     end_date: Annotated[
-        date, Query(title="end date for get data")
-    ] = datetime.now().date(),
+        date | None,
+        Query(title="end date for get data", description="Default is today"),
+    ] = None,
 ) -> IGetResponseBase[int]:
     """
     Gets count of heroes created on a base time (Cached response)
     """
+    start_date = start_date or date.today() - timedelta(days=7)
+    end_date = end_date or date.today()
     count = await crud.hero.get_count_of_heroes(
         start_time=datetime.combine(start_date, datetime.min.time()),
         end_time=datetime.combine(end_date, datetime.min.time()),
@@ -47,16 +51,20 @@ async def get_count_of_heroes_created_cached(
 
 @router.get("/heroe_count/no_cached")
 async def get_count_of_heroes_created_no_cached(
-    start_date: Annotated[date, Query(title="start date for get data")] = (
-        datetime.now() - timedelta(days=7)
-    ).date(),
+    start_date: Annotated[
+        date | None,
+        Query(title="start date for get data", description="Default is 7 days ago"),
+    ] = None,
     end_date: Annotated[
-        date, Query(title="end date for get data")
-    ] = datetime.now().date(),
+        date | None,
+        Query(title="end date for get data", description="Default is today"),
+    ] = None,
 ) -> IGetResponseBase[int]:
     """
     Gets count of heroes created on a base time (No Cached response)
     """
+    start_date = start_date or date.today() - timedelta(days=7)
+    end_date = end_date or date.today()
     count = await crud.hero.get_count_of_heroes(
         start_time=datetime.combine(start_date, datetime.min.time()),
         end_time=datetime.combine(end_date, datetime.min.time()),
@@ -1,4 +1,6 @@
-from fastapi import APIRouter, Body, Depends, HTTPException, status
+from typing import Annotated
+
+from fastapi import APIRouter, Body, Depends, HTTPException, Query, status
 from fastapi_pagination import Params
 from sqlmodel import select
 
@@ -12,15 +14,18 @@ from app.schemas.chat_schema import (
     ChatRoleEnum,
     IChatMessageCreate,
     IChatMessageRead,
+    IChatMessageSearchRead,
     IChatSessionCreate,
     IChatSessionRead,
     IChatSessionUpdate,
 )
 from app.schemas.response_schema import (
+    CursorPageBase,
     IGetResponseBase,
     IGetResponsePaginated,
     IPostResponseBase,
     IPutResponseBase,
+    create_projected_response,
     create_response,
 )
 from app.utils.fastapi_globals import g
@@ -83,6 +88,27 @@ async def list_chat_sessions(
     return create_response(data=sessions)
 
 
+@router.get("/search")
+async def search_chat_messages(
+    q: Annotated[str, Query(min_length=1, description="Web search syntax")],
+    size: Annotated[int, Query(ge=1, le=100)] = 20,
+    cursor: str | None = None,
+    current_user: User = Depends(deps.get_current_user()),
+) -> IGetResponseBase[CursorPageBase[IChatMessageSearchRead]]:
+    """
+    Full-text search over the messages of the current user's chat sessions,
+    best matches first. Snippets are HTML: the message text is escaped and
+    the matches are wrapped in <mark>. Pass `next_cursor` from the response as
+    `cursor` to get the next page.
+    """
+    messages, next_cursor = await crud.chat_message.search(
+        user_id=current_user.id, text=q, size=size, cursor=cursor
+    )
+    return create_projected_response(
+        data={"items": messages, "size": size, "next_cursor": next_cursor}
+    )
+
+
 @router.get("/sessions/{session_id}")
 async def get_chat_session(
     session: ChatSession = Depends(chat_deps.get_chat_session_by_id),
@@ -145,7 +171,7 @@ async def send_chat_message(
     )
 
     chat_client = g.chat_client
-    response_text = chat_client.generate(prompt)
+    response_text = await chat_client.generate(prompt)
     assistant_message = await crud.chat_message.create_for_session(
         session_id=session.id,
         user_id=None,
@@ -17,6 +17,7 @@ from app.schemas.response_schema import (
     IGetResponsePaginated,
     IPostResponseBase,
     IPutResponseBase,
+    create_projected_response,
     create_response,
 )
 from app.schemas.role_schema import IRoleEnum
@@ -24,6 +25,7 @@ from app.utils.exceptions import (
     IdNotFoundException,
     NameExistException,
 )
+from app.utils.query_log import query_budget
 
 router = APIRouter()
 
@@ -36,8 +38,10 @@ async def get_groups(
     """
     Gets a paginated list of groups
     """
-    groups = await crud.group.get_multi_paginated(params=params)
-    return create_response(data=groups)
+    groups = await crud.group.get_multi_paginated_projected(
+        schema=IGroupRead, params=params
+    )
+    return create_projected_response(data=groups)
 
 
 @router.get("/{group_id}")
@@ -48,7 +52,7 @@ async def get_group_by_id(
     """
     Gets a group by its id
     """
-    group = await crud.group.get(id=group_id)
+    group = await crud.group.get(id=group_id, options=crud.group.with_users_options)
     if group:
         return create_response(data=group)
     else:
@@ -95,7 +99,10 @@ async def update_group(
     return create_response(data=group_updated)
 
 
-@router.post("/add_user/{user_id}/{group_id}")
+@router.post(
+    "/add_user/{user_id}/{group_id}",
+    dependencies=[Depends(query_budget(9))],
+)
 async def add_user_into_a_group(
     user: User = Depends(user_deps.is_valid_user),
     group: Group = Depends(group_deps.get_group_by_id),
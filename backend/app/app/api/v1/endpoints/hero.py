@@ -1,3 +1,5 @@
+from datetime import date, timedelta
+from typing import Annotated
 from uuid import UUID
 from app.utils.exceptions import IdNotFoundException, NameNotFoundException
 from fastapi import APIRouter, Depends, HTTPException, Query
@@ -6,9 +8,10 @@ from app import crud
 from app.api import deps
 from app.models.hero_model import Hero
 from app.models.user_model import User
-from app.schemas.common_schema import IOrderEnum
+from app.schemas.common_schema import INameSuggestion, IOrderEnum
 from app.schemas.hero_schema import (
     IHeroCreate,
+    IHeroDailyStat,
     IHeroRead,
     IHeroReadWithTeam,
     IHeroUpdate,
@@ -19,6 +22,7 @@ from app.schemas.response_schema import (
     IGetResponsePaginated,
     IPostResponseBase,
     IPutResponseBase,
+    create_projected_response,
     create_response,
 )
 from app.schemas.role_schema import IRoleEnum
@@ -35,8 +39,33 @@ async def get_hero_list(
     """
     Gets a paginated list of heroes
     """
-    heroes = await crud.hero.get_multi_paginated(params=params)
-    return create_response(data=heroes)
+    heroes = await crud.hero.get_multi_paginated_projected(
+        params=params, query=crud.hero.get_read_projection()
+    )
+    return create_projected_response(data=heroes)
+
+
+@router.get("/editable")
+async def get_editable_hero_list(
+    params: Params = Depends(),
+    current_user: User = Depends(
+        deps.get_current_user(required_roles=[IRoleEnum.admin, IRoleEnum.manager])
+    ),
+) -> IGetResponsePaginated[IHeroReadWithTeam]:
+    """
+    Gets a paginated list of the heroes the user is allowed to update
+
+    Required roles:
+    - admin
+    - manager
+    """
+    query = crud.hero.authorized_query(
+        actor=current_user,
+        action="update",
+        query=crud.hero.get_read_projection().order_by(Hero.id),
+    )
+    heroes = await crud.hero.get_multi_paginated_projected(params=params, query=query)
+    return create_projected_response(data=heroes)
 
 
 @router.get("/get_by_created_at")
@@ -73,18 +102,57 @@ async def get_hero_by_id(
 @router.get("/get_by_name/{hero_name}")
 async def get_hero_by_name(
     hero_name: str,
+    params: Params = Depends(),
     current_user: User = Depends(deps.get_current_user()),
-) -> IGetResponseBase[list[IHeroReadWithTeam]]:
+) -> IGetResponsePaginated[IHeroReadWithTeam]:
     """
-    Gets a hero by his/her name
+    Gets a paginated list of heroes whose name contains `hero_name`
     """
-    heroes = await crud.hero.get_heroe_by_name(name=hero_name)
-    if not heroes:
+    heroes = await crud.hero.get_heroe_by_name(name=hero_name, params=params)
+    if not heroes.total:
         raise NameNotFoundException(Hero, hero_name)
 
     return create_response(data=heroes)
 
 
+@router.get("/autocomplete")
+async def autocomplete_hero_name(
+    prefix: str = Query(min_length=1),
+    limit: int = Query(default=10, ge=1, le=50),
+    current_user: User = Depends(deps.get_current_user()),
+) -> IGetResponseBase[list[INameSuggestion]]:
+    """
+    Gets the heroes whose name starts with `prefix`, in name order
+    """
+    heroes = await crud.hero.autocomplete(prefix=prefix, limit=limit)
+    return create_projected_response(data=heroes)
+
+
+@router.get("/stats/daily")
+async def get_hero_daily_stats(
+    start_date: Annotated[
+        date | None, Query(description="Included. Default is 6 days before today")
+    ] = None,
+    end_date: Annotated[
+        date | None, Query(description="Included. Default is today")
+    ] = None,
+    team_id: UUID | None = None,
+    current_user: User = Depends(deps.get_current_user()),
+) -> IGetResponseBase[list[IHeroDailyStat]]:
+    """
+    Gets the number of heroes created per day (UTC) and team. Days and teams
+    without new heroes are left out.
+    """
+    end_date = end_date or date.today()
+    start_date = start_date or end_date - timedelta(days=6)
+    stats = await crud.hero_stat.get_daily_counts(
+        start_date=start_date,
+        end_date=end_date + timedelta(days=1),
+        team_id=team_id,
+    )
+    return create_projected_response(data=stats)
+
+
 @router.post("")
 async def create_hero(
     hero: IHeroCreate,
@@ -121,7 +189,7 @@ async def update_hero(
     current_hero = await crud.hero.get(id=hero_id)
     if not current_hero:
         raise IdNotFoundException(Hero, hero_id)
-    if not is_authorized(current_user, "read", current_hero):
+    if not is_authorized(current_user, "update", current_hero):
         raise HTTPException(
             status_code=403,
             detail="You are not Authorized to update this heroe because you did not created it",
@@ -1,8 +1,7 @@
 from datetime import timedelta
 
-from fastapi import APIRouter, Body, Depends, HTTPException, status
+from fastapi import APIRouter, Body, Depends, HTTPException, Request, status
 from fastapi.security import OAuth2PasswordRequestForm
-from jwt import DecodeError, ExpiredSignatureError, MissingRequiredClaimError
 from pydantic import EmailStr
 from redis.asyncio import Redis
 
@@ -11,14 +10,15 @@ from app.api import deps
 from app.api.deps import get_redis_client
 from app.core import security
 from app.core.config import settings
-from app.core.security import decode_token, get_password_hash, verify_password
+from app.core.security import get_password_hash, verify_password
 from app.models.user_model import User
 from app.schemas.common_schema import IMetaGeneral, TokenType
 from app.schemas.role_schema import IRoleCreate, IRoleEnum
 from app.schemas.response_schema import IPostResponseBase, create_response
 from app.schemas.token_schema import RefreshToken, Token, TokenRead
 from app.schemas.user_schema import IUserCreate, IUserRegister
-from app.utils.token import add_token_to_redis, delete_tokens, get_valid_tokens
+from app.utils.auth_context import get_auth_context, parse_token
+from app.utils.token import check_token, create_tokens, revoke_token
 
 router = APIRouter()
 
@@ -38,13 +38,8 @@ async def login(
         raise HTTPException(status_code=400, detail="Email or Password incorrect")
     elif not user.is_active:
         raise HTTPException(status_code=400, detail="User is inactive")
-    access_token_expires = timedelta(minutes=settings.ACCESS_TOKEN_EXPIRE_MINUTES)
-    refresh_token_expires = timedelta(minutes=settings.REFRESH_TOKEN_EXPIRE_MINUTES)
-    access_token = security.create_access_token(
-        user.id, expires_delta=access_token_expires
-    )
-    refresh_token = security.create_refresh_token(
-        user.id, expires_delta=refresh_token_expires
+    access_token, refresh_token = await create_tokens(
+        redis_client, user.id, role_id=user.role_id
     )
     data = Token(
         access_token=access_token,
@@ -52,28 +47,6 @@ async def login(
         refresh_token=refresh_token,
         user=user,
     )
-    valid_access_tokens = await get_valid_tokens(
-        redis_client, user.id, TokenType.ACCESS
-    )
-    if valid_access_tokens:
-        await add_token_to_redis(
-            redis_client,
-            user,
-            access_token,
-            TokenType.ACCESS,
-            settings.ACCESS_TOKEN_EXPIRE_MINUTES,
-        )
-    valid_refresh_tokens = await get_valid_tokens(
-        redis_client, user.id, TokenType.REFRESH
-    )
-    if valid_refresh_tokens:
-        await add_token_to_redis(
-            redis_client,
-            user,
-            refresh_token,
-            TokenType.REFRESH,
-            settings.REFRESH_TOKEN_EXPIRE_MINUTES,
-        )
 
     print("data", data)
     print("meta_data", meta_data)
@@ -84,12 +57,11 @@ async def login(
 async def register(
     payload: IUserRegister,
     meta_data: IMetaGeneral = Depends(deps.get_general_meta),
-    redis_client: Redis = Depends(get_redis_client),
 ) -> IPostResponseBase[Token]:
     """
     Public signup endpoint. Creates a user with the "user" role.
     """
-    existing_user = await crud.user.get_by_email(email=payload.email)
+    existing_user = await crud.user.get_by_email(email=payload.email, options=())
     if existing_user:
         raise HTTPException(
             status_code=status.HTTP_409_CONFLICT,
@@ -116,8 +88,9 @@ async def register(
 
     access_token_expires = timedelta(minutes=settings.ACCESS_TOKEN_EXPIRE_MINUTES)
     refresh_token_expires = timedelta(minutes=settings.REFRESH_TOKEN_EXPIRE_MINUTES)
+    # A new user has no role version yet
     access_token = security.create_access_token(
-        user.id, expires_delta=access_token_expires
+        user.id, expires_delta=access_token_expires, role_id=role.id, role_version=0
     )
     refresh_token = security.create_refresh_token(
         user.id, expires_delta=refresh_token_expires
@@ -129,29 +102,6 @@ async def register(
         user=user,
     )
 
-    valid_access_tokens = await get_valid_tokens(
-        redis_client, user.id, TokenType.ACCESS
-    )
-    if valid_access_tokens:
-        await add_token_to_redis(
-            redis_client,
-            user,
-            access_token,
-            TokenType.ACCESS,
-            settings.ACCESS_TOKEN_EXPIRE_MINUTES,
-        )
-    valid_refresh_tokens = await get_valid_tokens(
-        redis_client, user.id, TokenType.REFRESH
-    )
-    if valid_refresh_tokens:
-        await add_token_to_redis(
-            redis_client,
-            user,
-            refresh_token,
-            TokenType.REFRESH,
-            settings.REFRESH_TOKEN_EXPIRE_MINUTES,
-        )
-
     return create_response(
         meta=meta_data, data=data, message="Signup correctly"
     )
@@ -168,27 +118,23 @@ async def change_password(
     Change password
     """
 
-    if not verify_password(current_password, current_user.hashed_password):
+    if not await verify_password(current_password, current_user.hashed_password):
         raise HTTPException(status_code=400, detail="Invalid Current Password")
 
-    if verify_password(new_password, current_user.hashed_password):
+    if await verify_password(new_password, current_user.hashed_password):
         raise HTTPException(
             status_code=400,
             detail="New Password should be different that the current one",
         )
 
-    new_hashed_password = get_password_hash(new_password)
+    new_hashed_password = await get_password_hash(new_password)
     await crud.user.update(
         obj_current=current_user, obj_new={"hashed_password": new_hashed_password}
     )
 
-    access_token_expires = timedelta(minutes=settings.ACCESS_TOKEN_EXPIRE_MINUTES)
-    refresh_token_expires = timedelta(minutes=settings.REFRESH_TOKEN_EXPIRE_MINUTES)
-    access_token = security.create_access_token(
-        current_user.id, expires_delta=access_token_expires
-    )
-    refresh_token = security.create_refresh_token(
-        current_user.id, expires_delta=refresh_token_expires
+    # Revokes the tokens issued with the previous password
+    access_token, refresh_token = await create_tokens(
+        redis_client, current_user.id, role_id=current_user.role_id, revoke=True
     )
     data = Token(
         access_token=access_token,
@@ -197,23 +143,6 @@ async def change_password(
         user=current_user,
     )
 
-    await delete_tokens(redis_client, current_user, TokenType.ACCESS)
-    await delete_tokens(redis_client, current_user, TokenType.REFRESH)
-    await add_token_to_redis(
-        redis_client,
-        current_user,
-        access_token,
-        TokenType.ACCESS,
-        settings.ACCESS_TOKEN_EXPIRE_MINUTES,
-    )
-    await add_token_to_redis(
-        redis_client,
-        current_user,
-        refresh_token,
-        TokenType.REFRESH,
-        settings.REFRESH_TOKEN_EXPIRE_MINUTES,
-    )
-
     return create_response(data=data, message="New password generated")
 
 
@@ -225,49 +154,26 @@ async def get_new_access_token(
     """
     Gets a new access token using the refresh token for future requests
     """
-    try:
-        payload = decode_token(body.refresh_token)
-    except ExpiredSignatureError:
-        raise HTTPException(
-            status_code=status.HTTP_403_FORBIDDEN,
-            detail="Your token has expired. Please log in again.",
-        )
-    except DecodeError:
-        raise HTTPException(
-            status_code=status.HTTP_403_FORBIDDEN,
-            detail="Error when decoding the token. Please check your request.",
-        )
-    except MissingRequiredClaimError:
-        raise HTTPException(
-            status_code=status.HTTP_403_FORBIDDEN,
-            detail="There is no required field in your token. Please contact the administrator.",
-        )
+    payload = parse_token(body.refresh_token).verified_claims()
 
     if payload["type"] == "refresh":
         user_id = payload["sub"]
-        valid_refresh_tokens = await get_valid_tokens(
-            redis_client, user_id, TokenType.REFRESH
+        is_valid, role_version = await check_token(
+            redis_client, body.refresh_token, payload, TokenType.REFRESH
         )
-        if valid_refresh_tokens and body.refresh_token not in valid_refresh_tokens:
+        if not is_valid:
             raise HTTPException(status_code=403, detail="Refresh token invalid")
 
         access_token_expires = timedelta(minutes=settings.ACCESS_TOKEN_EXPIRE_MINUTES)
-        user = await crud.user.get(id=user_id)
+        user = await crud.user.get(id=user_id, options=())
         if user.is_active:
             access_token = security.create_access_token(
-                payload["sub"], expires_delta=access_token_expires
+                payload["sub"],
+                expires_delta=access_token_expires,
+                version=payload.get("ver", 0),
+                role_id=user.role_id,
+                role_version=role_version,
             )
-            valid_access_get_valid_tokens = await get_valid_tokens(
-                redis_client, user.id, TokenType.ACCESS
-            )
-            if valid_access_get_valid_tokens:
-                await add_token_to_redis(
-                    redis_client,
-                    user,
-                    access_token,
-                    TokenType.ACCESS,
-                    settings.ACCESS_TOKEN_EXPIRE_MINUTES,
-                )
             return create_response(
                 data=TokenRead(access_token=access_token, token_type="bearer"),
                 message="Access token generated correctly",
@@ -278,6 +184,29 @@ async def get_new_access_token(
         raise HTTPException(status_code=404, detail="Incorrect token")
 
 
+@router.post("/logout")
+async def logout(
+    request: Request,
+    body: RefreshToken | None = None,
+    current_user: User = Depends(deps.get_current_user()),
+    redis_client: Redis = Depends(get_redis_client),
+) -> IPostResponseBase:
+    """
+    Revokes the access token of the request and, if given, the refresh token
+    """
+    await revoke_token(redis_client, get_auth_context(request).claims)
+    if body is not None:
+        payload = parse_token(body.refresh_token).claims
+        if (
+            payload is None
+            or payload["type"] != "refresh"
+            or payload["sub"] != str(current_user.id)
+        ):
+            raise HTTPException(status_code=403, detail="Refresh token invalid")
+        await revoke_token(redis_client, payload)
+    return create_response(data=None, message="Logged out")
+
+
 @router.post("/access-token")
 async def login_access_token(
     form_data: OAuth2PasswordRequestForm = Depends(),
@@ -287,25 +216,13 @@ async def login_access_token(
     OAuth2 compatible token login, get an access token for future requests
     """
     user = await crud.user.authenticate(
-        email=form_data.username, password=form_data.password
+        email=form_data.username, password=form_data.password, options=()
     )
     if not user:
         raise HTTPException(status_code=400, detail="Incorrect email or password")
     elif not user.is_active:
         raise HTTPException(status_code=400, detail="Inactive user")
-    access_token_expires = timedelta(minutes=settings.ACCESS_TOKEN_EXPIRE_MINUTES)
-    access_token = security.create_access_token(
-        user.id, expires_delta=access_token_expires
+    access_token, _ = await create_tokens(
+        redis_client, user.id, role_id=user.role_id, refresh=False
     )
-    valid_access_tokens = await get_valid_tokens(
-        redis_client, user.id, TokenType.ACCESS
-    )
-    if valid_access_tokens:
-        await add_token_to_redis(
-            redis_client,
-            user,
-            access_token,
-            TokenType.ACCESS,
-            settings.ACCESS_TOKEN_EXPIRE_MINUTES,
-        )
     return TokenRead(access_token=access_token, token_type="bearer")
@@ -3,7 +3,7 @@ from app.models.user_model import User
 from fastapi import APIRouter, Depends, HTTPException, status
 from app.utils.fastapi_globals import g
 from app.schemas.response_schema import IPostResponseBase, create_response
-from fastapi_limiter.depends import RateLimiter
+from app.utils.rate_limiter import RateLimiter
 
 router = APIRouter()
 
@@ -21,7 +21,7 @@ async def sentiment_analysis_prediction(
     """
     Gets a sentimental analysis predition using a NLP model from transformers libray
     """
-    sentiment_model = g.sentiment_model
+    sentiment_model = await g.sentiment_model.get()
     if sentiment_model is None:
         raise HTTPException(
             status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
@@ -45,12 +45,13 @@ async def text_generation_prediction_pubsub_stub(
     should call a handler that runs the same logic as the old Celery task.
     For now, this returns the synchronous prediction to mimic behavior.
     """
-    if g.sentiment_model is None:
+    sentiment_model = await g.sentiment_model.get()
+    if sentiment_model is None:
         raise HTTPException(
             status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
             detail="Sentiment model unavailable. Install torch>=2.1 to enable.",
         )
-    result = g.sentiment_model(prompt)
+    result = sentiment_model(prompt)
     return create_response(
         message="Prediction got succesfully",
         data={"task_id": "pubsub-stub", "result": result},
@@ -1,16 +1,33 @@
 from typing import Any
-from fastapi import APIRouter, Request, HTTPException
+from uuid import UUID
+from fastapi import APIRouter, Depends, Request, HTTPException
+from redis.asyncio import Redis
+from app import crud
+from app.api.deps import get_redis_client, verify_pubsub_token
+from app.core.config import settings
 from app.schemas.response_schema import create_response
 from app.utils.fastapi_globals import g
 
 router = APIRouter()
 
-@router.post("/pubsub/push")
-async def handle_pubsub_push(request: Request) -> Any:
+# Id of the last user whose follow counts were reconciled, while a sweep runs
+RECONCILE_CURSOR_KEY = "reconcile_follow_counts:after"
+
+
+@router.post("/pubsub/push", dependencies=[Depends(verify_pubsub_token)])
+async def handle_pubsub_push(
+    request: Request, redis_client: Redis = Depends(get_redis_client)
+) -> Any:
     """
-    GCP Pub/Sub push endpoint.
+    GCP Pub/Sub push endpoint, authenticated by the OIDC token of the push
+    subscription (see `verify_pubsub_token`).
     Expected JSON body: {"message": {"data": base64-encoded-string}}
     Data should decode to JSON with keys like {"event": "scheduled", "prompt": "..."}.
+    {"event": "reconcile_follow_counts"} recomputes the follower/following counts
+    of the next RECONCILE_BATCHES batches of users, resuming where the previous
+    push stopped: schedule it often enough to sweep every user, `done` is true
+    at the end of a sweep.
+    {"event": "rebuild_hero_stats"} recomputes the HeroStat rollup.
     """
     envelope = await request.json()
     if not envelope or "message" not in envelope:
@@ -30,11 +47,31 @@ async def handle_pubsub_push(request: Request) -> Any:
     else:
         payload = {}
 
+    if payload.get("event") == "reconcile_follow_counts":
+        after = await redis_client.get(RECONCILE_CURSOR_KEY)
+        corrected, last_id = await crud.user_follow.reconcile_follow_counts(
+            after=UUID(after) if after else None,
+            max_batches=settings.RECONCILE_BATCHES,
+        )
+        if last_id is None:
+            await redis_client.delete(RECONCILE_CURSOR_KEY)
+        else:
+            await redis_client.set(RECONCILE_CURSOR_KEY, str(last_id))
+        return create_response(
+            message="Follow counts reconciled",
+            data={"corrected": corrected, "done": last_id is None},
+        )
+
+    if payload.get("event") == "rebuild_hero_stats":
+        buckets = await crud.hero_stat.rebuild()
+        return create_response(message="Hero stats rebuilt", data={"buckets": buckets})
+
     prompt = payload.get("prompt", "Batman is awesome because")
-    if g.sentiment_model is None:
+    sentiment_model = await g.sentiment_model.get()
+    if sentiment_model is None:
         return create_response(
             message="Sentiment model unavailable; skipping processing",
             data={"result": None},
         )
-    result = g.sentiment_model(prompt)
+    result = sentiment_model(prompt)
     return create_response(message="Pub/Sub task processed", data={"result": result})
@@ -10,7 +10,6 @@ from app.schemas.role_schema import IRoleEnum
 from app.schemas.user_schema import (
     IUserRead,
 )
-import pandas as pd
 from fastapi.responses import StreamingResponse
 from enum import Enum
 from io import BytesIO, StringIO
@@ -45,6 +44,8 @@ async def export_users_list(
     users_list = [
         IUserRead.model_validate(user) for user in users
     ]  # Creates a pydantic list of object
+    import pandas as pd  # Slow to import, only the reports use it
+
     users_df = pd.DataFrame([s.__dict__ for s in users_list])
     if file_extension == FileExtensionEnum.xls:
         stream = BytesIO()
@@ -86,10 +87,12 @@ async def export_heroes_list(
     Required roles:
     - admin
     """
-    heroes = await crud.hero.get_multi_ordered(limit=1000, order_by="id")
+    heroes = await crud.hero.get_multi_ordered(limit=1000, order_by="id", options=())
     heroes_list = [
         IHeroRead.model_validate(hero) for hero in heroes
     ]  # Creates a pydantic list of object
+    import pandas as pd
+
     heroes_df = pd.DataFrame([s.__dict__ for s in heroes_list])
     if file_extension == FileExtensionEnum.xls:
         stream = BytesIO()
@@ -17,11 +17,13 @@ from app.schemas.response_schema import (
     create_response,
 )
 from app.schemas.role_schema import IRoleCreate, IRoleEnum, IRoleRead, IRoleUpdate
+from app.utils.cache import cached
 
 router = APIRouter()
 
 
 @router.get("")
+@cached(ttl=300, tags=["role"])
 async def get_roles(
     params: Params = Depends(),
     current_user: User = Depends(deps.get_current_user()),
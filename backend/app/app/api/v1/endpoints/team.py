@@ -4,7 +4,7 @@ from app.utils.exceptions import (
     IdNotFoundException,
     NameExistException,
 )
-from fastapi import APIRouter, Depends, status
+from fastapi import APIRouter, Depends, Query, status
 from fastapi_pagination import Params
 from app import crud
 from app.api import deps
@@ -15,8 +15,10 @@ from app.schemas.response_schema import (
     IGetResponseBase,
     IGetResponsePaginated,
     IPostResponseBase,
+    create_projected_response,
     create_response,
 )
+from app.schemas.common_schema import INameSuggestion
 from app.schemas.role_schema import IRoleEnum
 from app.schemas.team_schema import (
     ITeamCreate,
@@ -41,6 +43,19 @@ async def get_teams_list(
     return create_response(data=teams)
 
 
+@router.get("/autocomplete")
+async def autocomplete_team_name(
+    prefix: str = Query(min_length=1),
+    limit: int = Query(default=10, ge=1, le=50),
+    current_user: User = Depends(deps.get_current_user()),
+) -> IGetResponseBase[list[INameSuggestion]]:
+    """
+    Gets the teams whose name starts with `prefix`, in name order
+    """
+    teams = await crud.team.autocomplete(prefix=prefix, limit=limit)
+    return create_projected_response(data=teams)
+
+
 @router.get("/{team_id}")
 async def get_team_by_id(
     team_id: UUID,
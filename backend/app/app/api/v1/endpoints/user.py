@@ -14,6 +14,7 @@ from app.deps import user_deps
 from app.models import User, UserFollow
 from app.models.role_model import Role
 from app.utils.gcs_client import GCSClient
+from app.utils.query_log import query_budget
 from app.utils.resize_image import modify_image
 from fastapi import (
     APIRouter,
@@ -27,11 +28,13 @@ from fastapi import (
 )
 from app.schemas.media_schema import IMediaCreate
 from app.schemas.response_schema import (
+    CursorPageBase,
     IDeleteResponseBase,
     IGetResponseBase,
     IGetResponsePaginated,
     IPostResponseBase,
     IPutResponseBase,
+    create_projected_response,
     create_response,
 )
 from app.schemas.role_schema import IRoleEnum
@@ -46,12 +49,15 @@ from app.schemas.user_follow_schema import (
     IUserFollowReadCommon,
 )
 from fastapi_pagination import Params
-from sqlmodel import and_, select, col, or_, text
+from sqlmodel import select, col
 
 router = APIRouter()
 
 
-@router.get("/list")
+@router.get(
+    "/list",
+    dependencies=[Depends(query_budget(5))],
+)
 async def read_users_list(
     params: Params = Depends(),
     current_user: User = Depends(
@@ -65,11 +71,18 @@ async def read_users_list(
     - admin
     - manager
     """
-    users = await crud.user.get_multi_paginated(params=params)
-    return create_response(data=users)
+    users = await crud.user.get_multi_paginated_projected(
+        params=params,
+        query=crud.user.get_read_projection(),
+        transformer=crud.user.add_image_link,
+    )
+    return create_projected_response(data=users)
 
 
-@router.get("/list/by_role_name")
+@router.get(
+    "/list/by_role_name",
+    dependencies=[Depends(query_budget(5))],
+)
 async def read_users_list_by_role_name(
     name: str = "",
     user_status: Annotated[
@@ -96,27 +109,58 @@ async def read_users_list_by_role_name(
         select(User)
         .join(Role, User.role_id == Role.id)
         .where(
-            and_(
-                col(Role.name).ilike(f"%{role_name}%"),
-                User.is_active == user_status,
-                or_(
-                    col(User.first_name).ilike(f"%{name}%"),
-                    col(User.last_name).ilike(f"%{name}%"),
-                    text(
-                        f"""'{name}' % concat("User".last_name, ' ', "User".first_name)"""
-                    ),
-                    text(
-                        f"""'{name}' % concat("User".first_name, ' ', "User".last_name)"""
-                    ),
-                ),
-            )
+            col(Role.name).icontains(role_name, autoescape=True),
+            User.is_active == user_status,
+            crud.user.full_name_matches(name),
         )
         .order_by(User.first_name)
+        .options(*crud.user.read_options)
     )
     users = await crud.user.get_multi_paginated(query=query, params=params)
     return create_response(data=users)
 
 
+@router.get(
+    "/search",
+    dependencies=[Depends(query_budget(5))],
+)
+async def search_users(
+    name: Annotated[str, Query(min_length=1, description="Part of the full name")],
+    role_name: str | None = None,
+    user_status: Annotated[
+        IUserStatus,
+        Query(
+            title="User status",
+            description="User status, It is optional. Default is active",
+        ),
+    ] = IUserStatus.active,
+    size: Annotated[int, Query(ge=1, le=100)] = 50,
+    cursor: str | None = None,
+    current_user: User = Depends(
+        deps.get_current_user(required_roles=[IRoleEnum.admin, IRoleEnum.manager])
+    ),
+) -> IGetResponseBase[CursorPageBase[IUserReadWithoutGroups]]:
+    """
+    Fuzzy search of users by full name, best matches first. Typos are
+    tolerated through trigram similarity. Pass `next_cursor` from the response
+    as `cursor` to get the next page.
+
+    Required roles:
+    - admin
+    - manager
+    """
+    users, next_cursor = await crud.user.search(
+        name=name,
+        role_name=role_name,
+        is_active=user_status == IUserStatus.active,
+        size=size,
+        cursor=cursor,
+    )
+    return create_response(
+        data={"items": users, "size": size, "next_cursor": next_cursor}
+    )
+
+
 @router.get("/order_by_created_at")
 async def get_user_list_order_by_created_at(
     params: Params = Depends(),
@@ -132,7 +176,7 @@ async def get_user_list_order_by_created_at(
     - manager
     """
     users = await crud.user.get_multi_paginated_ordered(
-        params=params, order_by="created_at"
+        params=params, order_by="created_at", options=crud.user.read_options
     )
     return create_response(data=users)
 
@@ -165,6 +209,7 @@ async def get_following(
     "/following/{user_id}",
     status_code=status.HTTP_204_NO_CONTENT,
     response_class=Response,
+    dependencies=[Depends(query_budget(6))],
 )
 async def check_is_followed_by_user_id(
     user: User = Depends(user_deps.is_valid_user),
@@ -173,7 +218,7 @@ async def check_is_followed_by_user_id(
     """
     Check if a person is followed by the authenticated user
     """
-    result = await crud.user_follow.get_follow_by_user_id_and_target_user_id(
+    result = await crud.user_follow.is_following(
         user_id=user.id, target_user_id=current_user.id
     )
     if not result:
@@ -272,15 +317,15 @@ async def check_a_user_is_followed_another_user_by_id(
     if user_id == target_user_id:
         raise SelfFollowedException()
 
-    user = await crud.user.get(id=user_id)
+    user = await crud.user.get(id=user_id, options=())
     if not user:
         raise IdNotFoundException(User, id=user_id)
 
-    target_user = await crud.user.get(id=target_user_id)
+    target_user = await crud.user.get(id=target_user_id, options=())
     if not target_user:
         raise IdNotFoundException(User, id=target_user_id)
 
-    result = await crud.user_follow.get_follow_by_user_id_and_target_user_id(
+    result = await crud.user_follow.is_following(
         user_id=user_id, target_user_id=target_user_id
     )
     if not result:
@@ -289,7 +334,10 @@ async def check_a_user_is_followed_another_user_by_id(
         )
 
 
-@router.put("/following/{target_user_id}")
+@router.put(
+    "/following/{target_user_id}",
+    dependencies=[Depends(query_budget(7))],
+)
 async def follow_a_user_by_id(
     target_user_id: UUID,
     current_user: User = Depends(deps.get_current_user()),
@@ -299,25 +347,23 @@ async def follow_a_user_by_id(
     """
     if target_user_id == current_user.id:
         raise SelfFollowedException()
-    target_user = await crud.user.get(id=target_user_id)
+    target_user = await crud.user.get(id=target_user_id, options=())
     if not target_user:
         raise IdNotFoundException(User, id=target_user_id)
 
-    current_follow_user = (
-        await crud.user_follow.get_follow_by_user_id_and_target_user_id(
-            user_id=current_user.id, target_user_id=target_user_id
-        )
-    )
-    if current_follow_user:
-        raise UserFollowedException(target_user_name=target_user.last_name)
-
     new_user_follow = await crud.user_follow.follow_a_user_by_target_user_id(
         user=current_user, target_user=target_user
     )
+    if not new_user_follow:
+        raise UserFollowedException(target_user_name=target_user.last_name)
+
     return create_response(data=new_user_follow)
 
 
-@router.delete("/following/{target_user_id}")
+@router.delete(
+    "/following/{target_user_id}",
+    dependencies=[Depends(query_budget(7))],
+)
 async def unfollowing_a_user_by_id(
     target_user_id: UUID,
     current_user: User = Depends(deps.get_current_user()),
@@ -327,22 +373,16 @@ async def unfollowing_a_user_by_id(
     """
     if target_user_id == current_user.id:
         raise SelfFollowedException()
-    target_user = await crud.user.get(id=target_user_id)
+    target_user = await crud.user.get(id=target_user_id, options=())
     if not target_user:
         raise IdNotFoundException(User, id=target_user_id)
 
-    current_follow_user = await crud.user_follow.get_follow_by_target_user_id(
-        user_id=current_user.id, target_user_id=target_user_id
+    user_follow = await crud.user_follow.unfollow_a_user_by_target_user_id(
+        user=current_user, target_user=target_user
     )
-
-    if not current_follow_user:
+    if not user_follow:
         raise UserNotFollowedException(user_name=target_user.last_name)
 
-    user_follow = await crud.user_follow.unfollow_a_user_by_id(
-        user_follow_id=current_follow_user.id,
-        user=current_user,
-        target_user=target_user,
-    )
     return create_response(data=user_follow)
 
 
@@ -390,7 +430,10 @@ async def create_user(
     return create_response(data=user)
 
 
-@router.delete("/{user_id}")
+@router.delete(
+    "/{user_id}",
+    dependencies=[Depends(query_budget(10))],
+)
 async def remove_user(
     user_id: UUID = Depends(user_deps.is_valid_user_id),
     current_user: User = Depends(
@@ -1,18 +1,184 @@
+"""
+Authorization with Oso, evaluated by the database for lists.
+
+`authorized_filter(actor, action, Hero)` compiles the rules of authz.polar
+into a SQL predicate on Hero (Oso data filtering), so that endpoints select
+only the rows the actor may act on and the database paginates them.
+`CRUDBase.authorized_query` applies it to a query.
+
+`is_authorized` checks one loaded object. Decisions and filters depend only
+on the fields registered for the actor and resource classes below and on
+the names of the roles, so they are memoized by the values of the fields
+until the names change. Rules must only read registered fields and `Roles`.
+
+The role of a user is read from its `role_id` through `Roles`, the names of
+the cached Role table of `crud.role`, which sets them whenever it loads it.
+
+The policy is loaded on the first check, not when the app is imported.
+"""
+
+from collections import OrderedDict
+from collections.abc import Callable
+from functools import cache, reduce
 from pathlib import Path
+from typing import Any
+from uuid import UUID
+
+from oso import Oso  # (1)
+from polar.data.adapter import DataAdapter
+from polar.data.filter import Condition, DataFilter, Projection
+from sqlalchemy import ColumnElement, false, inspect, select, true
 
 from app.models.hero_model import Hero
 from app.models.user_model import User
-from oso import Oso  # (1)
 
+# Fields rules can read, by class. No Relation fields: checking an object,
+# Oso would load them through SQLFilterAdapter.execute_query.
+FIELDS: dict[type, dict[str, type]] = {
+    Hero: {"id": UUID, "created_by_id": UUID},
+    User: {"id": UUID, "role_id": UUID},
+}
+# Decisions and filters memoized
+CACHE_SIZE = 4096
+
+
+class Roles:
+    """
+    Names of the roles by id, as in the cached Role table.
+    """
+
+    names: dict[UUID, str] = {}
+
+    @classmethod
+    def name(cls, role_id: UUID | None) -> str | None:
+        return cls.names.get(role_id)
+
+
+class SQLFilterAdapter(DataAdapter):
+    """
+    Builds the SQL predicate of an Oso filter instead of running a query.
+    """
+
+    def build_query(self, filter: DataFilter) -> ColumnElement[bool]:
+        condition = reduce(
+            lambda a, b: a | b,
+            [
+                reduce(lambda a, b: a & b, map(self.sqlize, conditions), true())
+                for conditions in filter.conditions
+            ],
+            false(),
+        )
+        if not filter.relations:
+            return condition
 
-oso = Oso()  # (2)
-# load classes into Oso (3)
-oso.register_class(Hero)
-oso.register_class(User)
+        # Rules through relationships: match the ids of the joined rows
+        primary_key = inspect(filter.model).primary_key[0]
+        query = select(primary_key)
+        for relation in filter.relations:
+            left = filter.types[relation.left]
+            field = left.fields[relation.name]
+            right = filter.types[field.other_type].cls
+            query = query.join(
+                right,
+                getattr(left.cls, field.my_field) == getattr(right, field.other_field),
+            )
+        return primary_key.in_(query.where(condition))
 
-polar_path = Path(__file__).with_name("authz.polar")
-oso.load_files([str(polar_path)])
+    def execute_query(self, query: Any) -> Any:
+        """
+        Not called by the app. Oso runs a query itself only for
+        `Oso.authorized_resources`, which the app does not use (lists apply
+        `authorized_filter` in their own async session), and to load a
+        Relation field of an object it checks, which FIELDS does not register.
+        Running the query here would need a synchronous session: registering
+        a Relation means checking its objects through `authorized_filter`.
+        """
+        raise NotImplementedError("Use authorized_filter in a CRUD query")
+
+    @classmethod
+    def sqlize(cls, condition: Condition) -> ColumnElement[bool]:
+        left, right = cls.side(condition.left), cls.side(condition.right)
+        match condition.cmp:
+            case "Eq":
+                return left == right
+            case "Neq":
+                return left != right
+            case "In":
+                return left.in_(right)
+            case "Nin":
+                return left.not_in(right)
+        raise ValueError(f"Unsupported comparison {condition.cmp}")
+
+    @staticmethod
+    def side(side: Any) -> Any:
+        if isinstance(side, Projection):
+            field = side.field or inspect(side.source).primary_key[0].name
+            return getattr(side.source, field)
+        if type(side) in FIELDS:
+            return side.id
+        return side
+
+
+@cache
+def get_oso() -> Oso:
+    oso = Oso()  # (2)
+    # load classes into Oso (3)
+    for cls, fields in FIELDS.items():
+        oso.register_class(cls, fields=fields)
+    oso.register_class(UUID)
+    oso.register_class(Roles)
+    oso.set_data_filtering_adapter(SQLFilterAdapter())
+
+    polar_path = Path(__file__).with_name("authz.polar")
+    oso.load_files([str(polar_path)])
+    return oso
+
+
+_decisions: OrderedDict[tuple, bool] = OrderedDict()
+_filters: OrderedDict[tuple, ColumnElement[bool]] = OrderedDict()
+
+
+def set_role_names(names: dict[UUID, str]) -> None:
+    if names != Roles.names:
+        Roles.names = names
+        # Memoized with the previous names
+        _decisions.clear()
+        _filters.clear()
+
+
+def _fields_key(obj: Any) -> tuple:
+    return (type(obj), *(getattr(obj, field) for field in FIELDS[type(obj)]))
+
+
+def _memoized(cache: OrderedDict, key: tuple, compute: Callable[[], Any]) -> Any:
+    value = cache.get(key)
+    if value is None:
+        value = cache[key] = compute()
+        if len(cache) > CACHE_SIZE:
+            cache.popitem(last=False)
+    else:
+        cache.move_to_end(key)
+    return value
 
 
 def is_authorized(actor: User, action: str, resource, **kwargs):
-    return oso.is_allowed(actor=actor, action=action, resource=resource, **kwargs)
+    if kwargs or type(actor) not in FIELDS or type(resource) not in FIELDS:
+        return get_oso().is_allowed(
+            actor=actor, action=action, resource=resource, **kwargs
+        )
+    return _memoized(
+        _decisions,
+        (action, _fields_key(actor), _fields_key(resource)),
+        lambda: get_oso().is_allowed(actor=actor, action=action, resource=resource),
+    )
+
+
+def authorized_filter(actor: User, action: str, model: type) -> ColumnElement[bool]:
+    """
+    SQL predicate on `model` matching the rows `actor` may `action`.
+    """
+    return _memoized(
+        _filters,
+        (action, _fields_key(actor), model),
+        lambda: get_oso().authorized_query(actor, action, model),
+    )
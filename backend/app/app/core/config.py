@@ -29,9 +29,12 @@ class Settings(BaseSettings):
     PROJECT_NAME: str
     ACCESS_TOKEN_EXPIRE_MINUTES: int = 60 * 1  # 1 hour
     REFRESH_TOKEN_EXPIRE_MINUTES: int = 60 * 24 * 100  # 100 days
+    BCRYPT_ROUNDS: int = 12  # hashes of other costs are upgraded on login
+    PASSWORD_HASH_WORKERS: int = 2  # threads hashing passwords, per worker
     OPENAI_API_KEY: str | None = None
     OPENAI_MODEL: str = "gpt-3.5-turbo"
-    CHAT_PROVIDER: str = "vertex"  # vertex | openai
+    CHAT_PROVIDER: str = "vertex"  # vertex | openai | mock
+    MOCK_LLM_LATENCY_MS: int = 0  # simulated latency of the mock provider
     VERTEX_PROJECT_ID: str | None = None
     VERTEX_REGION: str | None = None
     VERTEX_MODEL: str = "gemini-2.5-flash-lite"
@@ -46,6 +49,9 @@ class Settings(BaseSettings):
     WEB_CONCURRENCY: int = 9
     POOL_SIZE: int = max(DB_POOL_SIZE // WEB_CONCURRENCY, 5)
     ASYNC_DATABASE_URI: PostgresDsn | str = ""
+    SLOW_QUERY_MS: int = 200  # statements at least this slow are logged
+    SLOW_QUERY_EXPLAIN: bool = False  # logs their plan too, in development
+    N_PLUS_ONE_THRESHOLD: int = 10  # executions of one statement in a request
 
     @field_validator("ASYNC_DATABASE_URI", mode="after")
     def assemble_db_connection(cls, v: str | None, info: FieldValidationInfo) -> Any:
@@ -88,6 +94,12 @@ class Settings(BaseSettings):
     GCS_SIGNED_URL_EXPIRE_MINUTES: int = 60 * 24 * 7  # 7 days
     LOCAL_MEDIA_PATH: str = "static/uploads"
 
+    # Pub/Sub push requests must carry an OIDC token for this audience (the
+    # push URL), issued to this service account
+    PUBSUB_AUDIENCE: str | None = None
+    PUBSUB_SERVICE_ACCOUNT: str | None = None
+    RECONCILE_BATCHES: int = 50  # batches of 1000 users per reconcile push
+
     SECRET_KEY: str = secrets.token_urlsafe(32)
     ENCRYPT_KEY: str = _default_encrypt_key()
     BACKEND_CORS_ORIGINS: list[str] | list[AnyHttpUrl]
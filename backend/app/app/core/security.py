@@ -1,5 +1,8 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta, timezone
 from typing import Any
+from uuid import uuid4
 
 import bcrypt
 import jwt
@@ -12,14 +15,30 @@ fernet = Fernet(str.encode(settings.ENCRYPT_KEY))
 JWT_ALGORITHM = "HS256"
 
 
-def create_access_token(subject: str | Any, expires_delta: timedelta = None) -> str:
+def create_access_token(
+    subject: str | Any,
+    expires_delta: timedelta = None,
+    version: int = 0,
+    role_id: str | Any | None = None,
+    role_version: int | None = None,
+) -> str:
     if expires_delta:
         expire = datetime.now(timezone.utc) + expires_delta
     else:
         expire = datetime.now(timezone.utc) + timedelta(
             minutes=settings.ACCESS_TOKEN_EXPIRE_MINUTES
         )
-    to_encode = {"exp": expire, "sub": str(subject), "type": "access"}
+    to_encode = {
+        "exp": expire,
+        "sub": str(subject),
+        "type": "access",
+        "jti": uuid4().hex,
+        "ver": version,
+    }
+    # Role of the user, valid while `rver` is the role version of the user
+    if role_version is not None:
+        to_encode["role"] = None if role_id is None else str(role_id)
+        to_encode["rver"] = role_version
 
     return jwt.encode(
         payload=to_encode,
@@ -28,14 +47,22 @@ def create_access_token(subject: str | Any, expires_delta: timedelta = None) ->
     )
 
 
-def create_refresh_token(subject: str | Any, expires_delta: timedelta = None) -> str:
+def create_refresh_token(
+    subject: str | Any, expires_delta: timedelta = None, version: int = 0
+) -> str:
     if expires_delta:
         expire = datetime.utcnow() + expires_delta
     else:
         expire = datetime.utcnow() + timedelta(
             minutes=settings.REFRESH_TOKEN_EXPIRE_MINUTES
         )
-    to_encode = {"exp": expire, "sub": str(subject), "type": "refresh"}
+    to_encode = {
+        "exp": expire,
+        "sub": str(subject),
+        "type": "refresh",
+        "jti": uuid4().hex,
+        "ver": version,
+    }
 
     return jwt.encode(
         payload=to_encode,
@@ -52,20 +79,44 @@ def decode_token(token: str) -> dict[str, Any]:
     )
 
 
-def verify_password(plain_password: str | bytes, hashed_password: str | bytes) -> bool:
+# bcrypt releases the GIL, so threads hash in parallel. Only this many hashes
+# run at a time; the others wait for a thread instead of taking the CPU from
+# the event loop.
+password_executor = ThreadPoolExecutor(
+    max_workers=settings.PASSWORD_HASH_WORKERS, thread_name_prefix="bcrypt"
+)
+
+
+async def verify_password(
+    plain_password: str | bytes, hashed_password: str | bytes
+) -> bool:
     if isinstance(plain_password, str):
         plain_password = plain_password.encode()
     if isinstance(hashed_password, str):
         hashed_password = hashed_password.encode()
 
-    return bcrypt.checkpw(plain_password, hashed_password)
+    return await asyncio.get_running_loop().run_in_executor(
+        password_executor, bcrypt.checkpw, plain_password, hashed_password
+    )
 
 
-def get_password_hash(plain_password: str | bytes) -> str:
+async def get_password_hash(plain_password: str | bytes) -> str:
     if isinstance(plain_password, str):
         plain_password = plain_password.encode()
 
-    return bcrypt.hashpw(plain_password, bcrypt.gensalt()).decode()
+    salt = bcrypt.gensalt(rounds=settings.BCRYPT_ROUNDS)
+    hashed_password = await asyncio.get_running_loop().run_in_executor(
+        password_executor, bcrypt.hashpw, plain_password, salt
+    )
+    return hashed_password.decode()
+
+
+def password_needs_rehash(hashed_password: str) -> bool:
+    """
+    Whether the hash was made with a cost other than `BCRYPT_ROUNDS`.
+    """
+    # $2b$<rounds>$<salt and hash>
+    return int(hashed_password.split("$")[2]) != settings.BCRYPT_ROUNDS
 
 
 def get_data_encrypt(data) -> str:
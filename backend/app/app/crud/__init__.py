@@ -1,5 +1,6 @@
 from .user_crud import user
 from .hero_crud import hero
+from .hero_stat_crud import hero_stat
 from .team_crud import team
 from .role_crud import role
 from .group_crud import group
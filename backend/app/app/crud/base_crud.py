@@ -1,4 +1,6 @@
+from collections.abc import Callable, Mapping, Sequence
 from fastapi import HTTPException
+from math import ceil
 from typing import Any, Generic, TypeVar
 from uuid import UUID
 from app.schemas.common_schema import IOrderEnum
@@ -10,6 +12,10 @@ from sqlmodel import SQLModel, select, func
 from sqlmodel.ext.asyncio.session import AsyncSession
 from sqlmodel.sql.expression import Select
 from sqlalchemy import exc
+from sqlalchemy.orm.interfaces import ORMOption
+from sqlalchemy.sql.elements import Label
+from app.core.authz import authorized_filter
+from app.utils.cache import response_cache
 
 ModelType = TypeVar("ModelType", bound=SQLModel)
 CreateSchemaType = TypeVar("CreateSchemaType", bound=BaseModel)
@@ -19,6 +25,15 @@ T = TypeVar("T", bound=SQLModel)
 
 
 class CRUDBase(Generic[ModelType, CreateSchemaType, UpdateSchemaType]):
+    # Relationships are declared with lazy="raise", so nothing is loaded unless
+    # asked for. Subclasses list here the loader options (joinedload,
+    # selectinload, load_only, ...) their usual read schema needs; every method
+    # accepts `options` to override them for a single query.
+    default_options: Sequence[ORMOption] = ()
+    # Tags of the cached responses (see app.utils.cache) built from this
+    # model. They are invalidated after every write.
+    cache_tags: Sequence[str] = ()
+
     def __init__(self, model: type[ModelType]):
         """
         CRUD object with default methods to Create, Read, Update, Delete (CRUD).
@@ -32,25 +47,41 @@ class CRUDBase(Generic[ModelType, CreateSchemaType, UpdateSchemaType]):
     def get_db(self) -> type(db):
         return self.db
 
+    def get_options(
+        self, options: Sequence[ORMOption] | None = None
+    ) -> Sequence[ORMOption]:
+        return self.default_options if options is None else options
+
     async def get(
-        self, *, id: UUID | str, db_session: AsyncSession | None = None
+        self,
+        *,
+        id: UUID | str,
+        options: Sequence[ORMOption] | None = None,
+        db_session: AsyncSession | None = None,
     ) -> ModelType | None:
         db_session = db_session or self.db.session
-        query = select(self.model).where(self.model.id == id)
+        query = (
+            select(self.model)
+            .where(self.model.id == id)
+            .options(*self.get_options(options))
+        )
         response = await db_session.execute(query)
-        return response.scalar_one_or_none()
+        return response.unique().scalar_one_or_none()
 
     async def get_by_ids(
         self,
         *,
         list_ids: list[UUID | str],
+        options: Sequence[ORMOption] | None = None,
         db_session: AsyncSession | None = None,
     ) -> list[ModelType] | None:
         db_session = db_session or self.db.session
         response = await db_session.execute(
-            select(self.model).where(self.model.id.in_(list_ids))
+            select(self.model)
+            .where(self.model.id.in_(list_ids))
+            .options(*self.get_options(options))
         )
-        return response.scalars().all()
+        return response.unique().scalars().all()
 
     async def get_count(
         self, db_session: AsyncSession | None = None
@@ -67,28 +98,127 @@ class CRUDBase(Generic[ModelType, CreateSchemaType, UpdateSchemaType]):
         skip: int = 0,
         limit: int = 100,
         query: T | Select[T] | None = None,
+        options: Sequence[ORMOption] | None = None,
         db_session: AsyncSession | None = None,
     ) -> list[ModelType]:
         db_session = db_session or self.db.session
-        if query is None:
-            query = select(self.model).offset(skip).limit(limit).order_by(self.model.id)
+        query = self._with_options(
+            query,
+            options,
+            select(self.model).offset(skip).limit(limit).order_by(self.model.id),
+        )
         response = await db_session.execute(query)
-        return response.scalars().all()
+        return response.unique().scalars().all()
 
     async def get_multi_paginated(
         self,
         *,
         params: Params | None = Params(),
         query: T | Select[T] | None = None,
+        options: Sequence[ORMOption] | None = None,
         db_session: AsyncSession | None = None,
     ) -> Page[ModelType]:
         db_session = db_session or self.db.session
-        if query is None:
-            query = select(self.model)
+        query = self._with_options(query, options, select(self.model))
 
         output = await paginate(db_session, query, params)
         return output
 
+    def authorized_query(
+        self, *, actor: SQLModel, action: str, query: Select | None = None
+    ) -> Select:
+        """
+        `query` (all the rows of the model by default) restricted in SQL to the
+        rows `actor` may `action` according to the authorization policy.
+        """
+        query = select(self.model) if query is None else query
+        return query.where(authorized_filter(actor, action, self.model))
+
+    async def get_multi_paginated_projected(
+        self,
+        *,
+        schema: type[BaseModel] | None = None,
+        params: Params | None = Params(),
+        query: Select | None = None,
+        transformer: Callable[[dict[str, Any]], dict[str, Any]] | None = None,
+        db_session: AsyncSession | None = None,
+    ) -> dict[str, Any]:
+        """
+        Fast path for list endpoints. Only the columns `schema` needs are
+        selected and rows come back as plain dicts, skipping ORM hydration and
+        response model validation. Columns labelled `relation__field` are nested
+        as `{"relation": {"field": ...}}` (a relation whose columns are all null
+        becomes `None`), so joined data can be projected with `get_columns`.
+        The result has the shape of `PageBase` and is meant to be returned with
+        `create_projected_response`.
+        """
+        db_session = db_session or self.db.session
+        if query is None:
+            query = select(*self.get_columns(schema))
+
+        total = await db_session.scalar(
+            select(func.count()).select_from(query.order_by(None).subquery())
+        )
+        response = await db_session.execute(
+            query.limit(params.size).offset((params.page - 1) * params.size)
+        )
+        items = _nest_rows(response.keys(), response.all())
+        if transformer is not None:
+            items = [transformer(item) for item in items]
+
+        pages = ceil(total / params.size) if params.size else 0
+        return {
+            "items": items,
+            "total": total,
+            "page": params.page,
+            "size": params.size,
+            "pages": pages,
+            "previous_page": params.page - 1 if params.page > 1 else None,
+            "next_page": params.page + 1 if params.page < pages else None,
+        }
+
+    def get_columns(
+        self,
+        schema: type[BaseModel],
+        *,
+        model: type[SQLModel] | None = None,
+        prefix: str = "",
+    ) -> list[Label]:
+        """
+        Columns of `model` (the CRUD model by default) that are fields of
+        `schema`, labelled `prefix + name`. Non-column fields such as
+        relationships or computed fields are left out.
+        """
+        columns = (model or self.model).__table__.columns
+        return [
+            columns[name].label(f"{prefix}{name}")
+            for name in schema.model_fields
+            if name in columns
+        ]
+
+    async def autocomplete(
+        self,
+        *,
+        prefix: str,
+        limit: int = 10,
+        db_session: AsyncSession | None = None,
+    ) -> list[dict[str, Any]]:
+        """
+        `id` and `name` of the first `limit` rows, in name order, whose name
+        starts with `prefix` (case insensitive). The model needs an index on
+        `(lower(name) COLLATE "C", id) INCLUDE (name)`: the prefix becomes a
+        range of that index and the scan stops after `limit` entries.
+        """
+        db_session = db_session or self.db.session
+        name = func.lower(self.model.name).collate("C")
+        response = await db_session.execute(
+            select(self.model.id, self.model.name)
+            .where(name.startswith(prefix.lower(), autoescape=True))
+            .order_by(name, self.model.id)
+            .limit(limit)
+        )
+        return [dict(row) for row in response.mappings()]
+
     async def get_multi_paginated_ordered(
         self,
         *,
@@ -96,6 +226,7 @@ class CRUDBase(Generic[ModelType, CreateSchemaType, UpdateSchemaType]):
         order_by: str | None = None,
         order: IOrderEnum | None = IOrderEnum.ascendent,
         query: T | Select[T] | None = None,
+        options: Sequence[ORMOption] | None = None,
         db_session: AsyncSession | None = None,
     ) -> Page[ModelType]:
         db_session = db_session or self.db.session
@@ -105,11 +236,11 @@ class CRUDBase(Generic[ModelType, CreateSchemaType, UpdateSchemaType]):
         if order_by is None or order_by not in columns:
             order_by = "id"
 
-        if query is None:
-            if order == IOrderEnum.ascendent:
-                query = select(self.model).order_by(columns[order_by].asc())
-            else:
-                query = select(self.model).order_by(columns[order_by].desc())
+        if order == IOrderEnum.ascendent:
+            default_query = select(self.model).order_by(columns[order_by].asc())
+        else:
+            default_query = select(self.model).order_by(columns[order_by].desc())
+        query = self._with_options(query, options, default_query)
 
         return await paginate(db_session, query, params)
 
@@ -120,6 +251,7 @@ class CRUDBase(Generic[ModelType, CreateSchemaType, UpdateSchemaType]):
         limit: int = 100,
         order_by: str | None = None,
         order: IOrderEnum | None = IOrderEnum.ascendent,
+        options: Sequence[ORMOption] | None = None,
         db_session: AsyncSession | None = None,
     ) -> list[ModelType]:
         db_session = db_session or self.db.session
@@ -143,15 +275,17 @@ class CRUDBase(Generic[ModelType, CreateSchemaType, UpdateSchemaType]):
                 .limit(limit)
                 .order_by(columns[order_by].desc())
             )
+        query = query.options(*self.get_options(options))
 
         response = await db_session.execute(query)
-        return response.scalars().all()
+        return response.unique().scalars().all()
 
     async def create(
         self,
         *,
         obj_in: CreateSchemaType | ModelType,
         created_by_id: UUID | str | None = None,
+        options: Sequence[ORMOption] | None = None,
         db_session: AsyncSession | None = None,
     ) -> ModelType:
         db_session = db_session or self.db.session
@@ -162,6 +296,7 @@ class CRUDBase(Generic[ModelType, CreateSchemaType, UpdateSchemaType]):
 
         try:
             db_session.add(db_obj)
+            await self.on_create(db_obj=db_obj, db_session=db_session)
             await db_session.commit()
         except exc.IntegrityError:
             db_session.rollback()
@@ -169,14 +304,15 @@ class CRUDBase(Generic[ModelType, CreateSchemaType, UpdateSchemaType]):
                 status_code=409,
                 detail="Resource already exists",
             )
-        await db_session.refresh(db_obj)
-        return db_obj
+        await self.invalidate_cache()
+        return await self.reload(db_obj=db_obj, options=options, db_session=db_session)
 
     async def update(
         self,
         *,
         obj_current: ModelType,
         obj_new: UpdateSchemaType | dict[str, Any] | ModelType,
+        options: Sequence[ORMOption] | None = None,
         db_session: AsyncSession | None = None,
     ) -> ModelType:
         db_session = db_session or self.db.session
@@ -187,22 +323,121 @@ class CRUDBase(Generic[ModelType, CreateSchemaType, UpdateSchemaType]):
             update_data = obj_new.dict(
                 exclude_unset=True
             )  # This tells Pydantic to not include the values that were not sent
+        previous = {field: getattr(obj_current, field) for field in update_data}
         for field in update_data:
             setattr(obj_current, field, update_data[field])
 
         db_session.add(obj_current)
+        await self.on_update(
+            db_obj=obj_current, previous=previous, db_session=db_session
+        )
         await db_session.commit()
-        await db_session.refresh(obj_current)
-        return obj_current
+        await self.invalidate_cache()
+        return await self.reload(
+            db_obj=obj_current, options=options, db_session=db_session
+        )
+
+    async def reload(
+        self,
+        *,
+        db_obj: ModelType,
+        options: Sequence[ORMOption] | None = None,
+        db_session: AsyncSession | None = None,
+    ) -> ModelType:
+        """
+        Refreshes `db_obj` from the database. Unlike `session.refresh`, the
+        loader options are applied too, so relationships the response needs
+        are loaded in the same round trip.
+        """
+        db_session = db_session or self.db.session
+        response = await db_session.execute(
+            select(self.model)
+            .where(self.model.id == db_obj.id)
+            .options(*self.get_options(options))
+            .execution_options(populate_existing=True)
+        )
+        return response.unique().scalar_one()
 
     async def remove(
-        self, *, id: UUID | str, db_session: AsyncSession | None = None
+        self,
+        *,
+        id: UUID | str,
+        options: Sequence[ORMOption] | None = None,
+        db_session: AsyncSession | None = None,
     ) -> ModelType:
         db_session = db_session or self.db.session
         response = await db_session.execute(
-            select(self.model).where(self.model.id == id)
+            select(self.model)
+            .where(self.model.id == id)
+            .options(*self.get_options(options))
         )
-        obj = response.scalar_one()
+        obj = response.unique().scalar_one()
         await db_session.delete(obj)
+        await self.on_remove(db_obj=obj, db_session=db_session)
         await db_session.commit()
+        await self.invalidate_cache()
         return obj
+
+    async def invalidate_cache(self) -> None:
+        await response_cache.invalidate(*self.cache_tags)
+
+    # Write hooks. They run in the transaction of the write, right before it
+    # is committed, so anything derived from the rows (rollups, counters) is
+    # committed or rolled back together with them.
+    async def on_create(self, *, db_obj: ModelType, db_session: AsyncSession) -> None:
+        pass
+
+    async def on_update(
+        self,
+        *,
+        db_obj: ModelType,
+        previous: dict[str, Any],
+        db_session: AsyncSession,
+    ) -> None:
+        """
+        `previous` holds the values the updated fields had before the update.
+        """
+
+    async def on_remove(self, *, db_obj: ModelType, db_session: AsyncSession) -> None:
+        pass
+
+    def _with_options(
+        self,
+        query: T | Select[T] | None,
+        options: Sequence[ORMOption] | None,
+        default_query: Select[T],
+    ) -> Select[T]:
+        # Caller-built queries may select plain columns, so the model's default
+        # options are only attached to the queries built here.
+        if query is None:
+            return default_query.options(*self.get_options(options))
+        if options:
+            return query.options(*options)
+        return query
+
+
+def _nest_rows(keys: Sequence[str], rows: Sequence[Any]) -> list[dict[str, Any]]:
+    paths = [key.split("__") for key in keys]
+    if all(len(path) == 1 for path in paths):
+        return [dict(zip(keys, row, strict=True)) for row in rows]
+    return [_collapse_nulls(_nest_row(paths, row)) for row in rows]
+
+
+def _nest_row(paths: Sequence[list[str]], row: Sequence[Any]) -> dict[str, Any]:
+    item: dict[str, Any] = {}
+    for path, value in zip(paths, row, strict=True):
+        target = item
+        for part in path[:-1]:
+            target = target.setdefault(part, {})
+        target[path[-1]] = value
+    return item
+
+
+def _collapse_nulls(item: dict[str, Any]) -> dict[str, Any]:
+    # An outer joined relation that is missing comes back with every column
+    # null; serialize it as null like the ORM path does.
+    for key, value in item.items():
+        if isinstance(value, Mapping):
+            value = _collapse_nulls(value)
+            item[key] = None if all(v is None for v in value.values()) else value
+    return item
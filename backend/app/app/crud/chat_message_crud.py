@@ -1,11 +1,27 @@
+from typing import Any
 from uuid import UUID
 
-from sqlmodel import select
+from sqlmodel import and_, func, or_, select
 from sqlmodel.ext.asyncio.session import AsyncSession
 
 from app.crud.base_crud import CRUDBase
 from app.models.chat_message_model import ChatMessage
+from app.models.chat_session_model import ChatSession
 from app.schemas.chat_schema import ChatRoleEnum, IChatMessageCreate
+from app.utils.cursor import decode_cursor, encode_cursor
+from app.utils.exceptions import InvalidCursorException
+
+# Must match the configuration of the ChatMessage.search_vector column
+SEARCH_CONFIG = "english"
+HEADLINE_OPTIONS = "StartSel=<mark>, StopSel=</mark>, MaxWords=35, MinWords=15"
+# Characters escaped in the content of the snippets, in this order
+HTML_ESCAPES = (
+    ("&", "&amp;"),
+    ("<", "&lt;"),
+    (">", "&gt;"),
+    ('"', "&quot;"),
+    ("'", "&#x27;"),
+)
 
 
 class CRUDChatMessage(CRUDBase[ChatMessage, IChatMessageCreate, IChatMessageCreate]):
@@ -44,5 +60,78 @@ class CRUDChatMessage(CRUDBase[ChatMessage, IChatMessageCreate, IChatMessageCrea
         )
         return response.scalars().all()
 
+    async def search(
+        self,
+        *,
+        user_id: UUID,
+        text: str,
+        size: int = 20,
+        cursor: str | None = None,
+        db_session: AsyncSession | None = None,
+    ) -> tuple[list[dict[str, Any]], str | None]:
+        """
+        Messages of the chat sessions of `user_id` matching `text` (web search
+        syntax: quoted phrases, `or`, `-word`), best ranked first. Each result
+        has a snippet of the content as HTML: the content is escaped and the
+        matches wrapped in <mark>, so it is safe to render.
+        Results are keyset paginated on (rank, id): the returned cursor is
+        passed back to get the next page, or is None on the last one.
+        """
+        db_session = db_session or super().get_db().session
+        query = func.websearch_to_tsquery(SEARCH_CONFIG, text)
+        rank = func.ts_rank_cd(ChatMessage.search_vector, query)
+        matches = (
+            select(ChatMessage.id, rank.label("rank"))
+            .join(ChatSession, ChatMessage.session_id == ChatSession.id)
+            .where(
+                ChatSession.user_id == user_id,
+                ChatMessage.search_vector.bool_op("@@")(query),
+            )
+            .order_by(rank.desc(), ChatMessage.id)
+            .limit(size + 1)
+        )
+        if cursor:
+            last_rank, last_id = decode_cursor(cursor, 2)
+            try:
+                last_id = UUID(last_id)
+                last_rank = float(last_rank)
+            except (TypeError, ValueError):
+                raise InvalidCursorException()
+            matches = matches.where(
+                or_(
+                    rank < last_rank,
+                    and_(rank == last_rank, ChatMessage.id > last_id),
+                )
+            )
+        matches = matches.subquery()
+
+        # Snippets are only built for the rows of the page, from the escaped
+        # content: the messages hold user and LLM text
+        content = ChatMessage.content
+        for char, entity in HTML_ESCAPES:
+            content = func.replace(content, char, entity)
+        response = await db_session.execute(
+            select(
+                ChatMessage.id,
+                ChatMessage.session_id,
+                ChatSession.title.label("session_title"),
+                ChatMessage.role,
+                ChatMessage.created_at,
+                func.ts_headline(SEARCH_CONFIG, content, query, HEADLINE_OPTIONS).label(
+                    "snippet"
+                ),
+                matches.c.rank,
+            )
+            .join(matches, ChatMessage.id == matches.c.id)
+            .join(ChatSession, ChatMessage.session_id == ChatSession.id)
+            .order_by(matches.c.rank.desc(), ChatMessage.id)
+        )
+        items = [dict(row) for row in response.mappings()]
+        next_cursor = None
+        if len(items) > size:
+            items = items[:size]
+            next_cursor = encode_cursor(items[-1]["rank"], items[-1]["id"])
+        return items, next_cursor
+
 
 chat_message = CRUDChatMessage(ChatMessage)
@@ -1,9 +1,12 @@
+from collections.abc import Sequence
 from uuid import UUID
 
-from sqlmodel import select
+from sqlalchemy.orm.interfaces import ORMOption
+from sqlmodel import delete, select
 from sqlmodel.ext.asyncio.session import AsyncSession
 
 from app.crud.base_crud import CRUDBase
+from app.models.chat_message_model import ChatMessage
 from app.models.chat_session_model import ChatSession
 from app.schemas.chat_schema import IChatSessionCreate, IChatSessionUpdate
 
@@ -37,5 +40,21 @@ class CRUDChatSession(CRUDBase[ChatSession, IChatSessionCreate, IChatSessionUpda
         )
         return response.scalars().all()
 
+    async def remove(
+        self,
+        *,
+        id: UUID | str,
+        options: Sequence[ORMOption] | None = None,
+        db_session: AsyncSession | None = None,
+    ) -> ChatSession:
+        """
+        Removes the session with its messages.
+        """
+        db_session = db_session or super().get_db().session
+        await db_session.execute(
+            delete(ChatMessage).where(ChatMessage.session_id == id)
+        )
+        return await super().remove(id=id, options=options, db_session=db_session)
+
 
 chat_session = CRUDChatSession(ChatSession)
@@ -1,13 +1,21 @@
 from app.models.group_model import Group
+from app.models.image_media_model import ImageMedia
 from app.models.user_model import User
 from app.schemas.group_schema import IGroupCreate, IGroupUpdate
 from app.crud.base_crud import CRUDBase
+from sqlalchemy.orm import selectinload
 from sqlmodel import select
 from uuid import UUID
 from sqlmodel.ext.asyncio.session import AsyncSession
 
 
 class CRUDGroup(CRUDBase[Group, IGroupCreate, IGroupUpdate]):
+    # IGroupReadWithUsers
+    with_users_options = (
+        selectinload(Group.users).joinedload(User.role),
+        selectinload(Group.users).joinedload(User.image).joinedload(ImageMedia.media),
+    )
+
     async def get_group_by_name(
         self, *, name: str, db_session: AsyncSession | None = None
     ) -> Group:
@@ -17,12 +25,11 @@ class CRUDGroup(CRUDBase[Group, IGroupCreate, IGroupUpdate]):
 
     async def add_user_to_group(self, *, user: User, group_id: UUID) -> Group:
         db_session = super().get_db().session
-        group = await super().get(id=group_id)
+        group = await super().get(id=group_id, options=[selectinload(Group.users)])
         group.users.append(user)
         db_session.add(group)
         await db_session.commit()
-        await db_session.refresh(group)
-        return group
+        return await self.reload(db_obj=group, db_session=db_session)
 
     async def add_users_to_group(
         self,
@@ -32,12 +39,13 @@ class CRUDGroup(CRUDBase[Group, IGroupCreate, IGroupUpdate]):
         db_session: AsyncSession | None = None,
     ) -> Group:
         db_session = db_session or super().get_db().session
-        group = await super().get(id=group_id, db_session=db_session)
+        group = await super().get(
+            id=group_id, options=[selectinload(Group.users)], db_session=db_session
+        )
         group.users.extend(users)
         db_session.add(group)
         await db_session.commit()
-        await db_session.refresh(group)
-        return group
+        return await self.reload(db_obj=group, db_session=db_session)
 
 
 group = CRUDGroup(Group)
@@ -1,20 +1,55 @@
-from app.schemas.hero_schema import IHeroCreate, IHeroUpdate
+from app.schemas.hero_schema import IHeroCreate, IHeroReadWithTeam, IHeroUpdate
 from datetime import datetime
+from typing import Any
+from uuid import UUID
 from app.crud.base_crud import CRUDBase
+from app.crud.hero_stat_crud import hero_stat
 from app.models.hero_model import Hero
-from sqlmodel import select, func, and_, col
+from app.models.team_model import Team, TeamBase
+from fastapi_pagination import Page, Params
+from sqlalchemy.orm import joinedload
+from sqlmodel import select, col
 from sqlmodel.ext.asyncio.session import AsyncSession
+from sqlmodel.sql.expression import Select
 
 
 class CRUDHero(CRUDBase[Hero, IHeroCreate, IHeroUpdate]):
+    # IHeroReadWithTeam
+    default_options = (joinedload(Hero.team),)
+    cache_tags = ("hero",)
+
+    def get_read_projection(self) -> Select:
+        """
+        Columns of IHeroReadWithTeam, with the team joined in, for
+        `get_multi_paginated_projected`.
+        """
+        return select(
+            *self.get_columns(IHeroReadWithTeam),
+            *self.get_columns(TeamBase, model=Team, prefix="team__"),
+        ).outerjoin(Team, Hero.team_id == Team.id)
+
     async def get_heroe_by_name(
-        self, *, name: str, db_session: AsyncSession | None = None
-    ) -> Hero:
-        db_session = db_session or super().get_db().session
-        heroe = await db_session.execute(
-            select(Hero).where(col(Hero.name).ilike(f"%{name}%"))
+        self,
+        *,
+        name: str,
+        params: Params | None = Params(),
+        db_session: AsyncSession | None = None,
+    ) -> Page[Hero]:
+        """
+        Heroes whose name contains `name` (case insensitive), answered by the
+        ix_Hero_name_trgm index.
+        """
+        query = (
+            select(Hero)
+            .where(col(Hero.name).icontains(name, autoescape=True))
+            .order_by(Hero.name, Hero.id)
+        )
+        return await self.get_multi_paginated(
+            query=query,
+            params=params,
+            options=self.default_options,
+            db_session=db_session,
         )
-        return heroe.scalars().all()
 
     async def get_count_of_heroes(
         self,
@@ -23,21 +58,43 @@ class CRUDHero(CRUDBase[Hero, IHeroCreate, IHeroUpdate]):
         end_time: datetime,
         db_session: AsyncSession | None = None,
     ) -> int:
-        db_session = db_session or super().get_db().session
-        subquery = (
-            select(Hero)
-            .where(
-                and_(
-                    Hero.created_at > start_time,
-                    Hero.created_at < end_time,
-                )
-            )
-            .subquery()
+        """
+        Answered from the hourly HeroStat rollup, see `hero_stat.get_hero_count`.
+        """
+        return await hero_stat.get_hero_count(
+            start_time=start_time, end_time=end_time, db_session=db_session
         )
-        query = select(func.count()).select_from(subquery)
-        count = await db_session.execute(query)
-        value = count.scalar_one_or_none()
-        return value
+
+    # Keep the HeroStat rollup in step with every hero write
+    async def on_create(self, *, db_obj: Hero, db_session: AsyncSession) -> None:
+        await self._add_to_stats(db_obj.created_at, db_obj.team_id, 1, db_session)
+
+    async def on_update(
+        self, *, db_obj: Hero, previous: dict[str, Any], db_session: AsyncSession
+    ) -> None:
+        created_at = previous.get("created_at", db_obj.created_at)
+        team_id = previous.get("team_id", db_obj.team_id)
+        if (created_at, team_id) != (db_obj.created_at, db_obj.team_id):
+            await self._add_to_stats(created_at, team_id, -1, db_session)
+            await self._add_to_stats(db_obj.created_at, db_obj.team_id, 1, db_session)
+
+    async def on_remove(self, *, db_obj: Hero, db_session: AsyncSession) -> None:
+        await self._add_to_stats(db_obj.created_at, db_obj.team_id, -1, db_session)
+
+    async def _add_to_stats(
+        self,
+        created_at: datetime | None,
+        team_id: UUID | None,
+        delta: int,
+        db_session: AsyncSession,
+    ) -> None:
+        if created_at is not None:
+            await hero_stat.add(
+                created_at=created_at,
+                team_id=team_id,
+                delta=delta,
+                db_session=db_session,
+            )
 
 
 hero = CRUDHero(Hero)
@@ -0,0 +1,116 @@
+from datetime import date, datetime
+from typing import Any
+from uuid import UUID
+from sqlalchemy.dialects.postgresql import insert
+from sqlmodel import Date, cast, delete, func, select, text
+from sqlmodel.ext.asyncio.session import AsyncSession
+from app.crud.base_crud import CRUDBase
+from app.models.hero_model import Hero
+from app.models.hero_stat_model import HeroStat
+
+
+class CRUDHeroStat(CRUDBase[HeroStat, HeroStat, HeroStat]):
+    cache_tags = ("hero",)
+
+    async def add(
+        self,
+        *,
+        created_at: datetime,
+        team_id: UUID | None,
+        delta: int,
+        db_session: AsyncSession | None = None,
+    ) -> None:
+        """
+        Adds `delta` to the bucket of the hour of `created_at` for `team_id`.
+        Does not commit; it is meant to run in the transaction of the hero
+        write.
+        """
+        db_session = db_session or super().get_db().session
+        await db_session.execute(
+            insert(HeroStat)
+            .values(
+                hour=created_at.replace(minute=0, second=0, microsecond=0),
+                team_id=team_id,
+                count=delta,
+            )
+            .on_conflict_do_update(
+                index_elements=["hour", "team_id"],
+                set_={"count": HeroStat.count + delta},
+            )
+        )
+
+    async def get_hero_count(
+        self,
+        *,
+        start_time: datetime,
+        end_time: datetime,
+        team_id: UUID | None = None,
+        db_session: AsyncSession | None = None,
+    ) -> int:
+        """
+        Heroes created from `start_time` (included) to `end_time` (excluded),
+        both in whole hours.
+        """
+        db_session = db_session or super().get_db().session
+        query = select(func.coalesce(func.sum(HeroStat.count), 0)).where(
+            HeroStat.hour >= start_time, HeroStat.hour < end_time
+        )
+        if team_id is not None:
+            query = query.where(HeroStat.team_id == team_id)
+        return await db_session.scalar(query)
+
+    async def get_daily_counts(
+        self,
+        *,
+        start_date: date,
+        end_date: date,
+        team_id: UUID | None = None,
+        db_session: AsyncSession | None = None,
+    ) -> list[dict[str, Any]]:
+        """
+        `{"day", "team_id", "count"}` of the heroes created per day (UTC) and
+        team, from `start_date` (included) to `end_date` (excluded). Days and
+        teams without heroes are left out.
+        """
+        db_session = db_session or super().get_db().session
+        day = cast(func.date_trunc("day", HeroStat.hour), Date)
+        count = func.sum(HeroStat.count)
+        query = (
+            select(day.label("day"), HeroStat.team_id, count.label("count"))
+            .where(
+                HeroStat.hour >= datetime.combine(start_date, datetime.min.time()),
+                HeroStat.hour < datetime.combine(end_date, datetime.min.time()),
+            )
+            .group_by(day, HeroStat.team_id)
+            .having(count != 0)
+            .order_by(day, HeroStat.team_id)
+        )
+        if team_id is not None:
+            query = query.where(HeroStat.team_id == team_id)
+        response = await db_session.execute(query)
+        return [dict(row) for row in response.mappings()]
+
+    async def rebuild(self, *, db_session: AsyncSession | None = None) -> int:
+        """
+        Recomputes every bucket from Hero, for example after heroes were
+        written without going through crud.hero. Hero writes wait for it to
+        finish. Returns the number of buckets.
+        """
+        db_session = db_session or super().get_db().session
+        await db_session.execute(text('LOCK TABLE "HeroStat" IN EXCLUSIVE MODE'))
+        await db_session.execute(delete(HeroStat))
+        hour = func.date_trunc("hour", Hero.created_at)
+        response = await db_session.execute(
+            insert(HeroStat).from_select(
+                ["hour", "team_id", "count"],
+                select(hour, Hero.team_id, func.count())
+                .where(Hero.created_at.is_not(None))
+                .group_by(hour, Hero.team_id),
+            )
+        )
+        await db_session.commit()
+        await self.invalidate_cache()
+        return response.rowcount
+
+
+hero_stat = CRUDHeroStat(HeroStat)
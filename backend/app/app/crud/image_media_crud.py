@@ -1,10 +1,12 @@
 from app.crud.base_crud import CRUDBase
 from app.models.image_media_model import ImageMedia
 from app.schemas.image_media_schema import IImageMediaCreate, IImageMediaUpdate
+from sqlalchemy.orm import joinedload
 
 
 class CRUDImageMedia(CRUDBase[ImageMedia, IImageMediaCreate, IImageMediaUpdate]):
-    pass
+    # IImageMediaRead
+    default_options = (joinedload(ImageMedia.media),)
 
 
 image = CRUDImageMedia(ImageMedia)
@@ -1,28 +1,96 @@
+import time
+from app.core.authz import set_role_names
 from app.schemas.role_schema import IRoleCreate, IRoleUpdate
 from app.models.role_model import Role
 from app.models.user_model import User
 from app.crud.base_crud import CRUDBase
+from app.utils.cache import response_cache
+from app.utils.token import revoke_role_claims
+from redis.asyncio import Redis
+from sqlalchemy.orm import make_transient_to_detached, selectinload
 from sqlmodel.ext.asyncio.session import AsyncSession
 from sqlmodel import select
 from uuid import UUID
 
 
 class CRUDRole(CRUDBase[Role, IRoleCreate, IRoleUpdate]):
+    cache_tags = ("role",)
+    # Seconds a process uses its copy of the Role table before checking that
+    # no other process changed the roles (the version of the "role" cache tag)
+    table_ttl = 30.0
+
+    def __init__(self, model: type[Role]):
+        super().__init__(model)
+        self._table: dict[UUID, Role] | None = None
+        self._table_version: int | None = None
+        self._table_checked_at = 0.0
+
+    async def get_table(
+        self, *, db_session: AsyncSession | None = None
+    ) -> dict[UUID, Role]:
+        """
+        Every role by id, cached by the process. The roles are detached from
+        any session and shared: read them, or `merge` them into a session.
+        """
+        now = time.monotonic()
+        if self._table is not None and now - self._table_checked_at < self.table_ttl:
+            return self._table
+        version = await response_cache.tag_version("role")
+        if self._table is None or version is None or version != self._table_version:
+            db_session = db_session or super().get_db().session
+            # Columns only, so the request session keeps no Role objects
+            response = await db_session.execute(
+                select(*Role.__table__.columns).order_by(Role.id)
+            )
+            table = {}
+            for row in response.mappings():
+                role = Role(**row)
+                make_transient_to_detached(role)
+                table[role.id] = role
+            self._table = table
+            set_role_names({id: role.name for id, role in table.items()})
+        self._table_version, self._table_checked_at = version, now
+        return self._table
+
+    async def get_cached(
+        self, *, id: UUID | str, db_session: AsyncSession | None = None
+    ) -> Role | None:
+        table = await self.get_table(db_session=db_session)
+        return table.get(id if isinstance(id, UUID) else UUID(id))
+
+    async def merge(
+        self, *, role: Role, db_session: AsyncSession | None = None
+    ) -> Role:
+        """
+        A cached role as an object of the session, without a query.
+        """
+        db_session = db_session or super().get_db().session
+        return await db_session.merge(role, load=False)
+
     async def get_role_by_name(
         self, *, name: str, db_session: AsyncSession | None = None
     ) -> Role:
-        db_session = db_session or super().get_db().session
-        role = await db_session.execute(select(Role).where(Role.name == name))
-        return role.scalar_one_or_none()
+        table = await self.get_table(db_session=db_session)
+        return next((role for role in table.values() if role.name == name), None)
 
-    async def add_role_to_user(self, *, user: User, role_id: UUID) -> Role:
+    async def add_role_to_user(
+        self, *, user: User, role_id: UUID, redis_client: Redis
+    ) -> Role:
+        """
+        Gives the role to the user, then revokes the role claims of the tokens
+        of the user (see app.utils.token).
+        """
         db_session = super().get_db().session
-        role = await super().get(id=role_id)
+        role = await super().get(id=role_id, options=[selectinload(Role.users)])
         role.users.append(user)
         db_session.add(role)
         await db_session.commit()
-        await db_session.refresh(role)
-        return role
+        await revoke_role_claims(redis_client, user.id)
+        return await self.reload(db_obj=role, db_session=db_session)
+
+    async def invalidate_cache(self) -> None:
+        self._table = None
+        await super().invalidate_cache()
 
 
 role = CRUDRole(Role)
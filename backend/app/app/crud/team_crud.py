@@ -1,11 +1,15 @@
 from app.schemas.team_schema import ITeamCreate, ITeamUpdate
 from app.crud.base_crud import CRUDBase
 from app.models.team_model import Team
+from sqlalchemy.orm import joinedload
 from sqlmodel import select
 from sqlmodel.ext.asyncio.session import AsyncSession
 
 
 class CRUDTeam(CRUDBase[Team, ITeamCreate, ITeamUpdate]):
+    # ITeamRead
+    default_options = (joinedload(Team.created_by),)
+
     async def get_team_by_name(
         self, *, name: str, db_session: AsyncSession | None = None
     ) -> Team:
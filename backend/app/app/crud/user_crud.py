@@ -1,28 +1,186 @@
-from app.schemas.media_schema import IMediaCreate
-from app.schemas.user_schema import IUserCreate, IUserUpdate
+from app.schemas.image_media_schema import IImageMediaRead
+from app.schemas.media_schema import IMediaCreate, IMediaRead
+from app.schemas.role_schema import IRoleRead
+from app.schemas.user_schema import IUserCreate, IUserReadWithoutGroups, IUserUpdate
 from app.models.user_model import User
 from app.models.media_model import Media
 from app.models.image_media_model import ImageMedia
-from app.core.security import verify_password, get_password_hash
+from app.models.role_model import Role
+from app.models.user_follow_model import UserFollow
+from app.core.security import (
+    get_password_hash,
+    password_needs_rehash,
+    verify_password,
+)
 from pydantic.networks import EmailStr
+from redis.asyncio import Redis
 from typing import Any
 from app.crud.base_crud import CRUDBase
-from app.crud.user_follow_crud import user_follow as UserFollowCRUD
-from sqlmodel import select
+from collections.abc import Sequence
+from sqlalchemy.orm import joinedload, selectinload
+from sqlalchemy.orm.interfaces import ORMOption
+from sqlmodel import and_, delete, func, literal_column, or_, select, update
+from sqlmodel.sql.expression import Select
+from sqlalchemy import ColumnElement
+from app.utils.cursor import decode_cursor, encode_cursor
+from app.utils.exceptions import InvalidCursorException
+from app.utils.storage_client_factory import get_storage_client
+from app.utils.token import revoke_role_claims
 from uuid import UUID
 from sqlmodel.ext.asyncio.session import AsyncSession
 
 
 class CRUDUser(CRUDBase[User, IUserCreate, IUserUpdate]):
+    # IUserReadWithoutGroups
+    read_options = (
+        joinedload(User.role),
+        joinedload(User.image).joinedload(ImageMedia.media),
+    )
+    # IUserRead
+    default_options = (*read_options, selectinload(User.groups))
+    # IUserRead, for a role set from the cached Role table
+    without_role_options = (*read_options[1:], selectinload(User.groups))
+    # Same expression as the ix_User_full_name_trgm index
+    full_name = (User.first_name + literal_column("' '") + User.last_name).self_group()
+
+    def full_name_matches(self, name: str) -> ColumnElement[bool]:
+        """
+        Whether the full name contains `name`, its % and _ matched literally,
+        or is similar to it (pg_trgm `%`). Both are answered by the trigram
+        index.
+        """
+        pattern = "%{}%".format(
+            name.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+        )
+        return or_(
+            self.full_name.ilike(pattern, escape="\\"),
+            self.full_name.bool_op("%")(name),
+        )
+
+    async def search(
+        self,
+        *,
+        name: str,
+        role_name: str | None = None,
+        is_active: bool | None = True,
+        size: int = 50,
+        cursor: str | None = None,
+        db_session: AsyncSession | None = None,
+    ) -> tuple[list[User], str | None]:
+        """
+        Users whose full name contains `name` or is similar to it (pg_trgm
+        `%`), best match first. Both conditions are answered by the trigram
+        index. Results are keyset paginated on (similarity, id): the returned
+        cursor is passed back to get the next page, or is None on the last one.
+        """
+        db_session = db_session or super().get_db().session
+        similarity = func.similarity(self.full_name, name)
+        query = (
+            select(User, similarity.label("similarity"))
+            .where(self.full_name_matches(name))
+            .order_by(similarity.desc(), User.id)
+            .limit(size + 1)
+            .options(*self.read_options)
+        )
+        if role_name:
+            query = query.join(Role, User.role_id == Role.id).where(
+                Role.name == role_name
+            )
+        if is_active is not None:
+            query = query.where(User.is_active == is_active)
+        if cursor:
+            last_similarity, last_id = decode_cursor(cursor, 2)
+            try:
+                last_id = UUID(last_id)
+                last_similarity = float(last_similarity)
+            except (TypeError, ValueError):
+                raise InvalidCursorException()
+            query = query.where(
+                or_(
+                    similarity < last_similarity,
+                    and_(similarity == last_similarity, User.id > last_id),
+                )
+            )
+
+        rows = (await db_session.execute(query)).all()
+        next_cursor = None
+        if len(rows) > size:
+            rows = rows[:size]
+            next_cursor = encode_cursor(rows[-1].similarity, rows[-1].User.id)
+        return [row.User for row in rows], next_cursor
+
+    def get_read_projection(self) -> Select:
+        """
+        Columns of IUserReadWithoutGroups, with the role and image joined in,
+        for `get_multi_paginated_projected`. Rows still need `add_image_link`.
+        """
+        return (
+            select(
+                *self.get_columns(IUserReadWithoutGroups),
+                *self.get_columns(IRoleRead, model=Role, prefix="role__"),
+                *self.get_columns(IImageMediaRead, model=ImageMedia, prefix="image__"),
+                *self.get_columns(IMediaRead, model=Media, prefix="image__media__"),
+            )
+            .outerjoin(Role, User.role_id == Role.id)
+            .outerjoin(ImageMedia, User.image_id == ImageMedia.id)
+            .outerjoin(Media, ImageMedia.media_id == Media.id)
+        )
+
+    def add_image_link(self, item: dict[str, Any]) -> dict[str, Any]:
+        # Same value as the computed Media.link
+        media = item["image"] and item["image"]["media"]
+        if media:
+            path = media["path"]
+            media["link"] = get_storage_client().get_url(path) if path else ""
+        return item
+
+    async def update(
+        self,
+        *,
+        obj_current: User,
+        obj_new: IUserUpdate | dict[str, Any] | User,
+        options: Sequence[ORMOption] | None = None,
+        db_session: AsyncSession | None = None,
+        redis_client: Redis | None = None,
+    ) -> User:
+        """
+        Changing `role_id` needs `redis_client`: once the change is committed,
+        the role claims of the tokens of the user are revoked (see
+        app.utils.token).
+        """
+        role_id = obj_current.role_id
+        fields = (
+            obj_new if isinstance(obj_new, dict) else obj_new.dict(exclude_unset=True)
+        )
+        if fields.get("role_id", role_id) != role_id and redis_client is None:
+            raise ValueError("Changing the role of a user needs redis_client")
+        user = await super().update(
+            obj_current=obj_current,
+            obj_new=obj_new,
+            options=options,
+            db_session=db_session,
+        )
+        if user.role_id != role_id:
+            await revoke_role_claims(redis_client, user.id)
+        return user
+
     async def get_by_email(
-        self, *, email: str, db_session: AsyncSession | None = None
+        self,
+        *,
+        email: str,
+        options: Sequence[ORMOption] | None = None,
+        db_session: AsyncSession | None = None,
     ) -> User | None:
         db_session = db_session or super().get_db().session
-        users = await db_session.execute(select(User).where(User.email == email))
-        return users.scalar_one_or_none()
+        users = await db_session.execute(
+            select(User).where(User.email == email).options(*self.get_options(options))
+        )
+        return users.unique().scalar_one_or_none()
 
-    async def get_by_id_active(self, *, id: UUID) -> User | None:
-        user = await super().get(id=id)
+    async def get_by_id_active(
+        self, *, id: UUID, options: Sequence[ORMOption] | None = None
+    ) -> User | None:
+        user = await super().get(id=id, options=options)
         if not user:
             return None
         if user.is_active is False:
@@ -35,11 +193,10 @@ class CRUDUser(CRUDBase[User, IUserCreate, IUserUpdate]):
     ) -> User:
         db_session = db_session or super().get_db().session
         db_obj = User.model_validate(obj_in)
-        db_obj.hashed_password = get_password_hash(obj_in.password)
+        db_obj.hashed_password = await get_password_hash(obj_in.password)
         db_session.add(db_obj)
         await db_session.commit()
-        await db_session.refresh(db_obj)
-        return db_obj
+        return await self.reload(db_obj=db_obj, db_session=db_session)
 
     async def update_is_active(
         self, *, db_obj: list[User], obj_in: int | str | dict[str, Any]
@@ -54,13 +211,39 @@ class CRUDUser(CRUDBase[User, IUserCreate, IUserUpdate]):
             response.append(x)
         return response
 
-    async def authenticate(self, *, email: EmailStr, password: str) -> User | None:
-        user = await self.get_by_email(email=email)
-        if not user:
-            return None
-        if not verify_password(password, user.hashed_password):
+    async def authenticate(
+        self,
+        *,
+        email: EmailStr,
+        password: str,
+        options: Sequence[ORMOption] | None = None,
+        db_session: AsyncSession | None = None,
+    ) -> User | None:
+        """
+        Checks the password against the user's credentials only, and loads the
+        user once it matches. A hash made with another cost than
+        `BCRYPT_ROUNDS` is replaced by a new one.
+        """
+        db_session = db_session or super().get_db().session
+        response = await db_session.execute(
+            select(User.id, User.hashed_password, User.is_active).where(
+                User.email == email
+            )
+        )
+        credentials = response.one_or_none()
+        if credentials is None or not await verify_password(
+            password, credentials.hashed_password
+        ):
             return None
-        return user
+        if credentials.is_active and password_needs_rehash(credentials.hashed_password):
+            await db_session.execute(
+                update(User)
+                .where(User.id == credentials.id)
+                .values(hashed_password=await get_password_hash(password))
+                .execution_options(synchronize_session=False)
+            )
+            await db_session.commit()
+        return await self.get(id=credentials.id, options=options, db_session=db_session)
 
     async def update_photo(
         self,
@@ -80,35 +263,49 @@ class CRUDUser(CRUDBase[User, IUserCreate, IUserUpdate]):
         )
         db_session.add(user)
         await db_session.commit()
-        await db_session.refresh(user)
-        return user
+        return await self.reload(db_obj=user, db_session=db_session)
 
     async def remove(
         self, *, id: UUID | str, db_session: AsyncSession | None = None
     ) -> User:
         db_session = db_session or super().get_db().session
         response = await db_session.execute(
-            select(self.model).where(self.model.id == id)
+            select(self.model).where(self.model.id == id).options(*self.default_options)
+        )
+        obj = response.unique().scalar_one()
+
+        # Each follow of or by the removed user counts once on the other side
+        await db_session.execute(
+            update(User)
+            .where(
+                User.id.in_(
+                    select(UserFollow.target_user_id).where(
+                        UserFollow.user_id == obj.id
+                    )
+                )
+            )
+            .values(follower_count=User.follower_count - 1)
+            .execution_options(synchronize_session=False)
+        )
+        await db_session.execute(
+            update(User)
+            .where(
+                User.id.in_(
+                    select(UserFollow.user_id).where(
+                        UserFollow.target_user_id == obj.id
+                    )
+                )
+            )
+            .values(following_count=User.following_count - 1)
+            .execution_options(synchronize_session=False)
         )
-        obj = response.scalar_one()
-
-        followings = await UserFollowCRUD.get_follow_by_user_id(user_id=obj.id)
-        if followings:
-            for following in followings:
-                user = await self.get(id=following.target_user_id)
-                user.follower_count -= 1
-                db_session.add(user)
-                await db_session.delete(following)
-
-        followeds = await UserFollowCRUD.get_follow_by_target_user_id(
-            target_user_id=obj.id
+        await db_session.execute(
+            delete(UserFollow)
+            .where(
+                or_(UserFollow.user_id == obj.id, UserFollow.target_user_id == obj.id)
+            )
+            .execution_options(synchronize_session=False)
         )
-        if followeds:
-            for followed in followeds:
-                user = await self.get(id=followed.user_id)
-                user.following_count -= 1
-                db_session.add(user)
-                await db_session.delete(followed)
 
         await db_session.delete(obj)
         await db_session.commit()
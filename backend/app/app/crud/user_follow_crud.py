@@ -1,5 +1,6 @@
 from uuid import UUID
-from sqlmodel import and_, select
+from sqlalchemy.dialects.postgresql import insert
+from sqlmodel import and_, case, delete, exists, func, or_, select, update
 from sqlmodel.ext.asyncio.session import AsyncSession
 from app.crud.base_crud import CRUDBase
 from app.models.user_follow_model import UserFollow as UserFollowModel
@@ -8,64 +9,245 @@ from app.schemas.user_follow_schema import IUserFollowCreate, IUserFollowUpdate
 
 
 class CRUDUserFollow(CRUDBase[UserFollowModel, IUserFollowCreate, IUserFollowUpdate]):
+    async def lock_pair(
+        self, *, user_id: UUID, target_user_id: UUID, db_session: AsyncSession
+    ) -> None:
+        """
+        Takes a transaction advisory lock on the pair of users, whichever the
+        direction. A follow or unfollow writes the rows of both directions, so
+        without it two users (un)following each other at once deadlock, or
+        both miss that the follow is mutual.
+        """
+        first, second = sorted((user_id, target_user_id))
+        await db_session.execute(
+            select(
+                func.pg_advisory_xact_lock(
+                    func.hashtextextended(f"user_follow:{first}:{second}", 0)
+                )
+            )
+        )
+
     async def follow_a_user_by_target_user_id(
         self,
         *,
         user: User,
         target_user: User,
         db_session: AsyncSession | None = None,
-    ) -> UserFollowModel:
+    ) -> UserFollowModel | None:
+        """
+        Inserts the follow with INSERT ... ON CONFLICT DO NOTHING, under the
+        lock of the pair, so a concurrent duplicate cannot slip in. Returns
+        None if `user` already follows `target_user`, without changing
+        anything.
+        """
         db_session = db_session or super().get_db().session
-        new_user_follow = IUserFollowCreate(
-            user_id=user.id, target_user_id=target_user.id
+        reverse = and_(
+            UserFollowModel.user_id == target_user.id,
+            UserFollowModel.target_user_id == user.id,
         )
-        db_obj = UserFollowModel.model_validate(new_user_follow)
-
-        reverse_follow = await self.get_follow_by_user_id_and_target_user_id(
-            user_id=target_user.id, target_user_id=user.id
+        await self.lock_pair(
+            user_id=user.id, target_user_id=target_user.id, db_session=db_session
         )
-        if reverse_follow:
-            db_obj.is_mutual = True
-            reverse_follow.is_mutual = True
-            db_session.add(reverse_follow)
-        db_session.add(db_obj)
-
-        user.following_count += 1
-        target_user.follower_count += 1
+        db_obj = UserFollowModel(user_id=user.id, target_user_id=target_user.id)
+        inserted = await db_session.execute(
+            insert(UserFollowModel)
+            .values(
+                **db_obj.model_dump(exclude={"is_mutual"}),
+                is_mutual=exists().where(reverse),
+            )
+            .on_conflict_do_nothing(index_elements=["user_id", "target_user_id"])
+            .returning(UserFollowModel.is_mutual)
+        )
+        row = inserted.first()
+        if row is None:
+            return None
 
-        db_session.add(user)
-        db_session.add(target_user)
+        db_obj.is_mutual = row.is_mutual
+        if db_obj.is_mutual:
+            await db_session.execute(
+                update(UserFollowModel)
+                .where(reverse)
+                .values(is_mutual=True)
+                .execution_options(synchronize_session=False)
+            )
+        await self.update_follow_counts(
+            user_id=user.id,
+            target_user_id=target_user.id,
+            delta=1,
+            db_session=db_session,
+        )
         await db_session.commit()
-        await db_session.refresh(db_obj)
         return db_obj
 
-    async def unfollow_a_user_by_id(
+    async def unfollow_a_user_by_target_user_id(
         self,
         *,
-        user_follow_id: UUID,
         user: User,
         target_user: User,
         db_session: AsyncSession | None = None,
-    ) -> UserFollowModel:
+    ) -> UserFollowModel | None:
+        """
+        Deletes the follow with DELETE ... RETURNING, under the lock of the
+        pair. Returns None if `user` does not follow `target_user`.
+        """
         db_session = db_session or super().get_db().session
+        await self.lock_pair(
+            user_id=user.id, target_user_id=target_user.id, db_session=db_session
+        )
+        response = await db_session.execute(
+            delete(UserFollowModel)
+            .where(
+                UserFollowModel.user_id == user.id,
+                UserFollowModel.target_user_id == target_user.id,
+            )
+            .returning(UserFollowModel)
+            .execution_options(synchronize_session=False)
+        )
+        follow_user_obj = response.scalar_one_or_none()
+        if follow_user_obj is None:
+            return None
 
-        follow_user_obj = await self.get(id=user_follow_id)
-        await db_session.delete(follow_user_obj)
+        await db_session.execute(
+            update(UserFollowModel)
+            .where(
+                UserFollowModel.user_id == target_user.id,
+                UserFollowModel.target_user_id == user.id,
+            )
+            .values(is_mutual=False)
+            .execution_options(synchronize_session=False)
+        )
+        await self.update_follow_counts(
+            user_id=user.id,
+            target_user_id=target_user.id,
+            delta=-1,
+            db_session=db_session,
+        )
+        await db_session.commit()
+        return follow_user_obj
+
+    async def is_following(
+        self,
+        *,
+        user_id: UUID,
+        target_user_id: UUID,
+        db_session: AsyncSession | None = None,
+    ) -> bool:
+        """
+        EXISTS check answered from the (user_id, target_user_id) index.
+        """
+        db_session = db_session or super().get_db().session
+        return await db_session.scalar(
+            select(
+                exists().where(
+                    UserFollowModel.user_id == user_id,
+                    UserFollowModel.target_user_id == target_user_id,
+                )
+            )
+        )
 
-        reverse_follow = await self.get_follow_by_user_id_and_target_user_id(
-            user_id=target_user.id, target_user_id=user.id
+    async def update_follow_counts(
+        self,
+        *,
+        user_id: UUID,
+        target_user_id: UUID,
+        delta: int,
+        db_session: AsyncSession | None = None,
+    ) -> None:
+        """
+        Adds `delta` to the following count of `user_id` and the follower count
+        of `target_user_id` in a single atomic UPDATE, so concurrent follows of
+        the same account cannot lose increments. It should be the last
+        statement before the commit to keep the row locks short. User objects
+        already loaded in the session keep their previous counts.
+        """
+        db_session = db_session or super().get_db().session
+        # Locked in id order: the UPDATE alone locks them in the order it
+        # finds them, which differs between transactions and deadlocks
+        locked = (
+            select(User.id)
+            .where(User.id.in_([user_id, target_user_id]))
+            .order_by(User.id)
+            .with_for_update()
+            .subquery()
+        )
+        await db_session.execute(
+            update(User)
+            .where(User.id == locked.c.id)
+            .values(
+                following_count=User.following_count
+                + case((User.id == user_id, delta), else_=0),
+                follower_count=User.follower_count
+                + case((User.id == target_user_id, delta), else_=0),
+            )
+            .execution_options(synchronize_session=False)
         )
-        if reverse_follow:
-            reverse_follow.is_mutual = False
-            db_session.add(reverse_follow)
 
-        user.following_count -= 1
-        target_user.follower_count -= 1
+    async def reconcile_follow_counts(
+        self,
+        *,
+        after: UUID | None = None,
+        batch_size: int = 1000,
+        max_batches: int | None = None,
+        db_session: AsyncSession | None = None,
+    ) -> tuple[int, UUID | None]:
+        """
+        Recomputes the follower and following counts of the users after
+        `after` in id order from UserFollow, `batch_size` users per
+        transaction and at most `max_batches` batches. Only rows whose counts
+        drifted are written.
 
-        db_session.add(user)
-        db_session.add(target_user)
-        await db_session.commit()
-        return follow_user_obj
+        Each batch locks its users in id order, like `update_follow_counts`,
+        before counting: a follow of one of them waits for the batch to commit
+        and then adds to the recounted value, instead of being overwritten by
+        a count that missed it.
+
+        Returns the number of users corrected and the id of the last user
+        processed, to pass back as `after` to resume, or None once every user
+        was processed.
+        """
+        db_session = db_session or super().get_db().session
+        follower_count = (
+            select(func.count())
+            .where(UserFollowModel.target_user_id == User.id)
+            .scalar_subquery()
+        )
+        following_count = (
+            select(func.count())
+            .where(UserFollowModel.user_id == User.id)
+            .scalar_subquery()
+        )
+        corrected = 0
+        batches = 0
+        while max_batches is None or batches < max_batches:
+            query = select(User.id).order_by(User.id).limit(batch_size)
+            if after is not None:
+                query = query.where(User.id > after)
+            # A statement of its own, so the counts below are read after the
+            # locks are held
+            ids = (await db_session.execute(query.with_for_update())).scalars().all()
+            if not ids:
+                await db_session.commit()
+                return corrected, None
+
+            response = await db_session.execute(
+                update(User)
+                .where(
+                    User.id.in_(ids),
+                    or_(
+                        User.follower_count.is_distinct_from(follower_count),
+                        User.following_count.is_distinct_from(following_count),
+                    ),
+                )
+                .values(follower_count=follower_count, following_count=following_count)
+                .execution_options(synchronize_session=False)
+            )
+            await db_session.commit()
+            corrected += response.rowcount
+            batches += 1
+            after = ids[-1]
+            if len(ids) < batch_size:
+                return corrected, None
+        return corrected, after
 
     async def get_follow_by_user_id(
         self, *, user_id: UUID, db_session: AsyncSession | None = None
@@ -137,7 +137,7 @@ async def init_db(db_session: AsyncSession) -> None:
         team = await crud.team.get_team_by_name(
             name=heroe["team"], db_session=db_session
         )
-        if not current_heroe:
+        if not current_heroe.total:
             current_user = await crud.user.get_by_email(
                 email=users[0]["data"].email, db_session=db_session
             )
@@ -3,7 +3,8 @@ from sqlalchemy.orm import sessionmaker
 from app.core.config import ModeEnum, settings
 from sqlalchemy.ext.asyncio import create_async_engine
 from sqlmodel.ext.asyncio.session import AsyncSession
-from sqlalchemy.pool import NullPool, AsyncAdaptedQueuePool
+from sqlalchemy.pool import NullPool
+from app.utils.metrics import MeteredQueuePool
 
 DB_POOL_SIZE = 83
 WEB_CONCURRENCY = 9
@@ -16,7 +17,7 @@ engine = create_async_engine(
     echo=False,
     poolclass=NullPool
     if settings.MODE == ModeEnum.testing
-    else AsyncAdaptedQueuePool,  # Asincio pytest works with NullPool
+    else MeteredQueuePool,  # Asincio pytest works with NullPool
     # pool_size=POOL_SIZE,
     # max_overflow=64,
 )
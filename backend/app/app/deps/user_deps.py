@@ -10,7 +10,7 @@ from typing_extensions import Annotated
 
 
 async def user_exists(new_user: IUserCreate) -> IUserCreate:
-    user = await crud.user.get_by_email(email=new_user.email)
+    user = await crud.user.get_by_email(email=new_user.email, options=())
     if user:
         raise HTTPException(
             status_code=status.HTTP_409_CONFLICT,
@@ -36,7 +36,7 @@ async def is_valid_user(
 async def is_valid_user_id(
     user_id: Annotated[UUID, Path(title="The UUID id of the user")]
 ) -> IUserRead:
-    user = await crud.user.get(id=user_id)
+    user = await crud.user.get(id=user_id, options=())
     if not user:
         raise IdNotFoundException(User, id=user_id)
 
@@ -1,46 +1,59 @@
 import gc
 import logging
 from contextlib import asynccontextmanager
+from importlib import metadata
 from typing import Any
 from uuid import UUID, uuid4
 
 from fastapi import (
     FastAPI,
-    HTTPException,
     Request,
+    Response,
     WebSocket,
     WebSocketDisconnect,
     status,
 )
 from fastapi_async_sqlalchemy import SQLAlchemyMiddleware, db
-from fastapi_cache import FastAPICache
-from fastapi_cache.backends.redis import RedisBackend
-from fastapi_limiter import FastAPILimiter
-from fastapi_limiter.depends import WebSocketRateLimiter
-from jwt import DecodeError, ExpiredSignatureError, MissingRequiredClaimError
-from sqlalchemy.pool import NullPool, AsyncAdaptedQueuePool
+from redis import asyncio as aioredis
+from sqlalchemy.pool import NullPool
 from starlette.middleware.cors import CORSMiddleware
 
 from app import crud
 from app.api.deps import get_redis_client
 from app.api.v1.api import api_router as api_router_v1
 from app.core.config import ModeEnum, settings
-from app.core.security import decode_token
 from app.schemas.chat_schema import ChatRoleEnum
-from app.schemas.common_schema import IChatResponse, IUserMessage
+from app.schemas.common_schema import IChatResponse, IUserMessage, TokenType
+from app.utils.auth_context import get_auth_context
+from app.utils.cache import response_cache
 from app.utils.fastapi_globals import GlobalsMiddleware, g
+from app.utils.json_response import ORJSONResponse, send_json
+from app.utils.lazy_model import LazyModel
 from app.utils.llm_client import ChatClient
+from app.utils.metrics import (
+    CONTENT_TYPE,
+    MeteredConnection,
+    MeteredQueuePool,
+    MetricsMiddleware,
+    instrument_sqlalchemy,
+    metered_model,
+    registry,
+)
+from app.utils.query_log import QueryLogMiddleware, enable_query_log
+from app.utils.rate_limiter import WebSocketRateLimiter, rate_limiter
+from app.utils.snowflake import snowflake
+from app.utils.token import check_token
 from app.utils.uuid6 import uuid7
 
 # ci: trigger backend checks
 
 
 def _torch_version_ok() -> bool:
+    # From the installed package's metadata: importing torch takes seconds
     try:
-        import torch
-    except Exception:
+        version_str = metadata.version("torch").split("+")[0]
+    except metadata.PackageNotFoundError:
         return False
-    version_str = torch.__version__.split("+")[0]
     try:
         parts = [int(p) for p in version_str.split(".")]
     except ValueError:
@@ -60,49 +73,25 @@ def _load_sentiment_model() -> Any | None:
         logging.warning("Transformers pipeline unavailable: %s", exc)
         return None
     try:
-        return pipeline(
+        model = pipeline(
             "sentiment-analysis",
             model="distilbert-base-uncased-finetuned-sst-2-english",
         )
     except Exception as exc:
         logging.warning("Failed to load sentiment model: %s", exc)
         return None
+    return metered_model(model, "sentiment")
 
 
 async def user_id_identifier(request: Request):
     if request.scope["type"] == "http":
-        # Retrieve the Authorization header from the request
-        auth_header = request.headers.get("Authorization")
-
-        if auth_header is not None:
-            # Check that the header is in the correct format
-            header_parts = auth_header.split()
-            if len(header_parts) == 2 and header_parts[0].lower() == "bearer":
-                token = header_parts[1]
-                try:
-                    payload = decode_token(token)
-                except ExpiredSignatureError:
-                    raise HTTPException(
-                        status_code=status.HTTP_403_FORBIDDEN,
-                        detail="Your token has expired. Please log in again.",
-                    )
-                except DecodeError:
-                    raise HTTPException(
-                        status_code=status.HTTP_403_FORBIDDEN,
-                        detail="Error when decoding the token. Please check your request.",
-                    )
-                except MissingRequiredClaimError:
-                    raise HTTPException(
-                        status_code=status.HTTP_403_FORBIDDEN,
-                        detail="There is no required field in your token. Please contact the administrator.",
-                    )
-
-                user_id = payload["sub"]
-
-                return user_id
+        claims = get_auth_context(request).verified_claims()
+        if claims is not None:
+            return claims["sub"]
 
     if request.scope["type"] == "websocket":
-        return request.scope["path"]
+        # Verified when the websocket was accepted
+        return get_auth_context(request).user_id or request.scope["path"]
 
     forwarded = request.headers.get("X-Forwarded-For")
     if forwarded:
@@ -117,18 +106,27 @@ async def user_id_identifier(request: Request):
 async def lifespan(app: FastAPI):
     # Startup
     redis_client = await get_redis_client()
-    FastAPICache.init(RedisBackend(redis_client), prefix="fastapi-cache")
-    await FastAPILimiter.init(redis_client, identifier=user_id_identifier)
+    # Cache entries are binary, so the cache has a client that keeps bytes
+    response_cache.init(
+        aioredis.from_url(
+            f"redis://{settings.REDIS_HOST}:{settings.REDIS_PORT}",
+            connection_class=MeteredConnection,
+        )
+    )
+    rate_limiter.init(redis_client, identifier=user_id_identifier)
+    snowflake.init(redis_client)
 
     # Load a pre-trained sentiment analysis model as a dictionary to an easy cleanup
-    models: dict[str, Any] = {"sentiment_model": _load_sentiment_model()}
+    # It loads on first use, so that startup does not wait for torch
+    models: dict[str, Any] = {"sentiment_model": LazyModel(_load_sentiment_model)}
     g.set_default("sentiment_model", models["sentiment_model"])
     g.set_default("chat_client", ChatClient())
     print("startup fastapi")
     yield
     # shutdown
-    await FastAPICache.clear()
-    await FastAPILimiter.close()
+    await response_cache.close()
+    await snowflake.close()
+    await rate_limiter.close()
     models.clear()
     g.cleanup()
     gc.collect()
@@ -140,6 +138,7 @@ app = FastAPI(
     version=settings.API_VERSION,
     openapi_url=f"{settings.API_V1_STR}/openapi.json",
     lifespan=lifespan,
+    default_response_class=ORJSONResponse,
 )
 
 
@@ -148,15 +147,16 @@ app.add_middleware(
     db_url=str(settings.ASYNC_DATABASE_URI),
     engine_args={
         "echo": False,
-        "poolclass": NullPool
-        if settings.MODE == ModeEnum.testing
-        else AsyncAdaptedQueuePool
+        "poolclass": NullPool if settings.MODE == ModeEnum.testing else MeteredQueuePool
         # "pool_pre_ping": True,
         # "pool_size": settings.POOL_SIZE,
         # "max_overflow": 64,
     },
 )
 app.add_middleware(GlobalsMiddleware)
+app.add_middleware(QueryLogMiddleware)
+instrument_sqlalchemy()
+enable_query_log()
 
 # Set all CORS origins enabled
 if settings.BACKEND_CORS_ORIGINS or settings.BACKEND_CORS_ORIGIN_REGEX:
@@ -171,6 +171,9 @@ if settings.BACKEND_CORS_ORIGINS or settings.BACKEND_CORS_ORIGIN_REGEX:
         allow_headers=["*"],
     )
 
+# Outermost, so request latency includes the other middlewares
+app.add_middleware(MetricsMiddleware)
+
 
 class CustomException(Exception):
     http_code: int
@@ -202,18 +205,34 @@ async def health_check():
     return {"status": "ok"}
 
 
+@app.get("/metrics", include_in_schema=False)
+async def metrics():
+    return Response(registry.render(), media_type=CONTENT_TYPE)
+
+
 @app.websocket("/chat/{user_id}")
 async def websocket_endpoint(websocket: WebSocket, user_id: UUID):
     session_id = str(uuid4())
     key: str = f"user_id:{user_id}:session:{session_id}"
-    await websocket.accept()
     redis_client = await get_redis_client()
+    # The access token of the user, verified once for the connection: the
+    # rate limiter and the logs below read its claims from the same context
+    context = get_auth_context(websocket)
+    if context.claims is None or context.user_id != str(user_id):
+        await websocket.close(code=status.WS_1008_POLICY_VIOLATION)
+        return
+    is_valid, _ = await check_token(
+        redis_client, context.token, context.claims, TokenType.ACCESS
+    )
+    if not is_valid:
+        await websocket.close(code=status.WS_1008_POLICY_VIOLATION)
+        return
+    await websocket.accept()
     ws_ratelimit = WebSocketRateLimiter(times=200, hours=24)
-    chat_client = g.chat_client
     current_session_id: UUID | None = None
 
     async with db():
-        user = await crud.user.get_by_id_active(id=user_id)
+        user = await crud.user.get_by_id_active(id=user_id, options=())
         if user is not None:
             await redis_client.set(key, str(websocket))
 
@@ -235,14 +254,15 @@ async def websocket_endpoint(websocket: WebSocket, user_id: UUID):
                     if requested_session_id is not None:
                         session = await crud.chat_session.get(id=requested_session_id)
                         if session is None or session.user_id != user_id:
-                            await websocket.send_json(
+                            await send_json(
+                                websocket,
                                 IChatResponse(
                                     sender="bot",
                                     message="Invalid or unauthorized chat session.",
                                     type="error",
                                     message_id="",
                                     id="",
-                                ).dict()
+                                ),
                             )
                             continue
                         current_session_id = requested_session_id
@@ -269,7 +289,7 @@ async def websocket_endpoint(websocket: WebSocket, user_id: UUID):
                     id=str(uuid7()),
                     session_id=current_session_id,
                 )
-                await websocket.send_json(resp.dict())
+                await send_json(websocket, resp)
 
                 # # Construct a response
                 start_resp = IChatResponse(
@@ -280,9 +300,9 @@ async def websocket_endpoint(websocket: WebSocket, user_id: UUID):
                     id="",
                     session_id=current_session_id,
                 )
-                await websocket.send_json(start_resp.dict())
+                await send_json(websocket, start_resp)
 
-                result_text = chat_client.generate(resp.message)
+                result_text = await g.chat_client.generate(resp.message)
                 async with db():
                     await crud.chat_message.create_for_session(
                         session_id=current_session_id,
@@ -299,12 +319,12 @@ async def websocket_endpoint(websocket: WebSocket, user_id: UUID):
                     id=str(uuid7()),
                     session_id=current_session_id,
                 )
-                await websocket.send_json(end_resp.dict())
+                await send_json(websocket, end_resp)
             except WebSocketDisconnect:
                 logging.info("websocket disconnect")
                 break
             except Exception as e:
-                logging.error(e)
+                logging.error("Chat message of user %s failed: %s", context.user_id, e)
                 resp = IChatResponse(
                     message_id="",
                     id="",
@@ -312,7 +332,7 @@ async def websocket_endpoint(websocket: WebSocket, user_id: UUID):
                     message="Sorry, something went wrong. Your user limit of api usages has been reached or check your API key.",
                     type="error",
                 )
-                await websocket.send_json(resp.dict())
+                await send_json(websocket, resp)
 
         # Remove the live connection from Redis
         await redis_client.delete(key)
@@ -1,6 +1,7 @@
 from .user_model import User
 from .role_model import Role
 from .hero_model import Hero
+from .hero_stat_model import HeroStat
 from .team_model import Team
 from .group_model import Group
 from .media_model import Media
@@ -1,7 +1,10 @@
 from uuid import UUID
 
+from sqlalchemy import Computed
+from sqlalchemy.dialects.postgresql import TSVECTOR
+from sqlalchemy.orm import deferred
 from sqlalchemy_utils import ChoiceType
-from sqlmodel import Column, Field, Relationship, SQLModel, String
+from sqlmodel import Column, Field, Index, Relationship, SQLModel, String
 
 from app.models.base_uuid_model import BaseUUIDModel
 from app.schemas.chat_schema import ChatRoleEnum
@@ -20,5 +23,20 @@ class ChatMessageBase(SQLModel):
 class ChatMessage(BaseUUIDModel, ChatMessageBase, table=True):
     session: "ChatSession" = Relationship(  # noqa: F821
         back_populates="messages",
-        sa_relationship_kwargs={"lazy": "joined"},
+        sa_relationship_kwargs={"lazy": "raise"},
     )
+
+
+# Full-text search document of `content`, generated by Postgres. Deferred so
+# that loading messages does not fetch it, and not part of the pydantic model.
+ChatMessage.search_vector = deferred(
+    Column(
+        TSVECTOR,
+        Computed("to_tsvector('english', content)", persisted=True),
+    )
+)
+Index(
+    "ix_ChatMessage_search_vector",
+    ChatMessage.search_vector,
+    postgresql_using="gin",
+)
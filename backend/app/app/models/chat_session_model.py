@@ -13,5 +13,5 @@ class ChatSessionBase(SQLModel):
 class ChatSession(BaseUUIDModel, ChatSessionBase, table=True):
     messages: list["ChatMessage"] = Relationship(  # noqa: F821
         back_populates="session",
-        sa_relationship_kwargs={"lazy": "selectin"},
+        sa_relationship_kwargs={"lazy": "raise"},
     )
@@ -14,12 +14,12 @@ class Group(BaseUUIDModel, GroupBase, table=True):
     created_by_id: UUID | None = Field(default=None, foreign_key="User.id")
     created_by: "User" = Relationship(
         sa_relationship_kwargs={
-            "lazy": "joined",
+            "lazy": "raise",
             "primaryjoin": "Group.created_by_id==User.id",
         }
     )
     users: list["User"] = Relationship(
         back_populates="groups",
         link_model=LinkGroupUser,
-        sa_relationship_kwargs={"lazy": "selectin"},
+        sa_relationship_kwargs={"lazy": "raise"},
     )
@@ -1,4 +1,4 @@
-from sqlmodel import Field, Relationship, SQLModel
+from sqlmodel import Field, Index, Relationship, SQLModel, text
 from app.models.base_uuid_model import BaseUUIDModel
 from uuid import UUID
 
@@ -11,13 +11,33 @@ class HeroBase(SQLModel):
 
 
 class Hero(BaseUUIDModel, HeroBase, table=True):
+    __table_args__ = (
+        # Prefix autocomplete, see CRUDBase.autocomplete. The explicit operator
+        # class makes alembic skip comparing the expression, whose collation it
+        # cannot reflect.
+        Index(
+            "ix_Hero_name_prefix",
+            text('lower(name) COLLATE "C" text_ops'),
+            "id",
+            postgresql_include=["name"],
+        ),
+        # Substring and similarity lookups (pg_trgm)
+        Index(
+            "ix_Hero_name_trgm",
+            "name",
+            postgresql_using="gin",
+            postgresql_ops={"name": "gin_trgm_ops"},
+        ),
+        # Heroes a user may update (ownership rule in app/core/authz.polar)
+        Index("ix_Hero_created_by_id_id", "created_by_id", "id"),
+    )
     team: "Team" = Relationship(  # noqa: F821
-        back_populates="heroes", sa_relationship_kwargs={"lazy": "joined"}
+        back_populates="heroes", sa_relationship_kwargs={"lazy": "raise"}
     )
     created_by_id: UUID | None = Field(default=None, foreign_key="User.id")
     created_by: "User" = Relationship(  # noqa: F821
         sa_relationship_kwargs={
-            "lazy": "joined",
+            "lazy": "raise",
             "primaryjoin": "Hero.created_by_id==User.id",
         }
     )
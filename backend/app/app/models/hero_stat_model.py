@@ -0,0 +1,25 @@
+from datetime import datetime
+from uuid import UUID
+from sqlmodel import Field, Index
+from app.models.base_uuid_model import SQLModel
+
+
+class HeroStat(SQLModel, table=True):
+    """
+    Heroes created per hour and team (`team_id` null for heroes without a
+    team), kept up to date by crud.hero on every write.
+    """
+
+    __table_args__ = (
+        Index(
+            "ix_HeroStat_hour_team_id",
+            "hour",
+            "team_id",
+            unique=True,
+            postgresql_nulls_not_distinct=True,
+        ),
+    )
+    id: int | None = Field(default=None, primary_key=True)
+    hour: datetime = Field(nullable=False)
+    team_id: UUID | None = None
+    count: int = Field(default=0, nullable=False)
@@ -14,7 +14,7 @@ class ImageMedia(BaseUUIDModel, ImageMediaBase, table=True):
     media_id: UUID | None = Field(default=None, foreign_key="Media.id")
     media: Media = Relationship(
         sa_relationship_kwargs={
-            "lazy": "joined",
+            "lazy": "raise",
             "primaryjoin": "ImageMedia.media_id==Media.id",
         }
     )
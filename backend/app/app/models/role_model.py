@@ -9,5 +9,5 @@ class RoleBase(SQLModel):
 
 class Role(BaseUUIDModel, RoleBase, table=True):
     users: list["User"] = Relationship(  # noqa: F821
-        back_populates="role", sa_relationship_kwargs={"lazy": "selectin"}
+        back_populates="role", sa_relationship_kwargs={"lazy": "raise"}
     )
@@ -1,5 +1,5 @@
 from app.models.user_model import User
-from sqlmodel import Field, Relationship, SQLModel
+from sqlmodel import Field, Index, Relationship, SQLModel, text
 from app.models.base_uuid_model import BaseUUIDModel
 from uuid import UUID
 
@@ -10,13 +10,24 @@ class TeamBase(SQLModel):
 
 
 class Team(BaseUUIDModel, TeamBase, table=True):
+    # Prefix autocomplete, see CRUDBase.autocomplete. The explicit operator
+    # class makes alembic skip comparing the expression, whose collation it
+    # cannot reflect.
+    __table_args__ = (
+        Index(
+            "ix_Team_name_prefix",
+            text('lower(name) COLLATE "C" text_ops'),
+            "id",
+            postgresql_include=["name"],
+        ),
+    )
     heroes: list["Hero"] = Relationship(  # noqa: F821
-        back_populates="team", sa_relationship_kwargs={"lazy": "selectin"}
+        back_populates="team", sa_relationship_kwargs={"lazy": "raise"}
     )
     created_by_id: UUID | None = Field(default=None, foreign_key="User.id")
     created_by: User | None = Relationship(  # noqa: F821
         sa_relationship_kwargs={
-            "lazy": "joined",
+            "lazy": "raise",
             "primaryjoin": "Team.created_by_id==User.id",
         }
     )
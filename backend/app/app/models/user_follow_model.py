@@ -1,7 +1,7 @@
 from uuid import UUID
 
 from app.models.base_uuid_model import BaseUUIDModel, SQLModel
-from sqlmodel import Column, Field, Boolean
+from sqlmodel import Column, Field, Boolean, Index
 
 
 class UserFollowBase(SQLModel):
@@ -10,6 +10,23 @@ class UserFollowBase(SQLModel):
 
 
 class UserFollow(BaseUUIDModel, UserFollowBase, table=True):
+    # One row per pair, looked up from either side. is_mutual is included so
+    # the follower/following lists are served from the index alone.
+    __table_args__ = (
+        Index(
+            "ix_UserFollow_user_id_target_user_id",
+            "user_id",
+            "target_user_id",
+            unique=True,
+            postgresql_include=["is_mutual"],
+        ),
+        Index(
+            "ix_UserFollow_target_user_id_user_id",
+            "target_user_id",
+            "user_id",
+            postgresql_include=["is_mutual"],
+        ),
+    )
     is_mutual: bool | None = Field(
         default=None, sa_column=Column(Boolean(), server_default="0")
     )
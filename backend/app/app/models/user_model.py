@@ -3,7 +3,17 @@ from app.models.links_model import LinkGroupUser
 from app.models.image_media_model import ImageMedia
 from app.schemas.common_schema import IGenderEnum
 from datetime import datetime
-from sqlmodel import BigInteger, Field, SQLModel, Relationship, Column, DateTime, String
+from sqlmodel import (
+    BigInteger,
+    Field,
+    SQLModel,
+    Relationship,
+    Column,
+    DateTime,
+    Index,
+    String,
+    text,
+)
 from typing import Optional
 from sqlalchemy_utils import ChoiceType
 from pydantic import EmailStr
@@ -31,19 +41,28 @@ class UserBase(SQLModel):
 
 
 class User(BaseUUIDModel, UserBase, table=True):
+    # Trigram index for the name search (pg_trgm). The expression must stay
+    # the same as crud.user.full_name for the planner to use it.
+    __table_args__ = (
+        Index(
+            "ix_User_full_name_trgm",
+            text("(first_name || ' ' || last_name) gin_trgm_ops"),
+            postgresql_using="gin",
+        ),
+    )
     hashed_password: str | None = Field(default=None, nullable=False, index=True)
     role: Optional["Role"] = Relationship(  # noqa: F821
-        back_populates="users", sa_relationship_kwargs={"lazy": "joined"}
+        back_populates="users", sa_relationship_kwargs={"lazy": "raise"}
     )
     groups: list["Group"] = Relationship(  # noqa: F821
         back_populates="users",
         link_model=LinkGroupUser,
-        sa_relationship_kwargs={"lazy": "selectin"},
+        sa_relationship_kwargs={"lazy": "raise"},
     )
     image_id: UUID | None = Field(default=None, foreign_key="ImageMedia.id")
     image: ImageMedia = Relationship(
         sa_relationship_kwargs={
-            "lazy": "joined",
+            "lazy": "raise",
             "primaryjoin": "User.image_id==ImageMedia.id",
         }
     )
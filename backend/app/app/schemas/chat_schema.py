@@ -39,3 +39,13 @@ class IChatMessageRead(BaseModel):
     role: ChatRoleEnum
     content: str
     created_at: datetime | None = None
+
+
+class IChatMessageSearchRead(BaseModel):
+    id: UUID
+    session_id: UUID
+    session_title: str | None = None
+    role: ChatRoleEnum
+    created_at: datetime | None = None
+    snippet: str
+    rank: float
@@ -15,6 +15,11 @@ class IMetaGeneral(BaseModel):
     roles: list[IRoleRead]
 
 
+class INameSuggestion(BaseModel):
+    id: UUID
+    name: str
+
+
 class IOrderEnum(str, Enum):
     ascendent = "ascendent"
     descendent = "descendent"
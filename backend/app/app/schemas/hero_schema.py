@@ -1,8 +1,9 @@
 from app.models.hero_model import HeroBase
 from app.models.team_model import TeamBase
 from app.utils.partial import optional
+from datetime import date
 from uuid import UUID
-from pydantic import field_validator
+from pydantic import BaseModel, field_validator
 
 
 class IHeroCreate(HeroBase):
@@ -25,3 +26,9 @@ class IHeroRead(HeroBase):
 
 class IHeroReadWithTeam(IHeroRead):
     team: TeamBase | None
+
+
+class IHeroDailyStat(BaseModel):
+    day: date
+    team_id: UUID | None
+    count: int
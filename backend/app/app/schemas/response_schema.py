@@ -5,6 +5,7 @@ from fastapi_pagination import Params, Page
 from fastapi_pagination.bases import AbstractPage, AbstractParams
 from pydantic import Field
 from pydantic import BaseModel
+from app.utils.json_response import ORJSONResponse
 
 DataType = TypeVar("DataType")
 T = TypeVar("T")
@@ -19,6 +20,14 @@ class PageBase(Page[T], Generic[T]):
     )
 
 
+class CursorPageBase(BaseModel, Generic[T]):
+    items: Sequence[T]
+    size: int
+    next_cursor: str | None = Field(
+        default=None, description="Cursor to pass to get the next page"
+    )
+
+
 class IResponseBase(BaseModel, Generic[T]):
     message: str = ""
     meta: dict | Any | None = {}
@@ -92,3 +101,20 @@ def create_response(
     if message is None:
         return {"data": data, "meta": meta}
     return {"data": data, "message": message, "meta": meta}
+
+
+def create_projected_response(
+    data: dict[str, Any] | list[Any],
+    message: str | None = None,
+    meta: dict | Any | None = {},
+) -> ORJSONResponse:
+    """
+    Serializes a page built by `CRUDBase.get_multi_paginated_projected` straight
+    to JSON bytes. The endpoint response model is not applied to it, so the
+    projected rows must already have the shape the endpoint declares, and the
+    default message is that of `create_response`.
+    """
+    if message is None:
+        is_page = isinstance(data, dict) and "total" in data
+        message = "Data paginated correctly" if is_page else "Data got correctly"
+    return ORJSONResponse({"message": message, "meta": meta, "data": data})
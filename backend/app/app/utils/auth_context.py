@@ -0,0 +1,79 @@
+"""
+Bearer token of a request or websocket, parsed and verified once.
+
+`get_auth_context` reads the Authorization header and verifies the JWT the
+first time it is called for a connection, and keeps the result in the ASGI
+scope. The rate limiter identifier, `get_current_user` and any later consumer
+of the same connection reuse it instead of decoding the token again.
+
+Browsers cannot set headers on a websocket, so a websocket may pass its
+token as the `token` query parameter instead.
+"""
+
+from dataclasses import dataclass
+from typing import Any
+from fastapi import HTTPException, status
+from fastapi.security.utils import get_authorization_scheme_param
+from jwt import (
+    DecodeError,
+    ExpiredSignatureError,
+    InvalidTokenError,
+    MissingRequiredClaimError,
+)
+from starlette.requests import HTTPConnection
+from app.core.security import decode_token
+
+SCOPE_KEY = "auth_context"
+
+
+@dataclass(frozen=True, slots=True)
+class AuthContext:
+    token: str | None = None
+    claims: dict[str, Any] | None = None
+    # Why the token is invalid, as the detail of a 403
+    error: str | None = None
+
+    @property
+    def user_id(self) -> str | None:
+        return None if self.claims is None else self.claims["sub"]
+
+    def verified_claims(self) -> dict[str, Any] | None:
+        """
+        Claims of the token, None without a token. Raises 403 if it is invalid.
+        """
+        if self.error is not None:
+            raise HTTPException(
+                status_code=status.HTTP_403_FORBIDDEN, detail=self.error
+            )
+        return self.claims
+
+
+def parse_token(token: str | None) -> AuthContext:
+    if token is None:
+        return AuthContext()
+    try:
+        return AuthContext(token=token, claims=decode_token(token))
+    except ExpiredSignatureError:
+        error = "Your token has expired. Please log in again."
+    except MissingRequiredClaimError:
+        error = (
+            "There is no required field in your token. "
+            "Please contact the administrator."
+        )
+    except (DecodeError, InvalidTokenError):
+        error = "Error when decoding the token. Please check your request."
+    return AuthContext(token=token, error=error)
+
+
+def get_auth_context(connection: HTTPConnection) -> AuthContext:
+    context = connection.scope.get(SCOPE_KEY)
+    if context is None:
+        scheme, token = get_authorization_scheme_param(
+            connection.headers.get("Authorization")
+        )
+        token = token if scheme.lower() == "bearer" else None
+        if token is None and connection.scope["type"] == "websocket":
+            token = connection.query_params.get("token")
+        context = parse_token(token)
+        connection.scope[SCOPE_KEY] = context
+    return context
@@ -0,0 +1,426 @@
+"""
+Two tier cache for endpoints and dependencies.
+
+`@cached(ttl=...)` caches the return value of an async function, validated
+and serialized against its return annotation:
+
+- L1: a small in-process LRU, valid for `l1_ttl` seconds, that skips Redis
+  for hot keys.
+- L2: Redis, shared by every worker. Entries are a fixed binary header plus
+  the JSON payload, zlib compressed when large.
+
+A value is fresh for `ttl` seconds and then kept `stale_ttl` more seconds. A
+stale value is served while one background task recomputes it
+(stale-while-revalidate), and fresh values are refreshed early with a
+probability that grows as they get close to expiring (XFetch), so hot keys
+never expire for everyone at once. When there is nothing to serve, a Redis
+lock lets a single worker compute the value while the others wait for it.
+
+Entries are tagged, and `invalidate(*tags)` makes every entry with one of the
+tags a miss. CRUDBase calls it after each write with the CRUD `cache_tags`.
+Other workers may still serve an invalidated value from their L1 for up to
+`l1_ttl` seconds.
+
+The cache is disabled (functions are just called) until `init` is called with
+a Redis client, and whenever Redis fails.
+"""
+
+import asyncio
+import hashlib
+import inspect
+import logging
+import math
+import random
+import struct
+import time
+import zlib
+from collections import OrderedDict
+from collections.abc import Awaitable, Callable, Sequence
+from dataclasses import dataclass
+from datetime import date, datetime
+from enum import Enum
+from functools import wraps
+from typing import Any, ParamSpec, TypeVar
+from uuid import UUID
+from fastapi.dependencies.utils import get_typed_return_annotation
+from fastapi_async_sqlalchemy import db
+from pydantic import BaseModel
+from redis.asyncio import Redis
+from redis.exceptions import LockError, RedisError
+from app.utils.json_response import get_serializer
+
+logger = logging.getLogger(__name__)
+
+P = ParamSpec("P")
+R = TypeVar("R")
+
+# Soft expiry (epoch seconds), compute time (seconds), flags, number of tags,
+# followed by one version per tag and the payload
+HEADER = struct.Struct("!dfBB")
+TAG_VERSION = struct.Struct("!q")
+COMPRESSED = 1
+COMPRESS_MIN_SIZE = 1024
+# XFetch beta: above 1 favours earlier refreshes
+EARLY_REFRESH_BETA = 1.0
+LOCK_POLL_INTERVAL = 0.05
+
+
+@dataclass(slots=True)
+class Entry:
+    payload: bytes
+    expires_at: float
+    delta: float
+    versions: tuple[int, ...]
+
+    def is_fresh(self, now: float) -> bool:
+        # XFetch: now - delta * beta * ln(u) < expiry, u in (0, 1]
+        jitter = self.delta * EARLY_REFRESH_BETA * math.log(1.0 - random.random())
+        return now - jitter < self.expires_at
+
+
+def encode_entry(entry: Entry) -> bytes:
+    payload, flags = entry.payload, 0
+    if len(payload) >= COMPRESS_MIN_SIZE:
+        payload, flags = zlib.compress(payload, 1), COMPRESSED
+    return b"".join(
+        (
+            HEADER.pack(entry.expires_at, entry.delta, flags, len(entry.versions)),
+            *(TAG_VERSION.pack(version) for version in entry.versions),
+            payload,
+        )
+    )
+
+
+def decode_entry(data: bytes) -> Entry:
+    expires_at, delta, flags, tag_count = HEADER.unpack_from(data)
+    offset = HEADER.size
+    versions = []
+    for _ in range(tag_count):
+        versions.append(TAG_VERSION.unpack_from(data, offset)[0])
+        offset += TAG_VERSION.size
+    payload = data[offset:]
+    if flags & COMPRESSED:
+        payload = zlib.decompress(payload)
+    return Entry(payload, expires_at, delta, tuple(versions))
+
+
+def _key_part(value: Any) -> str | None:
+    if value is None or isinstance(value, (str, int, float, UUID, date, datetime)):
+        return repr(value)
+    if isinstance(value, Enum):
+        return repr(value.value)
+    if isinstance(value, BaseModel) and not hasattr(type(value), "__table__"):
+        return value.model_dump_json()
+    return None
+
+
+class ResponseCache:
+    def __init__(
+        self, *, prefix: str = "cache", l1_size: int = 1024, l1_ttl: float = 2.0
+    ):
+        self.prefix = prefix
+        self.l1_size = l1_size
+        self.l1_ttl = l1_ttl
+        self.redis: Redis | None = None
+        # key -> (monotonic expiry, tags, entry)
+        self._l1: OrderedDict[str, tuple[float, frozenset[str], Entry]] = OrderedDict()
+        self._inflight: dict[str, asyncio.Future[bytes]] = {}
+        self._refreshing: set[str] = set()
+        self._tasks: set[asyncio.Task] = set()
+
+    def init(self, redis: Redis) -> None:
+        """
+        Enables the cache. `redis` must not decode responses.
+        """
+        self.redis = redis
+
+    async def close(self) -> None:
+        for task in list(self._tasks):
+            task.cancel()
+        self._l1.clear()
+        if self.redis is not None:
+            await self.redis.close()
+            self.redis = None
+
+    def cached(
+        self,
+        ttl: float,
+        *,
+        stale_ttl: float | None = None,
+        tags: Sequence[str] = (),
+        l1_ttl: float | None = None,
+        lock_timeout: float = 10.0,
+    ) -> Callable[[Callable[P, Awaitable[R]]], Callable[P, Awaitable[R]]]:
+        """
+        Caches an async function for `ttl` seconds and serves it stale for
+        `stale_ttl` more seconds (`ttl` by default) while it is recomputed.
+
+        The key is built from the arguments that are plain values (str,
+        numbers, dates, UUIDs, enums) or non-table pydantic models such as
+        `Params`. Other arguments, like the current user or a session, are not
+        part of it, so only cache functions whose result does not depend on
+        them.
+        """
+
+        def decorator(func: Callable[P, Awaitable[R]]) -> Callable[P, Awaitable[R]]:
+            cache = _CachedFunction(
+                self,
+                func,
+                ttl=ttl,
+                stale_ttl=ttl if stale_ttl is None else stale_ttl,
+                tags=tuple(tags),
+                l1_ttl=min(ttl, self.l1_ttl) if l1_ttl is None else l1_ttl,
+                lock_timeout=lock_timeout,
+            )
+
+            @wraps(func)
+            async def wrapper(*args: P.args, **kwargs: P.kwargs) -> R:
+                if self.redis is None:
+                    return await func(*args, **kwargs)
+                return await cache(*args, **kwargs)
+
+            return wrapper
+
+        return decorator
+
+    async def invalidate(self, *tags: str) -> None:
+        """
+        Turns every entry tagged with one of `tags` into a miss.
+        """
+        if not tags:
+            return
+        invalidated = set(tags)
+        for key in [k for k, (_, t, _) in self._l1.items() if t & invalidated]:
+            del self._l1[key]
+        if self.redis is None:
+            return
+        try:
+            pipeline = self.redis.pipeline(transaction=False)
+            for tag in tags:
+                pipeline.incr(self.tag_key(tag))
+            await pipeline.execute()
+        except RedisError:
+            logger.warning("Error invalidating cache tags %s", tags, exc_info=True)
+
+    async def tag_version(self, tag: str) -> int | None:
+        """
+        Version of `tag`, incremented by each invalidation. None when the cache
+        is disabled or Redis fails.
+        """
+        if self.redis is None:
+            return None
+        try:
+            return int(await self.redis.get(self.tag_key(tag)) or 0)
+        except RedisError:
+            logger.warning("Error reading cache tag %s", tag, exc_info=True)
+            return None
+
+    def tag_key(self, tag: str) -> str:
+        return f"{self.prefix}:tag:{tag}"
+
+    def _get_l1(self, key: str) -> Entry | None:
+        item = self._l1.get(key)
+        if item is None:
+            return None
+        expires_at, _, entry = item
+        if expires_at < time.monotonic():
+            del self._l1[key]
+            return None
+        self._l1.move_to_end(key)
+        return entry
+
+    def _set_l1(self, key: str, tags: Sequence[str], entry: Entry, ttl: float) -> None:
+        if ttl <= 0:
+            return
+        self._l1[key] = (time.monotonic() + ttl, frozenset(tags), entry)
+        self._l1.move_to_end(key)
+        if len(self._l1) > self.l1_size:
+            self._l1.popitem(last=False)
+
+
+class _CachedFunction:
+    def __init__(
+        self,
+        cache: ResponseCache,
+        func: Callable[..., Awaitable[Any]],
+        *,
+        ttl: float,
+        stale_ttl: float,
+        tags: tuple[str, ...],
+        l1_ttl: float,
+        lock_timeout: float,
+    ):
+        self.cache = cache
+        self.func = func
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.tags = tags
+        self.l1_ttl = l1_ttl
+        self.lock_timeout = lock_timeout
+        self.signature = inspect.signature(func)
+        self.adapter = get_serializer(get_typed_return_annotation(func))
+        self.name = f"{func.__module__}.{func.__qualname__}"
+
+    async def __call__(self, *args: Any, **kwargs: Any) -> Any:
+        key = self.key(args, kwargs)
+        entry = self.cache._get_l1(key)
+        if entry is None:
+            try:
+                entry, versions = await self.get(key)
+            except RedisError:
+                logger.warning("Error reading cache key %s", key, exc_info=True)
+                return await self.func(*args, **kwargs)
+            if entry is not None and entry.versions != versions:
+                entry = None  # invalidated
+            if entry is not None:
+                self.cache._set_l1(key, self.tags, entry, self.l1_ttl)
+
+        if entry is None:
+            payload = await self.load(key, args, kwargs)
+        else:
+            if not entry.is_fresh(time.time()):
+                self.refresh_in_background(key, args, kwargs)
+            payload = entry.payload
+        return self.adapter.validate_json(payload)
+
+    def key(self, args: tuple, kwargs: dict[str, Any]) -> str:
+        arguments = self.signature.bind_partial(*args, **kwargs).arguments
+        parts = [
+            f"{name}={part}"
+            for name, value in arguments.items()
+            if (part := _key_part(value)) is not None
+        ]
+        digest = hashlib.blake2b("&".join(parts).encode(), digest_size=16)
+        return f"{self.cache.prefix}:{self.name}:{digest.hexdigest()}"
+
+    async def get(self, key: str) -> tuple[Entry | None, tuple[int, ...]]:
+        """
+        The Redis entry and the current versions of its tags, in one round
+        trip.
+        """
+        redis = self.cache.redis
+        if not self.tags:
+            data = await redis.get(key)
+            return (None if data is None else decode_entry(data)), ()
+        pipeline = redis.pipeline(transaction=False)
+        pipeline.get(key)
+        pipeline.mget([self.cache.tag_key(tag) for tag in self.tags])
+        data, versions = await pipeline.execute()
+        versions = tuple(int(version or 0) for version in versions)
+        return (None if data is None else decode_entry(data)), versions
+
+    async def load(self, key: str, args: tuple, kwargs: dict[str, Any]) -> bytes:
+        # Concurrent misses in this process share one computation
+        future = self.cache._inflight.get(key)
+        if future is not None:
+            return await asyncio.shield(future)
+        future = asyncio.get_running_loop().create_future()
+        self.cache._inflight[key] = future
+        try:
+            payload = await self.load_once(key, args, kwargs)
+        except BaseException as exc:
+            future.set_exception(exc)
+            # Retrieve it so that an unawaited future does not log it
+            future.exception()
+            raise
+        else:
+            future.set_result(payload)
+            return payload
+        finally:
+            del self.cache._inflight[key]
+
+    async def load_once(self, key: str, args: tuple, kwargs: dict[str, Any]) -> bytes:
+        # Across processes, the worker holding the lock computes the value and
+        # the others wait for it to show up in Redis
+        lock = self.cache.redis.lock(f"{key}:lock", timeout=self.lock_timeout)
+        try:
+            acquired = await lock.acquire(blocking=False)
+        except RedisError:
+            logger.warning("Error locking cache key %s", key, exc_info=True)
+            return await self.compute(key, args, kwargs, store=False)
+        if acquired:
+            try:
+                return await self.compute(key, args, kwargs)
+            finally:
+                await self.release(lock)
+
+        deadline = time.monotonic() + self.lock_timeout
+        while time.monotonic() < deadline:
+            await asyncio.sleep(LOCK_POLL_INTERVAL)
+            try:
+                entry, versions = await self.get(key)
+            except RedisError:
+                break
+            if entry is not None and entry.versions == versions:
+                return entry.payload
+        # The lock holder is too slow or died
+        return await self.compute(key, args, kwargs)
+
+    async def compute(
+        self, key: str, args: tuple, kwargs: dict[str, Any], *, store: bool = True
+    ) -> bytes:
+        redis = self.cache.redis
+        # Read the tag versions first: a write committed while computing makes
+        # the stored entry outdated right away
+        versions = ()
+        if self.tags and store:
+            try:
+                tag_keys = [self.cache.tag_key(tag) for tag in self.tags]
+                versions = tuple(int(v or 0) for v in await redis.mget(tag_keys))
+            except RedisError:
+                store = False
+
+        start = time.perf_counter()
+        result = await self.func(*args, **kwargs)
+        delta = time.perf_counter() - start
+        payload = self.adapter.dump_json(
+            self.adapter.validate_python(result, from_attributes=True)
+        )
+        if not store:
+            return payload
+
+        entry = Entry(payload, time.time() + self.ttl, delta, versions)
+        try:
+            await redis.set(
+                key, encode_entry(entry), px=int((self.ttl + self.stale_ttl) * 1000)
+            )
+        except RedisError:
+            logger.warning("Error writing cache key %s", key, exc_info=True)
+        self.cache._set_l1(key, self.tags, entry, self.l1_ttl)
+        return payload
+
+    def refresh_in_background(
+        self, key: str, args: tuple, kwargs: dict[str, Any]
+    ) -> None:
+        if key in self.cache._refreshing:
+            return
+        self.cache._refreshing.add(key)
+        task = asyncio.create_task(self.refresh(key, args, kwargs))
+        self.cache._tasks.add(task)
+        task.add_done_callback(self.cache._tasks.discard)
+
+    async def refresh(self, key: str, args: tuple, kwargs: dict[str, Any]) -> None:
+        try:
+            lock = self.cache.redis.lock(f"{key}:lock", timeout=self.lock_timeout)
+            if not await lock.acquire(blocking=False):
+                return  # another worker is refreshing it
+            try:
+                # The request session may be closed by now
+                async with db():
+                    await self.compute(key, args, kwargs)
+            finally:
+                await self.release(lock)
+        except Exception:
+            logger.warning("Error refreshing cache key %s", key, exc_info=True)
+        finally:
+            self.cache._refreshing.discard(key)
+
+    async def release(self, lock: Any) -> None:
+        try:
+            await lock.release()
+        except (LockError, RedisError):
+            pass  # expired; another worker may hold it now
+
+
+response_cache = ResponseCache()
+cached = response_cache.cached
@@ -0,0 +1,22 @@
+import base64
+from typing import Any
+import orjson
+from app.utils.exceptions import InvalidCursorException
+from app.utils.json_response import dumps
+
+
+def encode_cursor(*values: Any) -> str:
+    """
+    Opaque keyset pagination cursor holding the sort key of the last row.
+    """
+    return base64.urlsafe_b64encode(dumps(values)).decode()
+
+
+def decode_cursor(cursor: str, length: int) -> list[Any]:
+    try:
+        values = orjson.loads(base64.urlsafe_b64decode(cursor.encode()))
+    except (ValueError, orjson.JSONDecodeError):
+        raise InvalidCursorException()
+    if not isinstance(values, list) or len(values) != length:
+        raise InvalidCursorException()
+    return values
@@ -1,6 +1,7 @@
 from .common_exception import (
     ContentNoChangeException,
     IdNotFoundException,
+    InvalidCursorException,
     NameExistException,
     NameNotFoundException,
 )
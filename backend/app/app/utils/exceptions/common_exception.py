@@ -80,3 +80,15 @@ class NameExistException(HTTPException, Generic[ModelType]):
             detail=f"The {model.__name__} name already exists.",
             headers=headers,
         )
+
+
+class InvalidCursorException(HTTPException):
+    def __init__(
+        self,
+        headers: Optional[Dict[str, Any]] = None,
+    ) -> None:
+        super().__init__(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Invalid pagination cursor.",
+            headers=headers,
+        )
@@ -2,7 +2,6 @@ from datetime import timedelta
 from io import BytesIO
 from typing import Optional
 
-from google.cloud import storage
 from pydantic import BaseModel
 
 
@@ -14,6 +13,10 @@ class IStorageResponse(BaseModel):
 
 class GCSClient:
     def __init__(self, bucket_name: str, url_expire_minutes: int = 60 * 24 * 7):
+        # Imported here: google.cloud.storage is slow to import and only used
+        # with STORAGE_BACKEND=gcs
+        from google.cloud import storage
+
         self.bucket_name = bucket_name
         self.client = storage.Client()
         self.bucket = self.client.bucket(bucket_name)
@@ -0,0 +1,40 @@
+import re
+import time
+from http import HTTPStatus
+from typing import Any
+
+from google.auth import transport
+from google.auth.transport.requests import Request
+
+MAX_AGE = re.compile(r"max-age=(\d+)")
+
+
+class CachingRequest(Request):
+    """
+    A google.auth transport that keeps one HTTP session and caches the
+    responses to GET requests for the max-age of their Cache-Control header.
+    Verifying a Google ID token fetches the public keys of Google, which
+    change every few hours, so most verifications skip that request.
+    """
+
+    def __init__(self) -> None:
+        super().__init__()
+        self._cache: dict[str, tuple[float, transport.Response]] = {}
+
+    def __call__(
+        self, url: str, method: str = "GET", body: Any = None, **kwargs: Any
+    ) -> transport.Response:
+        if method != "GET" or body is not None:
+            return super().__call__(url, method, body, **kwargs)
+        now = time.monotonic()
+        cached = self._cache.get(url)
+        if cached is not None and cached[0] > now:
+            return cached[1]
+        response = super().__call__(url, method, body, **kwargs)
+        max_age = MAX_AGE.search(response.headers.get("Cache-Control", ""))
+        if response.status == HTTPStatus.OK and max_age:
+            self._cache[url] = (now + int(max_age.group(1)), response)
+        return response
+
+
+google_request = CachingRequest()
@@ -0,0 +1,53 @@
+from functools import lru_cache
+from typing import Any
+from uuid import UUID
+import orjson
+from fastapi import WebSocket
+from fastapi.responses import JSONResponse
+from pydantic import BaseModel, TypeAdapter
+
+# UUID, datetime, date, enum and dataclasses are serialized natively by orjson.
+# UTC datetimes end in "Z" as in Pydantic's JSON mode.
+OPTIONS = orjson.OPT_UTC_Z | orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY
+
+
+@lru_cache(maxsize=None)
+def get_serializer(schema: Any) -> TypeAdapter:
+    """
+    Serializer for `schema`, built once per schema and reused for every payload.
+    """
+    return TypeAdapter(schema)
+
+
+def _default(obj: Any) -> Any:
+    if isinstance(obj, BaseModel):
+        return orjson.Fragment(get_serializer(type(obj)).dump_json(obj))
+    # asyncpg returns its own UUID subclass, which orjson does not serialize
+    if isinstance(obj, UUID):
+        return str(obj)
+    raise TypeError(f"Type is not JSON serializable: {type(obj).__name__}")
+
+
+def dumps(content: Any) -> bytes:
+    """
+    JSON bytes for `content`. Pydantic objects anywhere in it are dumped with
+    their cached serializer.
+    """
+    return orjson.dumps(content, default=_default, option=OPTIONS)
+
+
+class ORJSONResponse(JSONResponse):
+    """
+    Default response class of the app. Renders with `dumps` instead of the
+    stdlib json module.
+    """
+
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
+
+
+async def send_json(websocket: WebSocket, data: Any) -> None:
+    """
+    Same as `websocket.send_json` (a text frame) but encoded with `dumps`.
+    """
+    await websocket.send_text(dumps(data).decode())
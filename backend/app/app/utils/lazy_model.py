@@ -0,0 +1,24 @@
+import asyncio
+from collections.abc import Callable
+from typing import Any
+
+
+class LazyModel:
+    """
+    A model loaded on its first use rather than at startup. Loading a
+    transformers pipeline imports torch and reads the weights, seconds the
+    app would otherwise wait before accepting its first request.
+
+    The first call of `get` loads it in a thread, and concurrent calls wait
+    for that load. `load` returns None when the model is unavailable.
+    """
+
+    def __init__(self, load: Callable[[], Any | None]) -> None:
+        self._load = load
+        self._loading: asyncio.Task | None = None
+
+    async def get(self) -> Any | None:
+        if self._loading is None:
+            self._loading = asyncio.create_task(asyncio.to_thread(self._load))
+        # Shielded: a cancelled request must not cancel the load for the others
+        return await asyncio.shield(self._loading)
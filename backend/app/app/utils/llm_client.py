@@ -1,33 +1,29 @@
+import asyncio
+import importlib.util
+import time
+from functools import cached_property
 from typing import Any
 
-from langchain.chat_models import ChatOpenAI
-from langchain.schema import HumanMessage
-
 from app.core.config import settings
-
-try:
-    import vertexai
-    from vertexai.generative_models import GenerativeModel
-except Exception:  # pragma: no cover - handled via runtime config
-    vertexai = None
-    GenerativeModel = None
+from app.utils.metrics import llm_request_duration_seconds, llm_tokens_total
 
 
 class ChatClient:
+    """
+    The LLM of the chat. The configuration is checked at startup, but the
+    provider's library (langchain or vertexai, slow to import) is imported
+    and its client created on the first message.
+    """
+
     def __init__(self) -> None:
         self.provider = settings.CHAT_PROVIDER.lower()
         if self.provider == "mock":
-            self.client = None
+            pass
         elif self.provider == "openai":
             if not settings.OPENAI_API_KEY:
                 raise RuntimeError("OPENAI_API_KEY must be set when using OpenAI.")
-            self.client = ChatOpenAI(
-                temperature=0,
-                openai_api_key=settings.OPENAI_API_KEY,
-                model_name=settings.OPENAI_MODEL,
-            )
         elif self.provider in ("vertex", "gemini"):
-            if vertexai is None or GenerativeModel is None:
+            if importlib.util.find_spec("vertexai") is None:
                 raise RuntimeError(
                     "Vertex AI libraries are not available. "
                     "Install google-cloud-aiplatform to use Gemini."
@@ -36,30 +32,75 @@ class ChatClient:
                 raise RuntimeError(
                     "VERTEX_PROJECT_ID and VERTEX_REGION must be set for Gemini."
                 )
-            vertexai.init(
-                project=settings.VERTEX_PROJECT_ID,
-                location=settings.VERTEX_REGION,
-            )
-            self.client = GenerativeModel(settings.VERTEX_MODEL)
         else:
             raise RuntimeError(
                 f"Unsupported CHAT_PROVIDER '{settings.CHAT_PROVIDER}'. "
                 "Use 'vertex', 'openai', or 'mock'."
             )
 
-    def generate(self, prompt: str) -> str:
+    @cached_property
+    def client(self) -> Any:
         if self.provider == "mock":
-            return "LLM is not configured for local dev. Set CHAT_PROVIDER to 'vertex' or 'openai' to enable responses."
-
+            return None
         if self.provider == "openai":
-            result = self.client([HumanMessage(content=prompt)])
-            return result.content
+            from langchain.chat_models import ChatOpenAI
+
+            return ChatOpenAI(
+                temperature=0,
+                openai_api_key=settings.OPENAI_API_KEY,
+                model_name=settings.OPENAI_MODEL,
+            )
+        import vertexai
+        from vertexai.generative_models import GenerativeModel
+
+        vertexai.init(
+            project=settings.VERTEX_PROJECT_ID,
+            location=settings.VERTEX_REGION,
+        )
+        return GenerativeModel(settings.VERTEX_MODEL)
+
+    async def generate(self, prompt: str) -> str:
+        start = time.perf_counter()
+        outcome = "error"
         try:
-            response: Any = self.client.generate_content(prompt)
-        except Exception as exc:  # pragma: no cover - runtime provider failures
-            return (
-                "LLM request failed. Configure credentials for the selected "
-                f"provider. Details: {exc}"
+            if self.provider == "mock":
+                if settings.MOCK_LLM_LATENCY_MS:
+                    await asyncio.sleep(settings.MOCK_LLM_LATENCY_MS / 1000)
+                outcome = "ok"
+                return "LLM is not configured for local dev. Set CHAT_PROVIDER to 'vertex' or 'openai' to enable responses."
+
+            if self.provider == "openai":
+                from langchain.schema import HumanMessage
+
+                result = await self.client.agenerate([[HumanMessage(content=prompt)]])
+                usage = (result.llm_output or {}).get("token_usage", {})
+                self._count_tokens(
+                    usage.get("prompt_tokens"), usage.get("completion_tokens")
+                )
+                outcome = "ok"
+                return result.generations[0][0].text
+            try:
+                response: Any = await self.client.generate_content_async(prompt)
+            except Exception as exc:  # pragma: no cover - runtime provider failures
+                return (
+                    "LLM request failed. Configure credentials for the selected "
+                    f"provider. Details: {exc}"
+                )
+            usage = getattr(response, "usage_metadata", None)
+            if usage is not None:
+                self._count_tokens(
+                    usage.prompt_token_count, usage.candidates_token_count
+                )
+            outcome = "ok"
+            text = getattr(response, "text", None)
+            return text if text is not None else str(response)
+        finally:
+            llm_request_duration_seconds.labels(self.provider, outcome).observe(
+                time.perf_counter() - start
             )
-        text = getattr(response, "text", None)
-        return text if text is not None else str(response)
+
+    def _count_tokens(self, prompt: int | None, completion: int | None) -> None:
+        if prompt:
+            llm_tokens_total.labels(self.provider, "prompt").inc(prompt)
+        if completion:
+            llm_tokens_total.labels(self.provider, "completion").inc(completion)
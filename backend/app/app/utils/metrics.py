@@ -0,0 +1,402 @@
+"""
+In-process metrics, exposed at `GET /metrics` in the Prometheus text format.
+
+Counters, gauges and histograms live in `registry`, per process: with several
+workers or instances, each reports its own values and Prometheus sums them.
+They are only updated from the event loop thread, so they take no locks; an
+observation is a dict lookup, a bisect and two additions.
+
+What is measured, and where:
+
+- HTTP requests: latency by route template and requests by status, and the
+  requests and websockets in flight (`MetricsMiddleware`).
+- Database: pool checkout waits (`MeteredQueuePool`) and query durations by
+  statement type (`instrument_sqlalchemy`), and statements per request
+  (`app.utils.query_log.QueryLogMiddleware`).
+- Redis: round trips, one per command or pipeline (`MeteredConnection`).
+- LLM calls: latency and tokens by provider (`ChatClient`).
+- Model inference: latency and batch size (`metered_model`).
+"""
+
+import time
+from bisect import bisect_left
+from collections.abc import Callable, Iterator, Sequence
+from typing import Any
+
+from redis.asyncio import Connection
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+FAST_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1)
+SLOW_BUCKETS = (0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60)
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str]) -> str:
+    if not names:
+        return ""
+    pairs = (
+        '{}="{}"'.format(
+            name,
+            str(value).replace("\\", r"\\").replace('"', r"\"").replace("\n", r"\n"),
+        )
+        for name, value in zip(names, values, strict=True)
+    )
+    return "{" + ",".join(pairs) + "}"
+
+
+class CounterChild:
+    __slots__ = ("value",)
+
+    def __init__(self) -> None:
+        self.value = 0.0
+
+    def inc(self, amount: float = 1) -> None:
+        self.value += amount
+
+
+class GaugeChild(CounterChild):
+    __slots__ = ()
+
+    def dec(self, amount: float = 1) -> None:
+        self.value -= amount
+
+    def set(self, value: float) -> None:
+        self.value = value
+
+
+class HistogramChild:
+    __slots__ = ("bounds", "counts", "sum")
+
+    def __init__(self, bounds: tuple[float, ...]) -> None:
+        self.bounds = bounds
+        # One count per bucket, not cumulative, the last one for +Inf
+        self.counts = [0] * (len(bounds) + 1)
+        self.sum = 0.0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.sum += value
+
+
+class Metric:
+    type = ""
+
+    def __init__(
+        self, name: str, documentation: str, labelnames: Sequence[str] = ()
+    ) -> None:
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children: dict[tuple[str, ...], Any] = {}
+        if not self.labelnames:
+            self._children[()] = self._new_child()
+
+    def _new_child(self) -> Any:
+        raise NotImplementedError
+
+    def labels(self, *values: str) -> Any:
+        """
+        The child for these label values. Keep it to update it without the
+        lookup.
+        """
+        child = self._children.get(values)
+        if child is None:
+            if len(values) != len(self.labelnames):
+                raise ValueError(f"{self.name} has labels {self.labelnames}")
+            child = self._children[values] = self._new_child()
+        return child
+
+    def render(self) -> Iterator[str]:
+        yield f"# HELP {self.name} {self.documentation}"
+        yield f"# TYPE {self.name} {self.type}"
+        for values, child in list(self._children.items()):
+            labels = _format_labels(self.labelnames, values)
+            yield f"{self.name}{labels} {_format_value(child.value)}"
+
+
+class Counter(Metric):
+    type = "counter"
+
+    def _new_child(self) -> CounterChild:
+        return CounterChild()
+
+    def inc(self, amount: float = 1) -> None:
+        self._children[()].inc(amount)
+
+
+class Gauge(Metric):
+    type = "gauge"
+
+    def _new_child(self) -> GaugeChild:
+        return GaugeChild()
+
+    def inc(self, amount: float = 1) -> None:
+        self._children[()].inc(amount)
+
+    def dec(self, amount: float = 1) -> None:
+        self._children[()].dec(amount)
+
+
+class Histogram(Metric):
+    type = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = DEFAULT_BUCKETS,
+    ) -> None:
+        self.buckets = tuple(sorted(buckets))
+        super().__init__(name, documentation, labelnames)
+
+    def _new_child(self) -> HistogramChild:
+        return HistogramChild(self.buckets)
+
+    def observe(self, value: float) -> None:
+        self._children[()].observe(value)
+
+    def render(self) -> Iterator[str]:
+        yield f"# HELP {self.name} {self.documentation}"
+        yield f"# TYPE {self.name} {self.type}"
+        names = (*self.labelnames, "le")
+        for values, child in list(self._children.items()):
+            cumulative = 0
+            for bound, count in zip(
+                (*self.buckets, float("inf")), child.counts, strict=True
+            ):
+                cumulative += count
+                labels = _format_labels(names, (*values, _format_value(bound)))
+                yield f"{self.name}_bucket{labels} {cumulative}"
+            labels = _format_labels(self.labelnames, values)
+            yield f"{self.name}_sum{labels} {_format_value(child.sum)}"
+            yield f"{self.name}_count{labels} {cumulative}"
+
+
+class Registry:
+    def __init__(self) -> None:
+        self.metrics: dict[str, Metric] = {}
+
+    def register(self, metric: Metric) -> Any:
+        if metric.name in self.metrics:
+            raise ValueError(f"Metric {metric.name} is already registered")
+        self.metrics[metric.name] = metric
+        return metric
+
+    def render(self) -> str:
+        return (
+            "\n".join(
+                line for metric in self.metrics.values() for line in metric.render()
+            )
+            + "\n"
+        )
+
+
+registry = Registry()
+
+http_requests_in_flight: Gauge = registry.register(
+    Gauge("http_requests_in_flight", "HTTP requests being handled", ["method"])
+)
+http_request_duration_seconds: Histogram = registry.register(
+    Histogram(
+        "http_request_duration_seconds",
+        "HTTP request latency by route template",
+        ["method", "route"],
+    )
+)
+http_requests_total: Counter = registry.register(
+    Counter("http_requests_total", "HTTP responses", ["method", "route", "status"])
+)
+websocket_connections: Gauge = registry.register(
+    Gauge("websocket_connections", "Open websocket connections")
+)
+db_pool_checkout_wait_seconds: Histogram = registry.register(
+    Histogram(
+        "db_pool_checkout_wait_seconds",
+        "Time to get a connection from the database pool",
+        buckets=FAST_BUCKETS,
+    )
+)
+db_query_duration_seconds: Histogram = registry.register(
+    Histogram(
+        "db_query_duration_seconds",
+        "Database query duration by statement type",
+        ["statement"],
+        buckets=FAST_BUCKETS,
+    )
+)
+db_statements_per_request: Histogram = registry.register(
+    Histogram(
+        "db_statements_per_request",
+        "Database statements of an HTTP request by route template",
+        ["method", "route"],
+        buckets=(0, 1, 2, 3, 5, 8, 13, 21, 34, 55),
+    )
+)
+redis_round_trip_seconds: Histogram = registry.register(
+    Histogram(
+        "redis_round_trip_seconds",
+        "Redis round trip of a command or pipeline",
+        buckets=FAST_BUCKETS,
+    )
+)
+llm_request_duration_seconds: Histogram = registry.register(
+    Histogram(
+        "llm_request_duration_seconds",
+        "LLM call latency",
+        ["provider", "outcome"],
+        buckets=SLOW_BUCKETS,
+    )
+)
+llm_tokens_total: Counter = registry.register(
+    Counter("llm_tokens_total", "LLM tokens", ["provider", "type"])
+)
+model_inference_duration_seconds: Histogram = registry.register(
+    Histogram("model_inference_duration_seconds", "Model inference latency", ["model"])
+)
+model_inference_batch_size: Histogram = registry.register(
+    Histogram(
+        "model_inference_batch_size",
+        "Inputs per model inference call",
+        ["model"],
+        buckets=(1, 2, 4, 8, 16, 32, 64, 128),
+    )
+)
+
+
+class MetricsMiddleware:
+    def __init__(self, app: ASGIApp) -> None:
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] == "websocket":
+            websocket_connections.inc()
+            try:
+                await self.app(scope, receive, send)
+            finally:
+                websocket_connections.dec()
+            return
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        method = scope["method"]
+        in_flight = http_requests_in_flight.labels(method)
+        status = 500
+
+        async def send_with_status(message: Message) -> None:
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        in_flight.inc()
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            elapsed = time.perf_counter() - start
+            in_flight.dec()
+            # The router sets the matched route in the scope. Raw paths would
+            # make a series per id, so unmatched requests share one.
+            route = getattr(scope.get("route"), "path", "unmatched")
+            http_request_duration_seconds.labels(method, route).observe(elapsed)
+            http_requests_total.labels(method, route, str(status)).inc()
+
+
+class MeteredQueuePool(AsyncAdaptedQueuePool):
+    """
+    AsyncAdaptedQueuePool that measures how long checkouts wait.
+    """
+
+    def _do_get(self) -> Any:
+        start = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            db_pool_checkout_wait_seconds.observe(time.perf_counter() - start)
+
+
+STATEMENT_TYPES = frozenset({"SELECT", "INSERT", "UPDATE", "DELETE", "WITH"})
+
+
+def _statement_type(statement: str) -> str:
+    keyword = statement.lstrip()[:7].split(None, 1)
+    keyword = keyword[0].upper() if keyword else ""
+    return keyword if keyword in STATEMENT_TYPES else "OTHER"
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, many):
+    conn.info.setdefault("query_start", []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, many):
+    elapsed = time.perf_counter() - conn.info["query_start"].pop()
+    db_query_duration_seconds.labels(_statement_type(statement)).observe(elapsed)
+
+
+def _handle_error(context) -> None:
+    starts = context.connection is not None and context.connection.info.get(
+        "query_start"
+    )
+    if starts:
+        starts.pop()
+
+
+def instrument_sqlalchemy() -> None:
+    """
+    Measures the queries of every engine.
+    """
+    if not event.contains(Engine, "before_cursor_execute", _before_cursor_execute):
+        event.listen(Engine, "before_cursor_execute", _before_cursor_execute)
+        event.listen(Engine, "after_cursor_execute", _after_cursor_execute)
+        event.listen(Engine, "handle_error", _handle_error)
+
+
+class MeteredConnection(Connection):
+    """
+    Redis connection that measures the time from sending commands to reading
+    the first reply. A pipeline counts as one round trip.
+    """
+
+    _sent_at: float | None = None
+
+    async def send_packed_command(self, *args: Any, **kwargs: Any) -> None:
+        await super().send_packed_command(*args, **kwargs)
+        self._sent_at = time.perf_counter()
+
+    async def read_response(self, *args: Any, **kwargs: Any) -> Any:
+        response = await super().read_response(*args, **kwargs)
+        if self._sent_at is not None:
+            redis_round_trip_seconds.observe(time.perf_counter() - self._sent_at)
+            self._sent_at = None
+        return response
+
+
+def metered_model(model: Callable[..., Any], name: str) -> Callable[..., Any]:
+    """
+    Wraps an inference callable (a transformers pipeline) to measure its calls.
+    """
+    duration = model_inference_duration_seconds.labels(name)
+    batch_size = model_inference_batch_size.labels(name)
+
+    def predict(inputs: Any, *args: Any, **kwargs: Any) -> Any:
+        start = time.perf_counter()
+        try:
+            return model(inputs, *args, **kwargs)
+        finally:
+            duration.observe(time.perf_counter() - start)
+            batch_size.observe(len(inputs) if isinstance(inputs, list | tuple) else 1)
+
+    return predict
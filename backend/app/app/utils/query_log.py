@@ -0,0 +1,205 @@
+"""
+Slow-query log and N+1 detector, on the events of every SQLAlchemy engine.
+
+- Statements slower than `SLOW_QUERY_MS` are logged with their bound
+  parameters redacted: the statement keeps its placeholders, string literals
+  are masked, and only the number of parameters is logged. In development,
+  with `SLOW_QUERY_EXPLAIN`, slow SELECTs are run again with
+  `EXPLAIN (ANALYZE, BUFFERS)` and the plan is logged too, its string
+  literals masked.
+- `QueryLogMiddleware` counts the statements of each HTTP request by shape
+  (the statement with its parameter lists collapsed). A shape executed
+  `N_PLUS_ONE_THRESHOLD` times or more in a request is logged as a likely
+  N+1, with the route.
+- An endpoint can declare a query budget with the `query_budget(n)`
+  dependency. A request over its budget is logged; in testing mode it raises
+  `QueryBudgetExceededError`, so the test calling the endpoint fails.
+"""
+
+import logging
+import re
+import time
+from collections import Counter
+from collections.abc import Callable, Coroutine
+from contextvars import ContextVar
+from typing import Any
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from starlette.types import ASGIApp, Receive, Scope, Send
+
+from app.core.config import ModeEnum, settings
+from app.utils.metrics import db_statements_per_request
+
+logger = logging.getLogger(__name__)
+
+_PARAMETER_LIST = re.compile(
+    r"\(\s*\$\d+(?:::[\w\[\]]+)?(?:\s*,\s*\$\d+(?:::[\w\[\]]+)?)*\s*\)"
+)
+_PARAMETER = re.compile(r"\$\d+")
+_STRING_LITERAL = re.compile(r"'(?:[^']|'')*'")
+_WHITESPACE = re.compile(r"\s+")
+
+
+class QueryBudgetExceededError(AssertionError):
+    pass
+
+
+class RequestQueries:
+    __slots__ = ("count", "shapes", "budget")
+
+    def __init__(self) -> None:
+        self.count = 0
+        self.shapes: Counter[str] = Counter()
+        self.budget: int | None = None
+
+
+_request_queries: ContextVar[RequestQueries | None] = ContextVar(
+    "request_queries", default=None
+)
+
+
+def statement_shape(statement: str) -> str:
+    """
+    The statement without what changes between executions of the same code:
+    the number of parameters of an IN list, their numbering and whitespace.
+    """
+    statement = _PARAMETER_LIST.sub("(...)", statement)
+    statement = _PARAMETER.sub("?", statement)
+    return _WHITESPACE.sub(" ", statement).strip()
+
+
+def _redact(statement: str) -> str:
+    return _WHITESPACE.sub(" ", _STRING_LITERAL.sub("'?'", statement)).strip()
+
+
+def query_budget(max_queries: int) -> Callable[[], Coroutine[Any, Any, None]]:
+    """
+    Dependency limiting the statements of a request, those of the other
+    dependencies included:
+
+        @router.get("/list", dependencies=[Depends(query_budget(4))])
+    """
+
+    async def set_query_budget() -> None:
+        queries = _request_queries.get()
+        if queries is not None:
+            queries.budget = max_queries
+
+    return set_query_budget
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, many):
+    conn.info.setdefault("query_log_start", []).append(time.perf_counter())
+    queries = _request_queries.get()
+    if queries is not None:
+        queries.count += 1
+        queries.shapes[statement_shape(statement)] += 1
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, many):
+    elapsed_ms = (time.perf_counter() - conn.info["query_log_start"].pop()) * 1000
+    if elapsed_ms < settings.SLOW_QUERY_MS:
+        return
+    logger.warning(
+        "Slow query (%.0f ms, %d parameters redacted): %s",
+        elapsed_ms,
+        len(parameters) if parameters else 0,
+        _redact(statement),
+    )
+    if (
+        settings.SLOW_QUERY_EXPLAIN
+        and settings.MODE == ModeEnum.development
+        and not many
+        and statement.lstrip()[:6].upper() == "SELECT"
+    ):
+        _explain(conn, statement, parameters)
+
+
+def _explain(conn, statement, parameters) -> None:
+    # A cursor of its own keeps the rows of the explained query, and the
+    # savepoint keeps the transaction usable if EXPLAIN fails
+    cursor = conn.connection.dbapi_connection.cursor()
+    try:
+        cursor.execute("SAVEPOINT query_log_explain")
+        try:
+            cursor.execute(f"EXPLAIN (ANALYZE, BUFFERS) {statement}", parameters)
+            # Plans show the parameters as literals
+            plan = _STRING_LITERAL.sub(
+                "'?'", "\n".join(row[0] for row in cursor.fetchall())
+            )
+            cursor.execute("RELEASE SAVEPOINT query_log_explain")
+        except Exception:
+            cursor.execute("ROLLBACK TO SAVEPOINT query_log_explain")
+            raise
+        logger.warning("Plan of the slow query:\n%s", plan)
+    except Exception:
+        logger.warning("Error explaining a slow query", exc_info=True)
+    finally:
+        cursor.close()
+
+
+def _handle_error(context) -> None:
+    starts = context.connection is not None and context.connection.info.get(
+        "query_log_start"
+    )
+    if starts:
+        starts.pop()
+
+
+def enable_query_log() -> None:
+    """
+    Logs the slow queries of every engine, and counts the statements of
+    requests going through `QueryLogMiddleware`.
+    """
+    if not event.contains(Engine, "before_cursor_execute", _before_cursor_execute):
+        event.listen(Engine, "before_cursor_execute", _before_cursor_execute)
+        event.listen(Engine, "after_cursor_execute", _after_cursor_execute)
+        event.listen(Engine, "handle_error", _handle_error)
+
+
+class QueryLogMiddleware:
+    def __init__(self, app: ASGIApp) -> None:
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        queries = RequestQueries()
+        token = _request_queries.set(queries)
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            _request_queries.reset(token)
+            route = getattr(scope.get("route"), "path", "unmatched")
+            db_statements_per_request.labels(scope["method"], route).observe(
+                queries.count
+            )
+        self._check(scope["method"], route, queries)
+
+    @staticmethod
+    def _check(method: str, route: str, queries: RequestQueries) -> None:
+        for shape, count in queries.shapes.items():
+            if count >= settings.N_PLUS_ONE_THRESHOLD:
+                logger.warning(
+                    "Possible N+1 in %s %s: %d executions of %s",
+                    method,
+                    route,
+                    count,
+                    _redact(shape),
+                )
+        if queries.budget is None or queries.count <= queries.budget:
+            return
+        message = (
+            f"{method} {route} ran {queries.count} statements, "
+            f"over its budget of {queries.budget}:\n"
+            + "\n".join(
+                f"{count} × {_redact(shape)}"
+                for shape, count in queries.shapes.most_common()
+            )
+        )
+        if settings.MODE == ModeEnum.testing:
+            raise QueryBudgetExceededError(message)
+        logger.warning(message)
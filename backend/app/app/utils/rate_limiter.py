@@ -0,0 +1,328 @@
+"""
+Rate limiting with in-process token buckets backed by Redis.
+
+Limits are sliding windows: the count of the current fixed window plus the
+count of the previous one weighted by how much of it still overlaps the
+sliding window. The counts live in Redis so that they are shared by every
+instance, but instead of one Redis call per request each process leases
+tokens from Redis in blocks and spends them locally. Most checks, such as
+those on every chat message, are answered without any network round trip.
+
+Leased tokens count as used in Redis. Every `sync_interval` seconds, tokens
+of buckets that went idle are returned, so at most `lease_size` tokens per
+instance and key are held back from the other instances.
+
+When Redis fails or is slower than `redis_timeout`, the limits are enforced
+per process on local counts for `degraded_interval` seconds.
+"""
+
+import asyncio
+import logging
+import math
+import time
+from collections.abc import Awaitable, Callable
+from dataclasses import dataclass, field
+from typing import Annotated
+
+from fastapi import HTTPException, Request, Response, WebSocket, status
+from pydantic import Field
+from redis.asyncio import Redis
+from redis.exceptions import RedisError
+
+logger = logging.getLogger(__name__)
+
+Identifier = Callable[[Request | WebSocket], Awaitable[str]]
+
+
+async def default_identifier(request: Request | WebSocket) -> str:
+    forwarded = request.headers.get("X-Forwarded-For")
+    if forwarded:
+        return forwarded.split(",")[0] + ":" + request.scope["path"]
+    ip = getattr(request.client, "host", "0.0.0.0")
+    return ip + ":" + request.scope["path"]
+
+
+async def too_many_requests(
+    request: Request | WebSocket, response: Response | None, pexpire: int
+) -> None:
+    raise HTTPException(
+        status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+        detail="Too Many Requests",
+        headers={"Retry-After": str(math.ceil(pexpire / 1000))},
+    )
+
+
+def retry_after(
+    previous: float, current: float, times: int, elapsed: float, window: int
+) -> int:
+    """
+    Milliseconds until one more request fits in the sliding window, given the
+    counts of the previous and current fixed windows and the milliseconds
+    elapsed in the current one.
+    """
+    budget = times - 1 - current
+    if budget >= 0 and previous > 0:
+        wait = window * (1 - budget / previous) - elapsed
+        if wait < window - elapsed:
+            return max(1, math.ceil(wait))
+    # Only fits once the current window becomes the previous one
+    wait = window - elapsed
+    if current > 0:
+        wait += max(0.0, window * (1 - (times - 1) / current))
+    return max(1, math.ceil(wait))
+
+
+@dataclass(slots=True)
+class Bucket:
+    # Index of the fixed window the counts and tokens belong to
+    window: int
+    # Leased from Redis and not spent yet
+    tokens: int = 0
+    # Requests allowed by this process in this window and the previous one
+    count: int = 0
+    previous_count: int = 0
+    last_used: float = 0.0
+    lock: asyncio.Lock = field(default_factory=asyncio.Lock)
+
+    def roll(self, window: int) -> None:
+        if window == self.window:
+            return
+        # Tokens of a past window are not returned: its count only matters
+        # weighted, and less every second
+        self.previous_count = self.count if window == self.window + 1 else 0
+        self.window, self.tokens, self.count = window, 0, 0
+
+    def spend(self) -> None:
+        self.tokens -= 1
+        self.count += 1
+        self.last_used = time.monotonic()
+
+
+class HybridRateLimiter:
+    def __init__(
+        self,
+        *,
+        prefix: str = "rate-limit",
+        lease_size: int = 50,
+        lease_fraction: int = 20,
+        sync_interval: float = 1.0,
+        redis_timeout: float = 0.1,
+        degraded_interval: float = 5.0,
+    ):
+        self.prefix = prefix
+        self.lease_size = lease_size
+        self.lease_fraction = lease_fraction
+        self.sync_interval = sync_interval
+        self.redis_timeout = redis_timeout
+        self.degraded_interval = degraded_interval
+        self.redis: Redis | None = None
+        self.identifier: Identifier = default_identifier
+        self.callback: Callable[..., Awaitable[None]] = too_many_requests
+        self._buckets: dict[tuple[str, int], Bucket] = {}
+        self._degraded_until = 0.0
+        self._sync_task: asyncio.Task | None = None
+
+    def init(
+        self,
+        redis: Redis,
+        *,
+        identifier: Identifier | None = None,
+        callback: Callable[..., Awaitable[None]] | None = None,
+    ) -> None:
+        """
+        Shares the limits through `redis`. Until then they are enforced per
+        process.
+        """
+        self.redis = redis
+        self.identifier = identifier or self.identifier
+        self.callback = callback or self.callback
+        self._sync_task = asyncio.create_task(self._sync_periodically())
+
+    async def close(self) -> None:
+        if self._sync_task is not None:
+            self._sync_task.cancel()
+            self._sync_task = None
+        await self.sync(idle_for=0)
+        self._buckets.clear()
+        if self.redis is not None:
+            await self.redis.close()
+            self.redis = None
+
+    def lease_size_for(self, times: int) -> int:
+        # Small limits are checked on every request to stay exact
+        return max(1, min(self.lease_size, times // self.lease_fraction))
+
+    async def hit(self, key: str, times: int, milliseconds: int) -> int:
+        """
+        Counts one request for `key`, allowed `times` per `milliseconds`.
+        Returns 0 if it is allowed, else the milliseconds to wait.
+        """
+        now = time.time() * 1000
+        window, elapsed = divmod(now, milliseconds)
+        window = int(window)
+        bucket = self._buckets.get((key, milliseconds))
+        if bucket is None:
+            bucket = self._buckets.setdefault((key, milliseconds), Bucket(window))
+        bucket.roll(window)
+        if bucket.tokens > 0:
+            bucket.spend()
+            return 0
+
+        async with bucket.lock:
+            # Another request may have leased tokens while this one waited
+            bucket.roll(window)
+            if bucket.tokens > 0:
+                bucket.spend()
+                return 0
+            if self.redis is not None and self._degraded_until < time.monotonic():
+                try:
+                    granted, pexpire = await asyncio.wait_for(
+                        self.lease(key, times, milliseconds, window, elapsed),
+                        self.redis_timeout,
+                    )
+                except (RedisError, asyncio.TimeoutError):
+                    logger.warning(
+                        "Rate limiting locally, Redis failed or timed out",
+                        exc_info=True,
+                    )
+                    self._degraded_until = time.monotonic() + self.degraded_interval
+                else:
+                    bucket.tokens += granted
+                    if bucket.tokens == 0:
+                        return pexpire
+                    bucket.spend()
+                    return 0
+
+            # Local fallback on this process' own counts
+            weight = 1 - elapsed / milliseconds
+            if bucket.previous_count * weight + bucket.count + 1 > times:
+                return retry_after(
+                    bucket.previous_count, bucket.count, times, elapsed, milliseconds
+                )
+            bucket.count += 1
+            bucket.last_used = time.monotonic()
+            return 0
+
+    async def lease(
+        self, key: str, times: int, milliseconds: int, window: int, elapsed: float
+    ) -> tuple[int, int]:
+        """
+        Leases up to one block of tokens of the current window. Returns the
+        tokens granted and, when none is, the milliseconds to wait.
+        """
+        size = self.lease_size_for(times)
+        current_key = f"{self.prefix}:{key}:{milliseconds}:{window}"
+        pipeline = self.redis.pipeline(transaction=True)
+        pipeline.incrby(current_key, size)
+        pipeline.pexpire(current_key, 2 * milliseconds)
+        pipeline.get(f"{self.prefix}:{key}:{milliseconds}:{window - 1}")
+        current, _, previous = await pipeline.execute()
+        previous = int(previous or 0)
+
+        estimate = previous * (1 - elapsed / milliseconds) + current
+        excess = min(size, max(0, math.ceil(estimate - times)))
+        if excess:
+            # Near the limit: give back what does not fit
+            await self.redis.decrby(current_key, excess)
+        granted = size - excess
+        if granted:
+            return granted, 0
+        return 0, retry_after(previous, current - size, times, elapsed, milliseconds)
+
+    async def sync(self, *, idle_for: float | None = None) -> None:
+        """
+        Returns the tokens of buckets idle for `idle_for` seconds
+        (`sync_interval` by default) to Redis, and forgets the buckets whose
+        counts no longer matter.
+        """
+        idle_for = self.sync_interval if idle_for is None else idle_for
+        idle_since = time.monotonic() - idle_for
+        now = time.time() * 1000
+        returned = []
+        for (key, milliseconds), bucket in list(self._buckets.items()):
+            window = int(now // milliseconds)
+            if bucket.lock.locked():
+                continue
+            if (
+                bucket.window == window
+                and bucket.tokens
+                and bucket.last_used <= idle_since
+            ):
+                returned.append(
+                    (f"{self.prefix}:{key}:{milliseconds}:{window}", bucket.tokens)
+                )
+                bucket.tokens = 0
+            if bucket.window < window - 1:
+                del self._buckets[(key, milliseconds)]
+
+        if not returned or self.redis is None:
+            return
+        try:
+            pipeline = self.redis.pipeline(transaction=False)
+            for redis_key, tokens in returned:
+                pipeline.decrby(redis_key, tokens)
+            await asyncio.wait_for(pipeline.execute(), self.redis_timeout)
+        except (RedisError, asyncio.TimeoutError):
+            logger.warning("Error returning rate limit tokens", exc_info=True)
+
+    async def _sync_periodically(self) -> None:
+        while True:
+            await asyncio.sleep(self.sync_interval)
+            try:
+                await self.sync()
+            except Exception:
+                logger.warning("Error syncing rate limits", exc_info=True)
+
+
+rate_limiter = HybridRateLimiter()
+
+
+class RateLimiter:
+    """
+    Dependency that allows `times` requests per period and route to each
+    identifier (the user id for authenticated requests, else the client IP).
+    """
+
+    def __init__(
+        self,
+        times: Annotated[int, Field(ge=0)] = 1,
+        milliseconds: Annotated[int, Field(ge=-1)] = 0,
+        seconds: Annotated[int, Field(ge=-1)] = 0,
+        minutes: Annotated[int, Field(ge=-1)] = 0,
+        hours: Annotated[int, Field(ge=-1)] = 0,
+        identifier: Identifier | None = None,
+        callback: Callable[..., Awaitable[None]] | None = None,
+    ):
+        self.times = times
+        self.milliseconds = (
+            milliseconds + 1000 * seconds + 60000 * minutes + 3600000 * hours
+        )
+        self.identifier = identifier
+        self.callback = callback
+
+    async def __call__(self, request: Request, response: Response) -> None:
+        identifier = self.identifier or rate_limiter.identifier
+        rate_key = await identifier(request)
+        route = request.scope.get("route")
+        path = getattr(route, "path", request.scope["path"])
+        key = f"{rate_key}:{request.method}:{path}:{self.times}"
+        pexpire = await rate_limiter.hit(key, self.times, self.milliseconds)
+        if pexpire:
+            callback = self.callback or rate_limiter.callback
+            await callback(request, response, pexpire)
+
+
+class WebSocketRateLimiter(RateLimiter):
+    """
+    Same as `RateLimiter` for the messages of a websocket. Call it for each
+    message.
+    """
+
+    async def __call__(self, ws: WebSocket, context_key: str = "") -> None:
+        identifier = self.identifier or rate_limiter.identifier
+        rate_key = await identifier(ws)
+        key = f"ws:{rate_key}:{context_key}:{self.times}"
+        pexpire = await rate_limiter.hit(key, self.times, self.milliseconds)
+        if pexpire:
+            callback = self.callback or rate_limiter.callback
+            await callback(ws, None, pexpire)
@@ -1,5 +1,4 @@
 from typing import Any
-from PIL import Image
 from io import BytesIO
 from pydantic import BaseModel
 
@@ -12,6 +11,8 @@ class IModifiedImageResponse(BaseModel):
 
 
 def modify_image(image: BytesIO):
+    from PIL import Image  # Slow to import, only the image uploads use it
+
     pil_image = Image.open(image)
     file_format = pil_image.format
 
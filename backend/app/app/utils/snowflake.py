@@ -1,6 +1,42 @@
+"""
+Snowflake IDs: 64-bit integers ordered by creation time.
+
+An ID is the milliseconds since API_EPOCH (41 bits), then a node id (10 bits,
+the process id and worker id fields) and a sequence number within the
+millisecond (12 bits). Each process generating IDs needs a node id of its
+own, so `SnowflakeGenerator` leases one from Redis:
+
+- A node id is taken with SET NX on `{prefix}:node:{id}` and a random token,
+  and renewed every `heartbeat_interval` seconds while the token is still
+  there. IDs are only generated while the lease is known to be held; after
+  `lease_ttl - heartbeat_interval` seconds without a renewal the generator
+  stops and leases a node id again.
+- Each renewal saves in `{prefix}:node:{id}:last` the last millisecond the
+  node may use until the renewed lease could end (`max_drift` included). The
+  next process leasing the node id starts after it, so a clock behind the
+  previous holder's never repeats its IDs. With synchronized clocks it is
+  already in the past by then, as the lease expires `heartbeat_interval`
+  seconds after the holder stops.
+
+The generator never sleeps the event loop. It keeps its own clock, which only
+moves forward: when the system clock goes back, or the 4096 IDs of a
+millisecond are used, it takes the next millisecond ahead of the system
+clock. Only when it is more than `max_drift` milliseconds ahead does
+`next_id` wait, asynchronously.
+
+`next_ids(n)` reserves n IDs at once, for bulk inserts.
+"""
+
+import asyncio
+import logging
 import os
+import random
 import time
-from collections.abc import Generator
+from uuid import uuid4
+from redis.asyncio import Redis
+from redis.exceptions import RedisError, WatchError
+
+logger = logging.getLogger(__name__)
 
 API_EPOCH = 1640995200000
 
@@ -14,6 +50,10 @@ worker_id_shift = sequence_bits
 timestamp_left_shift = sequence_bits + worker_id_bits + process_id_bits
 sequence_mask = -1 ^ (-1 << sequence_bits)
 
+# The process and worker ids together, leased as one node id
+node_id_shift = worker_id_shift
+max_node_id = (max_process_id << worker_id_bits) | max_worker_id
+
 
 def snowflake_to_timestamp(_id):
     _id = _id >> 22
@@ -22,38 +62,209 @@ def snowflake_to_timestamp(_id):
     return _id
 
 
-def generator(
-    worker_id: int = 1,
-    process_id: int = os.getpid() % 31,
-    sleep=lambda x: time.sleep(x),
-) -> Generator[int]:
-    assert 0 <= worker_id <= max_worker_id
-    assert 0 <= process_id <= max_process_id
-
-    last_timestamp = -1
-    sequence = 0
-
-    while True:
-        timestamp = int(time.time() * 1000)
-
-        if last_timestamp > timestamp:
-            sleep(last_timestamp - timestamp)
-            continue
-
-        if last_timestamp == timestamp:
-            sequence = (sequence + 1) & sequence_mask
-            if sequence == 0:
-                sequence = -1 & sequence_mask
-                sleep(1)
-                continue
-        else:
-            sequence = 0
-
-        last_timestamp = timestamp
-
-        yield (
-            ((timestamp - API_EPOCH) << timestamp_left_shift)
-            | (process_id << process_id_shift)
-            | (worker_id << worker_id_shift)
-            | sequence
+class NoNodeIdError(RuntimeError):
+    pass
+
+
+class SnowflakeGenerator:
+    def __init__(
+        self,
+        *,
+        prefix: str = "snowflake",
+        lease_ttl: float = 30.0,
+        heartbeat_interval: float = 10.0,
+        max_drift: int = 1000,
+        # Node ids checked per round trip when leasing
+        scan_size: int = 64,
+        # Last millisecond of a node kept after its lease, in seconds
+        last_ttl: int = 86400,
+    ):
+        self.prefix = prefix
+        self.lease_ttl = lease_ttl
+        self.heartbeat_interval = heartbeat_interval
+        self.max_drift = max_drift
+        self.scan_size = scan_size
+        self.last_ttl = last_ttl
+        self.redis: Redis | None = None
+        self.node_id: int | None = None
+        self._token: str | None = None
+        self._valid_until = 0.0
+        # Milliseconds since API_EPOCH of the last ID, and sequence numbers
+        # used in it
+        self._timestamp = -1
+        self._sequence = 0
+        self._lease_lock = asyncio.Lock()
+        self._heartbeat_task: asyncio.Task | None = None
+
+    def init(self, redis: Redis) -> None:
+        """
+        Leases node ids through `redis`. The first lease is taken on the first
+        ID.
+        """
+        self.redis = redis
+
+    async def close(self) -> None:
+        if self._heartbeat_task is not None:
+            self._heartbeat_task.cancel()
+            self._heartbeat_task = None
+        if self.redis is not None and self.node_id is not None:
+            try:
+                await self._release()
+            except RedisError:
+                logger.warning("Error releasing Snowflake node id", exc_info=True)
+        self.node_id = None
+        self._valid_until = 0.0
+        self.redis = None
+
+    def lease_key(self, node_id: int) -> str:
+        return f"{self.prefix}:node:{node_id}"
+
+    async def next_id(self) -> int:
+        (new_id,) = await self.next_ids(1)
+        return new_id
+
+    async def next_ids(self, n: int) -> list[int]:
+        """
+        n new IDs in increasing order, without awaiting Redis unless the node
+        id has to be leased.
+        """
+        if n <= 0:
+            return []
+        if time.monotonic() >= self._valid_until:
+            await self._lease()
+        ahead = self._timestamp - self._now()
+        if ahead > self.max_drift:
+            await asyncio.sleep((ahead - self.max_drift) / 1000)
+            if time.monotonic() >= self._valid_until:
+                await self._lease()
+        return self._reserve(n)
+
+    @staticmethod
+    def _now() -> int:
+        return time.time_ns() // 1_000_000 - API_EPOCH
+
+    def _reserve(self, n: int) -> list[int]:
+        now = self._now()
+        if now > self._timestamp:
+            self._timestamp, self._sequence = now, 0
+        node = self.node_id << node_id_shift
+        ids: list[int] = []
+        while n:
+            if self._sequence > sequence_mask:
+                self._timestamp, self._sequence = self._timestamp + 1, 0
+            count = min(n, sequence_mask + 1 - self._sequence)
+            first = (self._timestamp << timestamp_left_shift) | node | self._sequence
+            ids.extend(range(first, first + count))
+            self._sequence += count
+            n -= count
+        return ids
+
+    async def _lease(self) -> None:
+        async with self._lease_lock:
+            if time.monotonic() < self._valid_until:
+                return
+            if self.redis is None:
+                raise NoNodeIdError("SnowflakeGenerator.init was not called")
+            if self.node_id is not None and await self._renew():
+                return
+            await self._acquire()
+            if self._heartbeat_task is None or self._heartbeat_task.done():
+                self._heartbeat_task = asyncio.create_task(self._heartbeat())
+
+    async def _acquire(self) -> None:
+        # New for every lease, so forked processes never share one
+        self.node_id, self._token = None, uuid4().hex
+        first = random.randrange(max_node_id + 1)
+        for offset in range(0, max_node_id + 1, self.scan_size):
+            candidates = [
+                (first + offset + n) % (max_node_id + 1)
+                for n in range(min(self.scan_size, max_node_id + 1 - offset))
+            ]
+            leases = await self.redis.mget(
+                [self.lease_key(node_id) for node_id in candidates]
+            )
+            for node_id, lease in zip(candidates, leases, strict=True):
+                if lease is None and await self._try_acquire(node_id):
+                    logger.info("Leased Snowflake node id %s", node_id)
+                    return
+        self.node_id = None
+        raise NoNodeIdError("Every Snowflake node id is leased")
+
+    async def _try_acquire(self, node_id: int) -> bool:
+        pipeline = self.redis.pipeline(transaction=False)
+        pipeline.set(
+            self.lease_key(node_id), self._token, nx=True, px=int(self.lease_ttl * 1000)
+        )
+        pipeline.get(f"{self.lease_key(node_id)}:last")
+        acquired, last = await pipeline.execute()
+        if not acquired:
+            return False
+        self.node_id = node_id
+        self._timestamp = max(self._timestamp, int(last or -1))
+        self._sequence = sequence_mask + 1
+        # Saves the last millisecond of this lease before any ID
+        return await self._renew()
+
+    async def _renew(self) -> bool:
+        """
+        Extends the lease of the node id, and saves the last millisecond it
+        can use until then. False if the lease was lost.
+        """
+        key = self.lease_key(self.node_id)
+        started = time.monotonic()
+        valid_for = self.lease_ttl - self.heartbeat_interval
+        last = max(
+            self._timestamp, self._now() + int(valid_for * 1000) + self.max_drift
         )
+        async with self.redis.pipeline(transaction=True) as pipeline:
+            try:
+                await pipeline.watch(key)
+                if _as_str(await pipeline.get(key)) != self._token:
+                    return False
+                pipeline.multi()
+                pipeline.set(key, self._token, px=int(self.lease_ttl * 1000))
+                pipeline.set(f"{key}:last", last, ex=self.last_ttl)
+                await pipeline.execute()
+            except WatchError:
+                return False
+        self._valid_until = started + valid_for
+        return True
+
+    async def _release(self) -> None:
+        key = self.lease_key(self.node_id)
+        async with self.redis.pipeline(transaction=True) as pipeline:
+            try:
+                await pipeline.watch(key)
+                if _as_str(await pipeline.get(key)) != self._token:
+                    return
+                pipeline.multi()
+                pipeline.set(f"{key}:last", self._timestamp, ex=self.last_ttl)
+                pipeline.delete(key)
+                await pipeline.execute()
+            except WatchError:
+                pass
+
+    async def _heartbeat(self) -> None:
+        while True:
+            await asyncio.sleep(self.heartbeat_interval)
+            try:
+                if self.node_id is not None and not await self._renew():
+                    logger.warning("Lost the lease of Snowflake node %s", self.node_id)
+                    self._valid_until = 0.0
+            except Exception:
+                logger.warning("Error renewing Snowflake node id", exc_info=True)
+
+    def _after_fork(self) -> None:
+        # The lease belongs to the parent: the child leases its own node id
+        self.node_id, self._token, self._valid_until = None, None, 0.0
+        self._lease_lock = asyncio.Lock()
+        self._heartbeat_task = None
+
+
+def _as_str(value: str | bytes | None) -> str | None:
+    return value.decode() if isinstance(value, bytes) else value
+
+
+snowflake = SnowflakeGenerator()
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=snowflake._after_fork)
@@ -1,32 +1,168 @@
-from datetime import timedelta
+"""
+Token revocation.
+
+Access and refresh tokens carry a unique `jti` and a `ver` claim, the token
+version of the user when they were issued. A token is valid while:
+
+- its `ver` is the current token version of the user (0 when the user never
+  revoked tokens). Incrementing the version revokes every token of the user.
+- its `jti` has not been revoked. Revoked ids are kept until the token
+  expires.
+- its `type` claim is the type expected where it is used: a refresh token is
+  not an access token, although it has the same claims.
+
+A check is one Redis round trip, and Redis holds at most one counter per user
+plus the ids of revoked tokens that are not expired yet, however often users
+log in.
+
+Access tokens also carry the role of the user (`role`, its id) and `rver`,
+the role version of the user when they were issued. While `rver` is current
+the role claim is trusted, so role checks need no database query. Once a
+change of the role of a user is committed, `crud.user.update` and
+`crud.role.add_role_to_user` call `revoke_role_claims` with the Redis client
+their caller passes: its tokens stay valid but their role claim is ignored
+until a new access token is issued.
+
+Tokens issued before these claims existed were checked against a set of the
+user's tokens. They are still accepted if their set does not exist or has
+them, until they expire; the sets are never written anymore.
+"""
+
+import time
+from typing import Any
 from uuid import UUID
 from redis.asyncio import Redis
-from app.models.user_model import User
+from redis.asyncio.client import Pipeline
+from app.core.security import create_access_token, create_refresh_token
 from app.schemas.common_schema import TokenType
 
 
-async def add_token_to_redis(
+def token_version_key(user_id: UUID | str) -> str:
+    return f"user:{user_id}:token_version"
+
+
+def role_version_key(user_id: UUID | str) -> str:
+    return f"user:{user_id}:role_version"
+
+
+def revoked_token_key(jti: str) -> str:
+    return f"token:revoked:{jti}"
+
+
+# `type` claim of each token type
+TOKEN_TYPE_CLAIMS = {TokenType.ACCESS: "access", TokenType.REFRESH: "refresh"}
+
+
+def legacy_tokens_key(user_id: UUID | str, token_type: TokenType) -> str:
+    return f"user:{user_id}:{token_type}"
+
+
+async def get_token_version(redis_client: Redis, user_id: UUID | str) -> int:
+    return int(await redis_client.get(token_version_key(user_id)) or 0)
+
+
+def _revoke_user_tokens(pipeline: Pipeline, user_id: UUID | str) -> None:
+    pipeline.incr(token_version_key(user_id))
+    pipeline.delete(
+        legacy_tokens_key(user_id, TokenType.ACCESS),
+        legacy_tokens_key(user_id, TokenType.REFRESH),
+    )
+
+
+async def revoke_user_tokens(redis_client: Redis, user_id: UUID | str) -> int:
+    """
+    Revokes every token of the user. Returns the version for new tokens.
+    """
+    pipeline = redis_client.pipeline(transaction=True)
+    _revoke_user_tokens(pipeline, user_id)
+    version, _ = await pipeline.execute()
+    return version
+
+
+async def revoke_role_claims(redis_client: Redis, user_id: UUID | str) -> int:
+    """
+    Invalidates the role claim of every token of the user. Returns the role
+    version for new tokens.
+    """
+    return await redis_client.incr(role_version_key(user_id))
+
+
+async def create_tokens(
     redis_client: Redis,
-    user: User,
-    token: str,
-    token_type: TokenType,
-    expire_time: int | None = None,
-):
-    token_key = f"user:{user.id}:{token_type}"
-    valid_tokens = await get_valid_tokens(redis_client, user.id, token_type)
-    await redis_client.sadd(token_key, token)
-    if not valid_tokens:
-        await redis_client.expire(token_key, timedelta(minutes=expire_time))
-
-
-async def get_valid_tokens(redis_client: Redis, user_id: UUID, token_type: TokenType):
-    token_key = f"user:{user_id}:{token_type}"
-    valid_tokens = await redis_client.smembers(token_key)
-    return valid_tokens
-
-
-async def delete_tokens(redis_client: Redis, user: User, token_type: TokenType):
-    token_key = f"user:{user.id}:{token_type}"
-    valid_tokens = await redis_client.smembers(token_key)
-    if valid_tokens is not None:
-        await redis_client.delete(token_key)
+    user_id: UUID | str,
+    *,
+    role_id: UUID | str | None,
+    refresh: bool = True,
+    revoke: bool = False,
+) -> tuple[str, str | None]:
+    """
+    Access token and, if `refresh`, refresh token of the user, with its
+    current token version and, for the access token, its role `role_id`. With
+    `revoke`, every previous token of the user is revoked first. Either way it
+    is a single Redis round trip.
+    """
+    pipeline = redis_client.pipeline(transaction=revoke)
+    if revoke:
+        _revoke_user_tokens(pipeline, user_id)
+    else:
+        pipeline.get(token_version_key(user_id))
+    pipeline.get(role_version_key(user_id))
+    version, *_, role_version = await pipeline.execute()
+
+    access_token = create_access_token(
+        user_id,
+        version=int(version or 0),
+        role_id=role_id,
+        role_version=int(role_version or 0),
+    )
+    refresh_token = (
+        create_refresh_token(user_id, version=int(version or 0)) if refresh else None
+    )
+    return access_token, refresh_token
+
+
+async def revoke_token(redis_client: Redis, payload: dict[str, Any]) -> None:
+    """
+    Revokes a single token given its decoded payload.
+    """
+    ttl = int(payload["exp"] - time.time())
+    if "jti" in payload and ttl > 0:
+        await redis_client.set(revoked_token_key(payload["jti"]), 1, ex=ttl)
+
+
+async def check_token(
+    redis_client: Redis, token: str, payload: dict[str, Any], token_type: TokenType
+) -> tuple[bool, int]:
+    """
+    Whether a decoded token of type `token_type` has not been revoked, and the
+    current role version of its user. A token of another type is invalid.
+    """
+    if payload.get("type") != TOKEN_TYPE_CLAIMS[token_type]:
+        return False, 0
+    user_id = payload["sub"]
+    pipeline = redis_client.pipeline(transaction=False)
+    pipeline.get(token_version_key(user_id))
+    pipeline.get(role_version_key(user_id))
+    if "jti" in payload:
+        pipeline.exists(revoked_token_key(payload["jti"]))
+    else:
+        legacy_key = legacy_tokens_key(user_id, token_type)
+        pipeline.exists(legacy_key)
+        pipeline.sismember(legacy_key, token)
+    version, role_version, *checks = await pipeline.execute()
+    role_version = int(role_version or 0)
+
+    if payload.get("ver", 0) != int(version or 0):
+        return False, role_version
+    if "jti" in payload:
+        (is_revoked,) = checks
+        return not is_revoked, role_version
+    has_legacy_tokens, is_legacy_token = checks
+    return not has_legacy_tokens or bool(is_legacy_token), role_version
+
+
+def has_current_role(payload: dict[str, Any], role_version: int) -> bool:
+    """
+    Whether the role claim of a checked access token can be trusted.
+    """
+    return "rver" in payload and payload["rver"] == role_version
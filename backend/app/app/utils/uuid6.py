@@ -6,7 +6,10 @@ https://github.com/uuid6/uuid6-ietf-draft.
 Repo: https://github.com/oittaa/uuid6-python
 """
 
+import os
 import secrets
+import struct
+import threading
 import time
 import uuid
 
@@ -76,7 +79,6 @@ def _subsec_encode(value: int) -> int:
 
 
 _last_v6_timestamp = None
-_last_v7_timestamp = None
 
 
 def uuid6(clock_seq: int = None) -> UUID:
@@ -108,6 +110,101 @@ def uuid6(clock_seq: int = None) -> UUID:
     return UUID(int=uuid_int, version=6)
 
 
+_new_object = object.__new__
+_set_attribute = object.__setattr__
+_SAFE_UNKNOWN = uuid.SafeUUID.unknown
+
+
+def _from_int(value: int) -> UUID:
+    # UUID(int=...) without the checks, for values built with the version and
+    # variant bits already set
+    new = _new_object(UUID)
+    _set_attribute(new, "int", value)
+    _set_attribute(new, "is_safe", _SAFE_UNKNOWN)
+    return new
+
+
+_V7_VERSION_AND_VARIANT = 0x7 << 76 | 0b10 << 62
+
+
+def _uuid7_int(step: int, random: int) -> int:
+    # ms (48) | version (4) | subsec_a (12) | variant (2) | subsec_b (8) |
+    # random (54), from a step of 2**-20 ms and 64 random bits
+    return (
+        (step >> 20 & 0xFFFFFFFFFFFF) << 80
+        | (step >> 8 & 0xFFF) << 64
+        | (step & 0xFF) << 54
+        | random >> 10
+        | _V7_VERSION_AND_VARIANT
+    )
+
+
+class UUID7Generator:
+    r"""Thread-safe UUIDv7 generator.
+
+    IDs have the layout of uuid7() below: 48 bits of Unix milliseconds, 20
+    bits of sub-millisecond fraction and 54 random bits. The milliseconds and
+    the fraction are one 68-bit counter of steps of 2**-20 ms (~0.95 us),
+    which only moves forward: each ID takes the current time or the step
+    after the previous ID, so the IDs of a process are strictly increasing.
+    IDs of different processes are told apart by their random bits, which
+    come from os.urandom in bulk and are dropped on fork."""
+
+    # Random values drawn at once for the scalar path
+    POOL_SIZE = 512
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._last_step = -1
+        self._pool: list[int] = []
+
+    def _reserve(self, n: int) -> int:
+        # First of n consecutive steps, at least the current time. The caller
+        # holds the lock.
+        now = time.time_ns()
+        milliseconds, nanoseconds = divmod(now, 10**6)
+        step = max(
+            milliseconds << 20 | _subsec_encode(nanoseconds), self._last_step + 1
+        )
+        self._last_step = step + n - 1
+        return step
+
+    @staticmethod
+    def _random_values(n: int) -> tuple[int, ...]:
+        return struct.unpack(f">{n}Q", os.urandom(8 * n))
+
+    def uuid7(self) -> UUID:
+        with self._lock:
+            step = self._reserve(1)
+            if not self._pool:
+                self._pool = list(self._random_values(self.POOL_SIZE))
+            random = self._pool.pop()
+        return _from_int(_uuid7_int(step, random))
+
+    def uuid7_batch(self, n: int) -> list[UUID]:
+        r"""n increasing UUIDv7 from a single clock read and random buffer."""
+        if n <= 0:
+            return []
+        with self._lock:
+            first = self._reserve(n)
+        return [
+            _from_int(_uuid7_int(step, random))
+            for step, random in zip(
+                range(first, first + n), self._random_values(n), strict=True
+            )
+        ]
+
+    def _after_fork(self) -> None:
+        # The child must not reuse the random values of the parent
+        self._lock = threading.Lock()
+        self._pool = []
+
+
+_uuid7_generator = UUID7Generator()
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_uuid7_generator._after_fork)
+
+
 def uuid7() -> UUID:
     r"""UUID version 7 features a time-ordered value field derived from the
     widely implemented and well known Unix Epoch timestamp source, the
@@ -117,19 +214,10 @@ def uuid7() -> UUID:
     Implementations SHOULD utilize UUID version 7 over UUID version 1 and
     6 if possible."""
 
-    global _last_v7_timestamp
+    return _uuid7_generator.uuid7()
 
-    nanoseconds = time.time_ns()
-    if _last_v7_timestamp is not None and nanoseconds <= _last_v7_timestamp:
-        nanoseconds = _last_v7_timestamp + 1
-    _last_v7_timestamp = nanoseconds
-    timestamp_ms, timestamp_ns = divmod(nanoseconds, 10**6)
-    subsec = _subsec_encode(timestamp_ns)
-    subsec_a = subsec >> 8
-    subsec_b = subsec & 0xFF
-    rand = secrets.randbits(54)
-    uuid_int = (timestamp_ms & 0xFFFFFFFFFFFF) << 80
-    uuid_int |= subsec_a << 64
-    uuid_int |= subsec_b << 54
-    uuid_int |= rand
-    return UUID(int=uuid_int, version=7)
+
+def uuid7_batch(n: int) -> list[UUID]:
+    r"""n UUIDv7, in increasing order, generated together."""
+
+    return _uuid7_generator.uuid7_batch(n)
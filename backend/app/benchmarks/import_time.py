@@ -0,0 +1,130 @@
+"""
+Cold start: import time of the app by package, and time to the first request.
+
+Imports `--module` in `--runs` fresh interpreters with `-X importtime`, and
+prints the median total and the packages that take the longest, by the
+self time of their modules (a package's own time, not that of what it
+imports). `--tree` prints the modules above `--min-ms` with their
+cumulative time, each under the module that imported it first.
+
+With `--serve`, it also starts uvicorn `--runs` times and prints the median
+time from the start of the process to its first response to `GET --path`,
+the lifespan startup included.
+
+Run from backend/app, with the settings of the app in the environment and,
+for `--serve`, the database and Redis up:
+
+    python -m benchmarks.import_time --runs 5 --serve
+"""
+
+import argparse
+import os
+import re
+import socket
+import statistics
+import subprocess
+import sys
+import time
+import urllib.request
+from collections import defaultdict
+
+LINE = re.compile(r"import time:\s+(\d+) \|\s+(\d+) \| ( *)(\S+)")
+
+
+def import_times(module: str) -> list[tuple[str, int, int, int]]:
+    """
+    (module, self µs, cumulative µs, depth) of every module imported by
+    `module` in a new interpreter, in the order -X importtime reports them.
+    """
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True,
+        text=True,
+    )
+    if result.returncode:
+        raise RuntimeError(f"Importing {module} failed:\n{result.stderr[-2000:]}")
+    return [
+        (name, int(own), int(cumulative), len(indent) // 2)
+        for own, cumulative, indent, name in LINE.findall(result.stderr)
+    ]
+
+
+def print_imports(module: str, runs: int, top: int, tree: bool, min_ms: float) -> None:
+    totals = []
+    by_package: dict[str, list[int]] = defaultdict(list)
+    for _ in range(runs):
+        times = import_times(module)
+        totals.append(next(c for name, _, c, _ in times if name == module))
+        package_times: dict[str, int] = defaultdict(int)
+        for name, own, _, _ in times:
+            package_times[name.split(".")[0]] += own
+        for package, own in package_times.items():
+            by_package[package].append(own)
+
+    print(f"import {module}: {statistics.median(totals) / 1000:.0f} ms (median)")
+    print(f"{'package':<28} {'self ms':>8}")
+    medians = {
+        p: statistics.median(t + [0] * (runs - len(t))) for p, t in by_package.items()
+    }
+    for package, own in sorted(medians.items(), key=lambda item: -item[1])[:top]:
+        print(f"{package:<28} {own / 1000:8.1f}")
+
+    if tree:
+        print(f"\nModules over {min_ms} ms, cumulative:")
+        # -X importtime reports a module after what it imports
+        for name, _, cumulative, depth in reversed(times):
+            if cumulative >= min_ms * 1000:
+                print(f"{cumulative / 1000:8.1f} {'  ' * depth}{name}")
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def first_request(app: str, path: str, timeout: float) -> float:
+    port = _free_port()
+    start = time.perf_counter()
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", app, "--port", str(port)],
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+        env=os.environ,
+    )
+    try:
+        while time.perf_counter() - start < timeout:
+            if server.poll() is not None:
+                raise RuntimeError(f"uvicorn exited with {server.returncode}")
+            try:
+                with urllib.request.urlopen(f"http://127.0.0.1:{port}{path}"):
+                    return time.perf_counter() - start
+            except OSError:
+                time.sleep(0.01)
+        raise RuntimeError(f"No response in {timeout}s")
+    finally:
+        server.terminate()
+        server.wait()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--module", default="app.main")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--top", type=int, default=20)
+    parser.add_argument("--tree", action="store_true")
+    parser.add_argument("--min-ms", type=float, default=20)
+    parser.add_argument("--serve", action="store_true")
+    parser.add_argument("--app", default="app.main:app")
+    parser.add_argument("--path", default="/metrics")
+    parser.add_argument("--timeout", type=float, default=60)
+    args = parser.parse_args()
+    print_imports(args.module, args.runs, args.top, args.tree, args.min_ms)
+    if args.serve:
+        startups = [
+            first_request(args.app, args.path, args.timeout) for _ in range(args.runs)
+        ]
+        print(
+            f"\nFirst response to GET {args.path}:"
+            f" {statistics.median(startups) * 1000:.0f} ms (median of {args.runs})"
+        )
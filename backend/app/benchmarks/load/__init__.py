@@ -0,0 +1,6 @@
+"""
+Load tests of a running app: scenario mixes over HTTP and the chat websocket.
+
+`scenarios` has what the virtual users do, `stats` measures it and compares
+runs with a saved baseline. Run it with `python -m benchmarks.load`.
+"""
@@ -0,0 +1,159 @@
+"""
+Load test of a running app: throughput, latency percentiles and error rates
+of scenario mixes.
+
+Each scenario of `--scenarios` gets `--users` virtual users, each running it
+in a loop for `--duration` seconds, with a random pause of `--think-ms` on
+average between iterations. All the scenarios run at the same time:
+
+- login: login storm, each login followed by the profile.
+- refresh: refresh storm, new access tokens from the refresh token.
+- browse: `--pages` pages of heroes, teams, groups, follows and users.
+- follow: bursts of `--burst` follows, then as many unfollows.
+- report: CSV exports of users and heroes, as the admin.
+- chat: `--messages` messages per websocket conversation, timed until the
+  bot's answer. Start the app with CHAT_PROVIDER=mock and
+  MOCK_LLM_LATENCY_MS to simulate the LLM.
+
+Run from backend/app, against the app started with the same settings:
+
+    MODE=production CHAT_PROVIDER=mock MOCK_LLM_LATENCY_MS=300 \\
+        uvicorn app.main:app --port 8000
+    python -m benchmarks.load --url http://localhost:8000 --users 20 \\
+        --duration 60 --save baseline.json
+
+and after a change, `--compare baseline.json` instead of `--save`: it exits
+with 1 if an operation regressed by more than `--tolerance`. Baselines keep
+the commit and the options of their run. The virtual users,
+loadtest-{n}@example.com, are registered on the first run and kept.
+"""
+
+import argparse
+import asyncio
+import random
+import sys
+import time
+
+import httpx
+
+from app.core.config import settings
+from benchmarks.load.scenarios import SCENARIOS, LoadTest, Scenario, VirtualUser
+from benchmarks.load.stats import Stats, compare, print_summary, save_baseline
+
+
+async def run_user(
+    test: LoadTest,
+    scenario: Scenario,
+    user: VirtualUser,
+    deadline: float,
+    think: float,
+) -> None:
+    # Spread the first iterations, so the users do not start in lockstep
+    await asyncio.sleep(random.uniform(0, think))
+    while time.monotonic() < deadline:
+        await scenario(test, user)
+        await asyncio.sleep(random.uniform(0, 2 * think))
+
+
+async def main(
+    url: str,
+    scenarios: list[str],
+    options: dict,
+    timeout: float,
+    save: str | None,
+    baseline: str | None,
+    tolerance: float,
+) -> int:
+    stats = Stats()
+    async with httpx.AsyncClient(
+        base_url=f"{url}{settings.API_V1_STR}",
+        timeout=timeout,
+        limits=httpx.Limits(max_connections=None, max_keepalive_connections=None),
+    ) as client:
+        test = LoadTest(
+            client,
+            "ws" + url.removeprefix("http"),
+            stats,
+            pages=options["pages"],
+            burst=options["burst"],
+            messages=options["messages"],
+            timeout=timeout,
+        )
+        users = options["users"]
+        await test.set_up(users * len(scenarios))
+        print(
+            f"{len(scenarios)} scenarios × {users} users"
+            f" for {options['duration']}s against {url}"
+        )
+        deadline = time.monotonic() + options["duration"]
+        stats.start()
+        await asyncio.gather(
+            *(
+                run_user(
+                    test,
+                    SCENARIOS[name],
+                    test.users[n * users + i],
+                    deadline,
+                    options["think_ms"] / 1000,
+                )
+                for n, name in enumerate(scenarios)
+                for i in range(users)
+            )
+        )
+        stats.stop()
+
+    summary = stats.summary()
+    print_summary(summary)
+    if save:
+        save_baseline(save, summary, options)
+    if baseline:
+        regressions = compare(baseline, summary, options, tolerance)
+        if regressions:
+            print(f"{len(regressions)} regressions")
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--url", default="http://localhost:8000")
+    parser.add_argument(
+        "--scenarios", default=",".join(SCENARIOS), help="comma-separated"
+    )
+    parser.add_argument("--users", type=int, default=10, help="per scenario")
+    parser.add_argument("--duration", type=float, default=30)
+    parser.add_argument("--think-ms", type=float, default=100)
+    parser.add_argument("--pages", type=int, default=3)
+    parser.add_argument("--burst", type=int, default=5)
+    parser.add_argument("--messages", type=int, default=3)
+    parser.add_argument("--timeout", type=float, default=30)
+    parser.add_argument("--save", metavar="BASELINE")
+    parser.add_argument("--compare", metavar="BASELINE")
+    parser.add_argument("--tolerance", type=float, default=0.2)
+    args = parser.parse_args()
+    scenarios = args.scenarios.split(",")
+    unknown = set(scenarios) - set(SCENARIOS)
+    if unknown:
+        parser.error(f"unknown scenarios: {', '.join(sorted(unknown))}")
+    options = {
+        "scenarios": scenarios,
+        "users": args.users,
+        "duration": args.duration,
+        "think_ms": args.think_ms,
+        "pages": args.pages,
+        "burst": args.burst,
+        "messages": args.messages,
+    }
+    sys.exit(
+        asyncio.run(
+            main(
+                args.url.rstrip("/"),
+                scenarios,
+                options,
+                args.timeout,
+                args.save,
+                args.compare,
+                args.tolerance,
+            )
+        )
+    )
@@ -0,0 +1,326 @@
+"""
+What the virtual users of a load test do.
+
+A scenario is a coroutine running one iteration for a user, recording each
+of its requests as an operation; the runner calls it in a loop. The users
+are accounts registered for the test, loadtest-{n}@example.com, and the
+admin is the first superuser, for the admin-only endpoints.
+"""
+
+import asyncio
+import json
+import random
+import time
+from collections.abc import Awaitable, Callable, Collection
+from typing import Any
+
+import httpx
+from websockets.asyncio.client import connect
+from websockets.exceptions import WebSocketException
+
+from app.core.config import settings
+from benchmarks.load.stats import Stats
+
+PASSWORD = "load-test-password"
+
+CHAT_MESSAGES = (
+    "What can you tell me about the heroes of my team?",
+    "Summarize our last conversation.",
+    "Which groups should I join?",
+    "How do I export the list of heroes?",
+)
+
+
+class VirtualUser:
+    __slots__ = ("email", "password", "id", "access_token", "refresh_token")
+
+    def __init__(self, email: str, password: str) -> None:
+        self.email = email
+        self.password = password
+        self.id: str | None = None
+        self.access_token: str | None = None
+        self.refresh_token: str | None = None
+
+    @property
+    def headers(self) -> dict[str, str]:
+        return {"Authorization": f"Bearer {self.access_token}"}
+
+
+class LoadTest:
+    """
+    The HTTP client, users and options shared by the scenarios of a run.
+    """
+
+    def __init__(
+        self,
+        client: httpx.AsyncClient,
+        ws_url: str,
+        stats: Stats,
+        *,
+        pages: int,
+        burst: int,
+        messages: int,
+        timeout: float,
+    ) -> None:
+        self.client = client
+        self.ws_url = ws_url
+        self.stats = stats
+        self.pages = pages
+        self.burst = burst
+        self.messages = messages
+        self.timeout = timeout
+        self.users: list[VirtualUser] = []
+        self.admin: VirtualUser | None = None
+
+    async def request(
+        self,
+        scenario: str,
+        operation: str,
+        method: str,
+        url: str,
+        *,
+        user: VirtualUser | None = None,
+        expected: Collection[int] = (200,),
+        **kwargs: Any,
+    ) -> httpx.Response | None:
+        """
+        Sends a request as `user` and records it. The response, or None if it
+        failed.
+        """
+        headers = user.headers if user is not None else None
+        start = time.perf_counter()
+        try:
+            response = await self.client.request(method, url, headers=headers, **kwargs)
+        except httpx.HTTPError as exc:
+            self.stats.record(
+                scenario, operation, time.perf_counter() - start, type(exc).__name__
+            )
+            return None
+        elapsed = time.perf_counter() - start
+        if response.status_code not in expected:
+            self.stats.record(scenario, operation, elapsed, str(response.status_code))
+            return None
+        self.stats.record(scenario, operation, elapsed)
+        return response
+
+    async def sign_in(self, user: VirtualUser) -> None:
+        response = await self.client.post(
+            "/login", json={"email": user.email, "password": user.password}
+        )
+        if response.status_code != 200:
+            raise RuntimeError(
+                f"Login of {user.email} failed: {response.status_code}"
+                f" {response.text}"
+            )
+        data = response.json()["data"]
+        user.id = data["user"]["id"]
+        user.access_token = data["access_token"]
+        user.refresh_token = data["refresh_token"]
+
+    async def register(self, index: int) -> VirtualUser:
+        user = VirtualUser(f"loadtest-{index}@example.com", PASSWORD)
+        response = await self.client.post(
+            "/login/register",
+            json={
+                "first_name": "Load",
+                "last_name": f"Test {index}",
+                "email": user.email,
+                "password": user.password,
+            },
+        )
+        # 409: registered by an earlier run
+        if response.status_code not in (201, 409):
+            raise RuntimeError(
+                f"Registration of {user.email} failed: {response.status_code}"
+                f" {response.text}"
+            )
+        await self.sign_in(user)
+        return user
+
+    async def set_up(self, users: int, concurrency: int = 10) -> None:
+        """
+        Signs in the admin and `users` virtual users, registering them first
+        if needed.
+        """
+        self.admin = VirtualUser(
+            settings.FIRST_SUPERUSER_EMAIL, settings.FIRST_SUPERUSER_PASSWORD
+        )
+        await self.sign_in(self.admin)
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def register(index: int) -> VirtualUser:
+            async with semaphore:
+                return await self.register(index)
+
+        self.users = list(await asyncio.gather(*map(register, range(users))))
+
+
+async def login(test: LoadTest, user: VirtualUser) -> None:
+    """
+    A login storm: signs in, then loads the profile with the new token.
+    """
+    response = await test.request(
+        "login",
+        "POST /login",
+        "POST",
+        "/login",
+        json={"email": user.email, "password": user.password},
+    )
+    if response is None:
+        return
+    user.access_token = response.json()["data"]["access_token"]
+    await test.request("login", "GET /user", "GET", "/user", user=user)
+
+
+async def refresh(test: LoadTest, user: VirtualUser) -> None:
+    """
+    A refresh storm: a new access token from the refresh token of the user,
+    then the profile with it.
+    """
+    response = await test.request(
+        "refresh",
+        "POST /new_access_token",
+        "POST",
+        "/login/new_access_token",
+        json={"refresh_token": user.refresh_token},
+        expected=(201,),
+    )
+    if response is None:
+        return
+    user.access_token = response.json()["data"]["access_token"]
+    await test.request("refresh", "GET /user", "GET", "/user", user=user)
+
+
+BROWSED_LISTS = ("/hero", "/team", "/group", "/user/following", "/user/followers")
+
+
+async def browse(test: LoadTest, user: VirtualUser) -> None:
+    """
+    Goes through up to `pages` pages of the lists a user sees, and of the
+    users list as the admin.
+    """
+    for path, as_user in (
+        *((path, user) for path in BROWSED_LISTS),
+        ("/user/list", test.admin),
+    ):
+        page: int | None = 1
+        while page is not None and page <= test.pages:
+            response = await test.request(
+                "browse",
+                f"GET {path}",
+                "GET",
+                path,
+                user=as_user,
+                params={"page": page, "size": 20},
+            )
+            if response is None:
+                break
+            page = response.json()["data"]["next_page"]
+
+
+async def follow(test: LoadTest, user: VirtualUser) -> None:
+    """
+    A burst of follows of other virtual users, at once, then of unfollows.
+    """
+    others = [other for other in test.users if other is not user]
+    targets = random.sample(others, min(test.burst, len(others)))
+    followed = await asyncio.gather(
+        *(
+            test.request(
+                "follow",
+                "PUT /following/{id}",
+                "PUT",
+                f"/user/following/{target.id}",
+                user=user,
+                # 409: followed in an interrupted run, unfollowed below
+                expected=(200, 409),
+            )
+            for target in targets
+        )
+    )
+    await asyncio.gather(
+        *(
+            test.request(
+                "follow",
+                "DELETE /following/{id}",
+                "DELETE",
+                f"/user/following/{target.id}",
+                user=user,
+            )
+            for target, response in zip(targets, followed, strict=True)
+            if response is not None
+        )
+    )
+
+
+async def report(test: LoadTest, user: VirtualUser) -> None:
+    """
+    Exports the users and heroes lists as CSV, as the admin.
+    """
+    for path in ("/report/users_list", "/report/heroes_list"):
+        await test.request(
+            "report",
+            f"GET {path}",
+            "GET",
+            path,
+            user=test.admin,
+            params={"file_extension": "csv"},
+        )
+
+
+async def chat(test: LoadTest, user: VirtualUser) -> None:
+    """
+    A conversation on the chat websocket: connects, then sends `messages`
+    messages one after the other, each timed until the bot's "end" frame.
+    The server allows 200 messages a day per user.
+    """
+    operation = "connect"
+    start = time.perf_counter()
+    try:
+        async with connect(
+            f"{test.ws_url}/chat/{user.id}",
+            additional_headers=user.headers,
+            open_timeout=test.timeout,
+        ) as websocket:
+            test.stats.record("chat", operation, time.perf_counter() - start)
+            session_id = None
+            for _ in range(test.messages):
+                operation = "message"
+                start = time.perf_counter()
+                await websocket.send(
+                    json.dumps(
+                        {
+                            "message": random.choice(CHAT_MESSAGES),
+                            "session_id": session_id,
+                        }
+                    )
+                )
+                while True:
+                    frame = json.loads(
+                        await asyncio.wait_for(websocket.recv(), test.timeout)
+                    )
+                    if frame["type"] in ("end", "error"):
+                        break
+                elapsed = time.perf_counter() - start
+                if frame["type"] == "error":
+                    test.stats.record("chat", operation, elapsed, "error frame")
+                    return
+                test.stats.record("chat", operation, elapsed)
+                session_id = frame["session_id"]
+    except (OSError, TimeoutError, WebSocketException, ValueError) as exc:
+        # ValueError: a frame that is not JSON, the error of an unknown user
+        test.stats.record(
+            "chat", operation, time.perf_counter() - start, type(exc).__name__
+        )
+
+
+Scenario = Callable[[LoadTest, VirtualUser], Awaitable[None]]
+
+SCENARIOS: dict[str, Scenario] = {
+    "login": login,
+    "refresh": refresh,
+    "browse": browse,
+    "follow": follow,
+    "report": report,
+    "chat": chat,
+}
@@ -0,0 +1,186 @@
+"""
+Latencies and errors of the operations of a load test, and baselines to
+compare runs across commits.
+
+A baseline is the JSON summary of a run with the commit it ran on and its
+options. Compared with it, an operation regresses when its p95 latency is
+more than `tolerance` higher (and at least LATENCY_FLOOR_MS), its throughput
+more than `tolerance` lower, or its error rate more than ERROR_RATE_MARGIN
+higher.
+"""
+
+import json
+import os
+import statistics
+import subprocess
+import time
+from collections import Counter
+from datetime import datetime, timezone
+from typing import Any
+
+LATENCY_FLOOR_MS = 5.0
+ERROR_RATE_MARGIN = 0.01
+
+
+class OperationStats:
+    __slots__ = ("latencies", "errors")
+
+    def __init__(self) -> None:
+        self.latencies: list[float] = []
+        # Failed requests by reason: status code or exception name
+        self.errors: Counter[str] = Counter()
+
+    def summary(self, elapsed: float) -> dict[str, Any]:
+        latencies = sorted(self.latencies)
+        requests = len(latencies)
+        errors = sum(self.errors.values())
+        if requests > 1:
+            percentiles = statistics.quantiles(latencies, n=100, method="inclusive")
+        else:
+            percentiles = latencies * 99 or [0.0] * 99
+        return {
+            "requests": requests,
+            "throughput": round((requests - errors) / elapsed, 2) if elapsed else 0,
+            "error_rate": round(errors / requests, 4) if requests else 0,
+            "errors": dict(self.errors.most_common()),
+            **{
+                f"p{q}_ms": round(percentiles[q - 1] * 1000, 2)
+                for q in (50, 90, 95, 99)
+            },
+            "max_ms": round(latencies[-1] * 1000, 2) if latencies else 0,
+        }
+
+
+class Stats:
+    def __init__(self) -> None:
+        self.operations: dict[tuple[str, str], OperationStats] = {}
+        self.started: float | None = None
+        self.elapsed = 0.0
+
+    def start(self) -> None:
+        self.started = time.perf_counter()
+
+    def stop(self) -> None:
+        self.elapsed = time.perf_counter() - self.started
+
+    def record(
+        self, scenario: str, operation: str, seconds: float, error: str | None = None
+    ) -> None:
+        """
+        Records a request of the run. Requests before `start` are the set-up's
+        and are not recorded.
+        """
+        if self.started is None:
+            return
+        stats = self.operations.get((scenario, operation))
+        if stats is None:
+            stats = self.operations[scenario, operation] = OperationStats()
+        stats.latencies.append(seconds)
+        if error is not None:
+            stats.errors[error] += 1
+
+    def summary(self) -> dict[str, dict[str, dict[str, Any]]]:
+        """
+        Scenario, then operation, to its throughput (successful requests per
+        second), error rate and latency percentiles.
+        """
+        summary: dict[str, dict[str, dict[str, Any]]] = {}
+        for (scenario, operation), stats in sorted(self.operations.items()):
+            summary.setdefault(scenario, {})[operation] = stats.summary(self.elapsed)
+        return summary
+
+
+def print_summary(summary: dict[str, dict[str, dict[str, Any]]]) -> None:
+    print(
+        f"{'scenario':<10} {'operation':<22} {'requests':>8} {'req/s':>8}"
+        f" {'errors':>7} {'p50':>8} {'p90':>8} {'p95':>8} {'p99':>8} {'max':>8}"
+    )
+    for scenario, operations in summary.items():
+        for operation, row in operations.items():
+            print(
+                f"{scenario:<10} {operation:<22} {row['requests']:>8}"
+                f" {row['throughput']:>8.1f} {row['error_rate']:>7.1%}"
+                + "".join(
+                    f" {row[key]:>8.1f}"
+                    for key in ("p50_ms", "p90_ms", "p95_ms", "p99_ms", "max_ms")
+                )
+            )
+            if row["errors"]:
+                reasons = ", ".join(f"{r} × {n}" for r, n in row["errors"].items())
+                print(f"{'':<10} {'':<22} errors: {reasons}")
+    print("Latencies in milliseconds")
+
+
+def git_commit() -> str | None:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True,
+            check=True,
+            cwd=os.path.dirname(__file__),
+            text=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def save_baseline(path: str, summary: dict[str, Any], options: dict[str, Any]) -> None:
+    baseline = {
+        "commit": git_commit(),
+        "created_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "options": options,
+        "scenarios": summary,
+    }
+    with open(path, "w") as file:
+        json.dump(baseline, file, indent=2)
+        file.write("\n")
+    print(f"Baseline saved to {path}")
+
+
+def compare(
+    path: str, summary: dict[str, Any], options: dict[str, Any], tolerance: float
+) -> list[str]:
+    """
+    Prints the changes from the baseline at `path` and returns the
+    regressions.
+    """
+    with open(path) as file:
+        baseline = json.load(file)
+    print(f"\nCompared with {path} (commit {baseline['commit']}):")
+    if baseline["options"] != options:
+        print(f"  The options differ: {baseline['options']}")
+    regressions = []
+    for scenario, operations in summary.items():
+        for operation, row in operations.items():
+            before = baseline["scenarios"].get(scenario, {}).get(operation)
+            name = f"{scenario} {operation}"
+            if before is None:
+                print(f"  {name}: not in the baseline")
+                continue
+            problems = []
+            if (
+                row["p95_ms"] > before["p95_ms"] * (1 + tolerance)
+                and row["p95_ms"] - before["p95_ms"] >= LATENCY_FLOOR_MS
+            ):
+                problems.append("p95")
+            if row["throughput"] < before["throughput"] * (1 - tolerance):
+                problems.append("throughput")
+            if row["error_rate"] > before["error_rate"] + ERROR_RATE_MARGIN:
+                problems.append("error rate")
+            print(
+                f"  {name}: p95 {before['p95_ms']:.1f} -> {row['p95_ms']:.1f} ms"
+                f" ({_change(before['p95_ms'], row['p95_ms'])}),"
+                f" req/s {before['throughput']:.1f} -> {row['throughput']:.1f}"
+                f" ({_change(before['throughput'], row['throughput'])}),"
+                f" errors {before['error_rate']:.1%} -> {row['error_rate']:.1%}"
+                + (f"  REGRESSION: {', '.join(problems)}" if problems else "")
+            )
+            if problems:
+                regressions.append(f"{name}: {', '.join(problems)}")
+    return regressions
+
+
+def _change(before: float, after: float) -> str:
+    if not before:
+        return "n/a"
+    return f"{(after - before) / before:+.0%}"
@@ -0,0 +1,114 @@
+"""
+Latency of the Redis token bookkeeping of a login: per-token sets vs versions.
+
+The sets path is what login did before tokens had a version: read the access
+and refresh token sets of the user and add the new tokens to them (SMEMBERS,
+SMEMBERS again and SADD per token type, six round trips once the sets exist).
+The version path is `create_tokens`, one round trip.
+
+Run from backend/app with Redis up:
+
+    python -m benchmarks.login_tokens --logins 2000 --rtt-ms 1
+
+`--rtt-ms` adds a delay before every command sent, to approximate a Redis
+that is not on localhost. The keys are deleted at the end.
+"""
+
+import argparse
+import asyncio
+import statistics
+import time
+from collections.abc import Awaitable, Callable
+from datetime import timedelta
+from uuid import UUID, uuid4
+from redis.asyncio import Connection, ConnectionPool, Redis
+from app import models  # noqa: F401, the schemas import needs the models first
+from app.core.config import settings
+from app.core.security import create_access_token, create_refresh_token
+from app.schemas.common_schema import TokenType
+from app.utils.token import create_tokens, legacy_tokens_key, token_version_key
+
+USERS = 100
+
+
+class DelayedConnection(Connection):
+    rtt = 0.0
+
+    async def send_packed_command(self, *args, **kwargs) -> None:
+        await asyncio.sleep(self.rtt)
+        await super().send_packed_command(*args, **kwargs)
+
+
+async def sets_login(redis_client: Redis, user_id: UUID) -> None:
+    access_token = create_access_token(user_id)
+    refresh_token = create_refresh_token(user_id)
+    for token_type, token, minutes in (
+        (TokenType.ACCESS, access_token, settings.ACCESS_TOKEN_EXPIRE_MINUTES),
+        (TokenType.REFRESH, refresh_token, settings.REFRESH_TOKEN_EXPIRE_MINUTES),
+    ):
+        key = legacy_tokens_key(user_id, token_type)
+        if await redis_client.smembers(key):
+            valid_tokens = await redis_client.smembers(key)
+            await redis_client.sadd(key, token)
+            if not valid_tokens:
+                await redis_client.expire(key, timedelta(minutes=minutes))
+
+
+async def version_login(redis_client: Redis, user_id: UUID) -> None:
+    await create_tokens(redis_client, user_id, role_id=None)
+
+
+async def measure(
+    redis_client: Redis,
+    login: Callable[[Redis, UUID], Awaitable[None]],
+    user_ids: list[UUID],
+    logins: int,
+) -> list[float]:
+    latencies = []
+    for number in range(logins):
+        start = time.perf_counter()
+        await login(redis_client, user_ids[number % len(user_ids)])
+        latencies.append((time.perf_counter() - start) * 1000)
+    return latencies
+
+
+async def main(logins: int, rtt_ms: float) -> None:
+    DelayedConnection.rtt = rtt_ms / 1000
+    pool = ConnectionPool(
+        connection_class=DelayedConnection,
+        host=settings.REDIS_HOST,
+        port=settings.REDIS_PORT,
+        decode_responses=True,
+    )
+    redis_client = Redis(connection_pool=pool)
+    user_ids = [uuid4() for _ in range(USERS)]
+    # Users that changed their password once, so both paths do all their work
+    for user_id in user_ids:
+        await redis_client.incr(token_version_key(user_id))
+        for token_type in TokenType:
+            await redis_client.sadd(legacy_tokens_key(user_id, token_type), "token")
+    try:
+        print(f"{logins} logins of {USERS} users, {rtt_ms}ms added per command")
+        for name, login in (("sets", sets_login), ("version", version_login)):
+            latencies = await measure(redis_client, login, user_ids, logins)
+            p50 = statistics.median(latencies)
+            p99 = statistics.quantiles(latencies, n=100)[98]
+            print(f"{name:>8}: p50 {p50:7.3f}ms  p99 {p99:7.3f}ms")
+    finally:
+        await redis_client.delete(
+            *(token_version_key(user_id) for user_id in user_ids),
+            *(
+                legacy_tokens_key(user_id, token_type)
+                for user_id in user_ids
+                for token_type in TokenType
+            ),
+        )
+        await redis_client.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--logins", type=int, default=2000)
+    parser.add_argument("--rtt-ms", type=float, default=0.0)
+    args = parser.parse_args()
+    asyncio.run(main(args.logins, args.rtt_ms))
@@ -0,0 +1,109 @@
+"""
+Rows per second of the hero list endpoint: ORM path vs column projection.
+
+The ORM path is what FastAPI does for `crud.hero.get_multi_paginated`: hydrate
+Hero objects, validate them against the response model and dump them with the
+default JSON response. The projected path is `get_multi_paginated_projected`
+plus `create_projected_response`.
+
+Run from backend/app against a migrated database:
+
+    python -m benchmarks.projection --rows 10000
+
+The heroes are inserted in a transaction that is rolled back at the end.
+"""
+
+import argparse
+import asyncio
+import time
+from collections.abc import Awaitable, Callable
+from fastapi.responses import JSONResponse
+from fastapi.routing import serialize_response
+from fastapi.utils import create_response_field
+from fastapi_pagination import Params
+from sqlmodel.ext.asyncio.session import AsyncSession
+from app import crud
+from app.db.session import SessionLocal
+from app.models.hero_model import Hero
+from app.models.team_model import Team
+from app.schemas.hero_schema import IHeroReadWithTeam
+from app.schemas.response_schema import (
+    IGetResponsePaginated,
+    create_projected_response,
+    create_response,
+)
+
+PAGE_SIZE = 100
+
+response_field = create_response_field(
+    name="Response_get_hero_list",
+    type_=IGetResponsePaginated[IHeroReadWithTeam],
+    mode="serialization",
+)
+
+
+async def orm_page(session: AsyncSession, params: Params) -> bytes:
+    heroes = await crud.hero.get_multi_paginated(params=params, db_session=session)
+    content = await serialize_response(
+        field=response_field, response_content=create_response(data=heroes)
+    )
+    return JSONResponse(content).body
+
+
+async def projected_page(session: AsyncSession, params: Params) -> bytes:
+    heroes = await crud.hero.get_multi_paginated_projected(
+        params=params, query=crud.hero.get_read_projection(), db_session=session
+    )
+    return create_projected_response(data=heroes).body
+
+
+async def seed(session: AsyncSession, rows: int) -> None:
+    teams = [Team(name=f"bench team {i}", headquarters=f"hq {i}") for i in range(10)]
+    session.add_all(teams)
+    session.add_all(
+        Hero(
+            name=f"bench hero {i}",
+            secret_name=f"secret {i}",
+            age=i % 90,
+            team_id=teams[i % len(teams)].id if i % 5 else None,
+        )
+        for i in range(rows)
+    )
+    await session.flush()
+
+
+async def measure(
+    session: AsyncSession,
+    page: Callable[[AsyncSession, Params], Awaitable[bytes]],
+    rows: int,
+    repeat: int,
+) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for number in range(1, rows // PAGE_SIZE + 1):
+            await page(session, Params(page=number, size=PAGE_SIZE))
+        best = min(best, time.perf_counter() - start)
+    return rows / best
+
+
+async def main(rows: int, repeat: int) -> None:
+    async with SessionLocal() as session:
+        try:
+            await seed(session, rows)
+            total = await crud.hero.get_count(db_session=session)
+            rows = total - total % PAGE_SIZE
+            print(f"{rows} heroes, pages of {PAGE_SIZE}, best of {repeat}")
+            for name, page in (("orm", orm_page), ("projected", projected_page)):
+                rate = await measure(session, page, rows, repeat)
+                print(f"{name:>10}: {rate:10.0f} rows/s")
+        finally:
+            await session.rollback()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--rows", type=int, default=10000)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+    asyncio.run(main(args.rows, args.repeat))
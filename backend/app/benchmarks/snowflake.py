@@ -0,0 +1,151 @@
+"""
+Snowflake IDs: collisions and throughput of leased node ids.
+
+Runs `--instances` SnowflakeGenerator sharing a Redis, as separate processes
+would, each generating `--ids` IDs one by one and then in blocks of
+`--block`. It checks that every ID is unique and that the IDs of each
+instance increase, and prints the IDs per second of each API.
+
+Then it checks a takeover: an instance stops without releasing its node id
+(a crash), and once the lease expires another instance leases the same node
+id with its clock `--skew-ms` behind. None of its IDs may collide with those
+of the crashed instance; when the skew is more than the lease margin, its
+first IDs wait for its clock to catch up.
+
+Run from backend/app with Redis up:
+
+    python -m benchmarks.snowflake --instances 8 --ids 50000
+
+The keys are deleted at the end.
+"""
+
+import argparse
+import asyncio
+import time
+from redis.asyncio import Redis
+from app.core.config import settings
+from app.utils.snowflake import SnowflakeGenerator
+
+PREFIX = "snowflake-bench"
+
+
+def check(name: str, ids_by_instance: list[list[int]], expected: int) -> None:
+    total = sum(len(ids) for ids in ids_by_instance)
+    unique = len(set().union(*ids_by_instance))
+    ordered = all(
+        all(a < b for a, b in zip(ids, ids[1:], strict=False))
+        for ids in ids_by_instance
+    )
+    result = "ok" if unique == total == expected and ordered else "FAILED"
+    print(f"{name}: {total} IDs, {total - unique} duplicates, increasing {ordered}")
+    print(f"{name}: {result}")
+
+
+async def generate(
+    generator: SnowflakeGenerator, ids: int, block: int
+) -> tuple[list[int], float, float]:
+    # The first ID leases the node id
+    generated = [await generator.next_id()]
+    start = time.perf_counter()
+    for _ in range(ids - 1):
+        generated.append(await generator.next_id())
+    one_by_one = time.perf_counter() - start
+    start = time.perf_counter()
+    for _ in range(ids // block):
+        generated.extend(await generator.next_ids(block))
+    blocks = time.perf_counter() - start
+    return generated, one_by_one, blocks
+
+
+async def concurrent_instances(
+    redis_client: Redis, instances: int, ids: int, block: int
+) -> None:
+    generators = [SnowflakeGenerator(prefix=PREFIX) for _ in range(instances)]
+    for generator in generators:
+        generator.init(redis_client)
+    results = await asyncio.gather(
+        *(generate(generator, ids, block) for generator in generators)
+    )
+    print(f"{instances} instances, nodes {[g.node_id for g in generators]}")
+    for generator in generators:
+        generator.redis = None  # keep the shared client open
+        await generator.close()
+    check(
+        "concurrent",
+        [generated for generated, _, _ in results],
+        instances * (ids + ids // block * block),
+    )
+    # The instances share one event loop, so this is the rate of one process
+    one_by_one = sum(r[1] for r in results) / (instances * (ids - 1))
+    blocks = sum(r[2] for r in results) / (instances * (ids // block) * block)
+    print(f"{'next_id':>15}: {1 / one_by_one:10.0f} IDs/s")
+    print(f"{f'next_ids({block})':>15}: {1 / blocks:10.0f} IDs/s")
+
+
+async def takeover(redis_client: Redis, skew_ms: int) -> None:
+    options = {
+        "prefix": PREFIX,
+        "lease_ttl": 1.0,
+        "heartbeat_interval": 0.3,
+        "max_drift": 100,
+    }
+    crashed = SnowflakeGenerator(**options)
+    crashed.init(redis_client)
+    first = await crashed.next_ids(1000)
+    node_id = crashed.node_id
+    # Generate until the lease is about to expire, renewed by the heartbeat
+    deadline = time.monotonic() + 0.8
+    while time.monotonic() < deadline:
+        first.extend(await crashed.next_ids(100))
+        await asyncio.sleep(0.001)
+    # Crash: no more heartbeats and no release
+    crashed._heartbeat_task.cancel()
+    while time.monotonic() < crashed._valid_until:
+        first.extend(await crashed.next_ids(100))
+        await asyncio.sleep(0.001)
+
+    # Every other node id is taken, so the new instance gets the same one
+    taken = [n for n in range(1024) if n != node_id]
+    await redis_client.mset({crashed.lease_key(n): "other" for n in taken})
+    while await redis_client.exists(crashed.lease_key(node_id)):
+        await asyncio.sleep(0.05)
+    successor = SnowflakeGenerator(**options)
+    successor._now = lambda: SnowflakeGenerator._now() - skew_ms
+    successor.init(redis_client)
+    start = time.perf_counter()
+    second = await successor.next_ids(1000)
+    wait = (time.perf_counter() - start) * 1000
+    for _ in range(20):
+        second.extend(await successor.next_ids(100))
+    print(
+        f"node {node_id} taken over by node {successor.node_id} {skew_ms}ms behind,"
+        f" first IDs after {wait:.0f}ms"
+    )
+    successor.redis = None
+    await successor.close()
+    check("takeover", [first, second], len(first) + 3000)
+    await redis_client.delete(*(crashed.lease_key(n) for n in taken))
+
+
+async def main(instances: int, ids: int, block: int, skew_ms: int) -> None:
+    redis_client = Redis(
+        host=settings.REDIS_HOST, port=settings.REDIS_PORT, decode_responses=True
+    )
+    try:
+        await concurrent_instances(redis_client, instances, ids, block)
+        await takeover(redis_client, skew_ms)
+    finally:
+        keys = [key async for key in redis_client.scan_iter(f"{PREFIX}:*")]
+        if keys:
+            await redis_client.delete(*keys)
+        await redis_client.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--instances", type=int, default=8)
+    parser.add_argument("--ids", type=int, default=50000)
+    parser.add_argument("--block", type=int, default=1000)
+    parser.add_argument("--skew-ms", type=int, default=150)
+    args = parser.parse_args()
+    asyncio.run(main(args.instances, args.ids, args.block, args.skew_ms))
@@ -0,0 +1,540 @@
+"""
+Synthetic data at production scale: users, follows, heroes, teams, groups and
+chats, loaded with COPY.
+
+Generates `--users` users and, in proportion, the rest, and loads them with
+COPY in batches of `--batch` rows, `--workers` processes in parallel:
+
+- Follows: how many users each user follows has a Pareto distribution of
+  mean `--follows`, and whom a Zipf distribution over a shuffled popularity
+  rank, so the follower counts follow a power law: most users have a few
+  followers and a few users have a large share of them.
+- Heroes: one per `--users-per-hero` users, in `--teams` teams with the same
+  Zipf skew, some without a team.
+- Groups: `--groups` groups, with up to three per user, Zipf skewed too.
+- Chats: `--sessions` sessions per user on average, each with a Pareto
+  distributed number of messages of mean `--messages`, alternating the user
+  and the assistant.
+
+Rows are created in order over the last `--days` days and their IDs are
+UUIDv7 of their creation time. The IDs of users, teams and groups are
+computed from their number, so any process can reference the rows of
+another, and the same `--seed` and `--batch` give the same data. Once
+loaded, the follow counts, the mutual flags and the hero stats are
+recomputed from the rows and the tables analyzed. Every user can log in
+with `--password`.
+
+Run from backend/app, against a migrated database with the initial data
+(app/initial_data.py):
+
+    python -m benchmarks.synthetic_data --users 1000000 --workers 4
+
+The users have emails user{n}@synthetic.example.com. It does not run twice
+on a database: recreate it to load another dataset.
+"""
+
+import argparse
+import asyncio
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timedelta, timezone
+from functools import lru_cache
+from math import gcd
+from random import Random
+from typing import NamedTuple
+from uuid import UUID
+
+import asyncpg
+from redis.asyncio import Redis
+from sqlalchemy import text
+from sqlalchemy.orm import aliased
+from sqlmodel import exists, select, update
+
+from app import crud, models  # noqa: F401, the schemas import needs the models first
+from app.core.config import settings
+from app.core.security import get_password_hash
+from app.db.session import SessionLocal, engine
+from app.models.user_follow_model import UserFollow
+from app.models.user_model import User
+from app.schemas.role_schema import IRoleEnum
+from app.utils.cache import response_cache
+from app.utils.uuid6 import _from_int, _uuid7_int
+
+EMAIL_DOMAIN = "synthetic.example.com"
+
+# fmt: off
+FIRST_NAMES = (
+    "Ada", "Alan", "Amara", "Ana", "Arjun", "Beatriz", "Carlos", "Chen", "Chloe",
+    "Daniel", "Diego", "Elena", "Emma", "Fatima", "Gabriel", "Hana", "Hugo",
+    "Ines", "Isaac", "Jon", "Julia", "Kenji", "Laura", "Leila", "Lucas", "Maria",
+    "Mateo", "Mei", "Nadia", "Noah", "Olga", "Omar", "Pablo", "Priya", "Rafael",
+    "Sara", "Sofia", "Tariq", "Valentina", "Wei", "Yara", "Yusuf", "Zoe",
+)
+LAST_NAMES = (
+    "Almeida", "Andersen", "Bauer", "Chen", "Costa", "Dubois", "Fernandez",
+    "Garcia", "Gonzalez", "Hansen", "Ito", "Jensen", "Khan", "Kim", "Kowalski",
+    "Lopez", "Martin", "Moreau", "Muller", "Nakamura", "Nguyen", "Novak",
+    "Okafor", "Patel", "Perez", "Ramirez", "Rossi", "Sanchez", "Schmidt",
+    "Silva", "Smith", "Suzuki", "Tanaka", "Torres", "Wang", "Weber", "Yilmaz",
+)
+COUNTRIES = (
+    "Argentina", "Brazil", "Canada", "Ecuador", "France", "Germany", "India",
+    "Japan", "Mexico", "Nigeria", "Spain", "United Kingdom", "United States",
+)
+HERO_PREFIXES = (
+    "Captain", "Doctor", "Iron", "Night", "Silver", "Star", "Shadow", "Storm",
+    "Crimson", "Mighty", "Black", "Green", "Golden", "Quantum", "Phantom",
+)
+HERO_NOUNS = (
+    "Falcon", "Wolf", "Hawk", "Blade", "Knight", "Comet", "Spider", "Panther",
+    "Flash", "Arrow", "Titan", "Viper", "Raven", "Lynx", "Bolt", "Sentinel",
+)
+CITIES = (
+    "Berlin", "Bogota", "Buenos Aires", "Lagos", "London", "Madrid", "Mumbai",
+    "New York", "Paris", "Quito", "Sao Paulo", "Seoul", "Tokyo", "Toronto",
+)
+CHAT_TOPICS = (
+    "my team", "the heroes list", "the report exports", "my followers",
+    "the group memberships", "password resets", "the hero stats",
+)
+
+USER_COLUMNS = (
+    "id", "created_at", "updated_at", "first_name", "last_name", "email",
+    "is_active", "is_superuser", "birthdate", "role_id", "gender", "country",
+    "hashed_password", "follower_count", "following_count",
+)
+TEAM_COLUMNS = (
+    "id", "created_at", "updated_at", "name", "headquarters", "created_by_id",
+)
+GROUP_COLUMNS = (
+    "id", "created_at", "updated_at", "name", "description", "created_by_id",
+)
+HERO_COLUMNS = (
+    "id", "created_at", "updated_at", "name", "secret_name", "age", "team_id",
+    "created_by_id",
+)
+FOLLOW_COLUMNS = (
+    "id", "created_at", "updated_at", "user_id", "target_user_id", "is_mutual",
+)
+LINK_COLUMNS = ("id", "created_at", "updated_at", "group_id", "user_id")
+SESSION_COLUMNS = ("id", "created_at", "updated_at", "user_id", "title")
+MESSAGE_COLUMNS = (
+    "id", "created_at", "updated_at", "session_id", "user_id", "role", "content",
+)
+# fmt: on
+
+# Seeds and ID random bits of each kind of row. The follows, memberships and
+# chats of a user are generated together, as its activity.
+USER, TEAM, GROUP, HERO, ACTIVITY, FOLLOW, LINK, SESSION, MESSAGE = range(9)
+
+_MASK = (1 << 64) - 1
+
+
+class Plan(NamedTuple):
+    seed: int
+    users: int
+    teams: int
+    groups: int
+    heroes: int
+    follows: float
+    sessions: float
+    messages: float
+    start_ms: int
+    span_ms: int
+    password_hash: str
+    user_role_id: UUID
+    manager_role_id: UUID
+
+
+def _mix(*values: int) -> int:
+    # splitmix64 of the values, the random bits of IDs and the batch seeds
+    x = 0
+    for value in values:
+        x = (x ^ value) + 0x9E3779B97F4A7C15 & _MASK
+        x = (x ^ x >> 30) * 0xBF58476D1CE4E5B9 & _MASK
+        x = (x ^ x >> 27) * 0x94D049BB133111EB & _MASK
+        x ^= x >> 31
+    return x
+
+
+def _uuid7_at(ms: int, random: int) -> UUID:
+    # The low 20 bits of `random` are the sub-millisecond fraction
+    return _from_int(_uuid7_int(ms << 20 | random & 0xFFFFF, random))
+
+
+def _created_ms(plan: Plan, index: int, count: int) -> int:
+    return plan.start_ms + index * plan.span_ms // count
+
+
+def _row_id(plan: Plan, kind: int, index: int, count: int) -> UUID:
+    return _uuid7_at(_created_ms(plan, index, count), _mix(plan.seed, kind, index))
+
+
+def _datetime(ms: int) -> datetime:
+    # The columns are timestamps without time zone, in UTC
+    return datetime(1970, 1, 1) + timedelta(milliseconds=ms)
+
+
+def _zipf(rng: Random, count: int) -> int:
+    # A rank in [0, count) with a probability about proportional to 1 / rank
+    return int(count ** rng.random()) - 1
+
+
+@lru_cache
+def _stride(count: int) -> int:
+    stride = 2654435761
+    while gcd(stride, count) != 1:
+        stride += 2
+    return stride
+
+
+def _shuffle(rank: int, count: int) -> int:
+    # The index of the rank-th most popular row: a fixed permutation, so that
+    # the popular rows are not the oldest ones
+    return (rank * _stride(count) + count // 3) % count
+
+
+def _pareto(rng: Random, mean: float, alpha: float = 2.0) -> int:
+    return int(mean * (alpha - 1) / alpha * rng.paretovariate(alpha))
+
+
+def user_rows(plan: Plan, rng: Random, start: int, stop: int) -> dict[str, list]:
+    users = []
+    for n in range(start, stop):
+        created_at = _datetime(_created_ms(plan, n, plan.users))
+        birthdate = datetime(1950, 1, 1, tzinfo=timezone.utc) + timedelta(
+            days=rng.randrange(365 * 55)
+        )
+        users.append(
+            (
+                _row_id(plan, USER, n, plan.users),
+                created_at,
+                created_at,
+                rng.choice(FIRST_NAMES),
+                rng.choice(LAST_NAMES),
+                f"user{n}@{EMAIL_DOMAIN}",
+                rng.random() > 0.01,
+                False,
+                birthdate,
+                plan.manager_role_id if rng.random() < 0.01 else plan.user_role_id,
+                rng.choice(("female", "male", "other")),
+                rng.choice(COUNTRIES),
+                plan.password_hash,
+                0,
+                0,
+            )
+        )
+    return {"User": users}
+
+
+def team_rows(plan: Plan, rng: Random, start: int, stop: int) -> dict[str, list]:
+    teams = []
+    for n in range(start, stop):
+        created_at = _datetime(_created_ms(plan, n, plan.teams))
+        teams.append(
+            (
+                _row_id(plan, TEAM, n, plan.teams),
+                created_at,
+                created_at,
+                f"{rng.choice(HERO_PREFIXES)} {rng.choice(CITIES)} {n}",
+                rng.choice(CITIES),
+                _row_id(plan, USER, rng.randrange(plan.users), plan.users),
+            )
+        )
+    return {"Team": teams}
+
+
+def group_rows(plan: Plan, rng: Random, start: int, stop: int) -> dict[str, list]:
+    groups = []
+    for n in range(start, stop):
+        created_at = _datetime(_created_ms(plan, n, plan.groups))
+        topic = rng.choice(CHAT_TOPICS)
+        groups.append(
+            (
+                _row_id(plan, GROUP, n, plan.groups),
+                created_at,
+                created_at,
+                f"GR{n}",
+                f"People interested in {topic}",
+                _row_id(plan, USER, rng.randrange(plan.users), plan.users),
+            )
+        )
+    return {"Group": groups}
+
+
+def hero_rows(plan: Plan, rng: Random, start: int, stop: int) -> dict[str, list]:
+    heroes = []
+    for n in range(start, stop):
+        created_at = _datetime(_created_ms(plan, n, plan.heroes))
+        team = _shuffle(_zipf(rng, plan.teams), plan.teams)
+        heroes.append(
+            (
+                _row_id(plan, HERO, n, plan.heroes),
+                created_at,
+                created_at,
+                f"{rng.choice(HERO_PREFIXES)} {rng.choice(HERO_NOUNS)}",
+                f"{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}",
+                rng.randrange(16, 90) if rng.random() < 0.9 else None,
+                _row_id(plan, TEAM, team, plan.teams) if rng.random() < 0.9 else None,
+                _row_id(plan, USER, rng.randrange(plan.users), plan.users),
+            )
+        )
+    return {"Hero": heroes}
+
+
+def activity_rows(plan: Plan, rng: Random, start: int, stop: int) -> dict[str, list]:
+    """
+    Follows, group memberships and chats of the users from `start` to `stop`.
+    """
+    end_ms = plan.start_ms + plan.span_ms
+    follows, links, sessions, messages = [], [], [], []
+    for n in range(start, stop):
+        user_ms = _created_ms(plan, n, plan.users)
+        user_id = _row_id(plan, USER, n, plan.users)
+
+        targets = set()
+        for _ in range(min(_pareto(rng, plan.follows), plan.users - 1)):
+            target = _shuffle(_zipf(rng, plan.users), plan.users)
+            if target != n:
+                targets.add(target)
+        for target in targets:
+            after = max(user_ms, _created_ms(plan, target, plan.users))
+            ms = rng.randrange(after, end_ms + 1)
+            follows.append(
+                (
+                    _uuid7_at(ms, _mix(plan.seed, FOLLOW, n, target)),
+                    _datetime(ms),
+                    _datetime(ms),
+                    user_id,
+                    _row_id(plan, USER, target, plan.users),
+                    False,
+                )
+            )
+
+        groups = {
+            _shuffle(_zipf(rng, plan.groups), plan.groups)
+            for _ in range(rng.choice((0, 0, 1, 1, 1, 2, 3)))
+        }
+        for group in groups:
+            ms = rng.randrange(user_ms, end_ms + 1)
+            links.append(
+                (
+                    _uuid7_at(ms, _mix(plan.seed, LINK, n, group)),
+                    _datetime(ms),
+                    _datetime(ms),
+                    _row_id(plan, GROUP, group, plan.groups),
+                    user_id,
+                )
+            )
+
+        for s in range(int(rng.expovariate(1 / plan.sessions) + 0.5)):
+            ms = rng.randrange(user_ms, end_ms + 1)
+            topic = rng.choice(CHAT_TOPICS)
+            session_id = _uuid7_at(ms, _mix(plan.seed, SESSION, n, s))
+            sessions.append(
+                (session_id, _datetime(ms), _datetime(ms), user_id, f"About {topic}")
+            )
+            for m in range(max(2, _pareto(rng, plan.messages))):
+                ms += rng.randrange(1000, 120_000)
+                if m % 2:
+                    role, author = "assistant", None
+                    content = f"Here is what I found about {topic}: step {m // 2}."
+                else:
+                    role, author = "user", user_id
+                    content = f"Question {m // 2 + 1} about {topic}, please help."
+                messages.append(
+                    (
+                        _uuid7_at(ms, _mix(plan.seed, MESSAGE, n, s, m)),
+                        _datetime(ms),
+                        _datetime(ms),
+                        session_id,
+                        author,
+                        role,
+                        content,
+                    )
+                )
+    # Sessions first, for the foreign key of the messages
+    return {
+        "UserFollow": follows,
+        "LinkGroupUser": links,
+        "ChatSession": sessions,
+        "ChatMessage": messages,
+    }
+
+
+COLUMNS = {
+    "User": USER_COLUMNS,
+    "Team": TEAM_COLUMNS,
+    "Group": GROUP_COLUMNS,
+    "Hero": HERO_COLUMNS,
+    "UserFollow": FOLLOW_COLUMNS,
+    "LinkGroupUser": LINK_COLUMNS,
+    "ChatSession": SESSION_COLUMNS,
+    "ChatMessage": MESSAGE_COLUMNS,
+}
+
+GENERATORS = {
+    USER: user_rows,
+    TEAM: team_rows,
+    GROUP: group_rows,
+    HERO: hero_rows,
+    ACTIVITY: activity_rows,
+}
+
+
+def load_batch(plan: Plan, kind: int, start: int, stop: int) -> dict[str, int]:
+    """
+    Generates and copies a batch, in a worker process. Returns the rows
+    copied per table.
+    """
+    rng = Random(_mix(plan.seed, kind, start))
+    rows = GENERATORS[kind](plan, rng, start, stop)
+
+    async def copy() -> None:
+        connection = await asyncpg.connect(
+            str(settings.ASYNC_DATABASE_URI).replace("+asyncpg", "", 1)
+        )
+        try:
+            # The data can be generated again if the server crashes
+            await connection.execute("SET synchronous_commit TO off")
+            async with connection.transaction():
+                for table, records in rows.items():
+                    if records:
+                        await connection.copy_records_to_table(
+                            table, records=records, columns=COLUMNS[table]
+                        )
+        finally:
+            await connection.close()
+
+    asyncio.run(copy())
+    return {table: len(records) for table, records in rows.items()}
+
+
+def load(
+    executor: ProcessPoolExecutor, plan: Plan, phase: dict[int, int], batch: int
+) -> None:
+    """
+    Loads the rows of the kinds of `phase`, kind to its number of rows, in
+    parallel batches.
+    """
+    start_time = time.perf_counter()
+    futures = [
+        executor.submit(load_batch, plan, kind, start, min(start + batch, count))
+        for kind, count in phase.items()
+        for start in range(0, count, batch)
+    ]
+    totals: dict[str, int] = {}
+    for future in futures:
+        for table, count in future.result().items():
+            totals[table] = totals.get(table, 0) + count
+    elapsed = time.perf_counter() - start_time
+    for table, count in totals.items():
+        print(f"{table:>15}: {count:>10} rows")
+    rows = sum(totals.values())
+    print(f"{'':>15}  {elapsed:10.1f}s, {rows / elapsed:.0f} rows/s")
+
+
+async def prepare(args: argparse.Namespace) -> Plan:
+    async with SessionLocal() as session:
+        roles = {}
+        for name in (IRoleEnum.user, IRoleEnum.manager):
+            role = await crud.role.get_role_by_name(name=name, db_session=session)
+            if role is None:
+                raise SystemExit(f"No {name} role: run app/initial_data.py first")
+            roles[name] = role.id
+        loaded = await session.scalar(
+            select(exists().where(User.email == f"user0@{EMAIL_DOMAIN}"))
+        )
+        if loaded:
+            raise SystemExit("Synthetic data is already loaded")
+    # Its connections belong to this event loop
+    await engine.dispose()
+
+    now_ms = time.time_ns() // 1_000_000
+    span_ms = args.days * 86_400_000
+    return Plan(
+        seed=args.seed,
+        users=args.users,
+        teams=args.teams,
+        groups=args.groups,
+        heroes=max(1, args.users // args.users_per_hero),
+        follows=args.follows,
+        sessions=args.sessions,
+        messages=args.messages,
+        start_ms=now_ms - span_ms,
+        span_ms=span_ms,
+        password_hash=await get_password_hash(args.password),
+        user_role_id=roles[IRoleEnum.user],
+        manager_role_id=roles[IRoleEnum.manager],
+    )
+
+
+async def finish() -> None:
+    """
+    Recomputes what the CRUD keeps up to date on writes, and refreshes the
+    planner statistics.
+    """
+    redis_client = Redis(host=settings.REDIS_HOST, port=settings.REDIS_PORT)
+    response_cache.init(redis_client)
+    try:
+        async with SessionLocal() as session:
+            start_time = time.perf_counter()
+            reverse = aliased(UserFollow)
+            await session.execute(
+                update(UserFollow)
+                .where(
+                    exists().where(
+                        reverse.user_id == UserFollow.target_user_id,
+                        reverse.target_user_id == UserFollow.user_id,
+                    )
+                )
+                .values(is_mutual=True)
+                .execution_options(synchronize_session=False)
+            )
+            await session.commit()
+            corrected, _ = await crud.user_follow.reconcile_follow_counts(
+                batch_size=10_000, db_session=session
+            )
+            buckets = await crud.hero_stat.rebuild(db_session=session)
+            print(
+                f"Follow counts of {corrected} users and {buckets} hero stat"
+                f" buckets in {time.perf_counter() - start_time:.1f}s"
+            )
+            for table in COLUMNS:
+                await session.execute(text(f'ANALYZE "{table}"'))
+            await session.commit()
+    finally:
+        response_cache.redis = None
+        await redis_client.close()
+        await engine.dispose()
+
+
+def main(args: argparse.Namespace) -> None:
+    plan = asyncio.run(prepare(args))
+    print(
+        f"{plan.users} users, {plan.teams} teams, {plan.groups} groups and"
+        f" {plan.heroes} heroes, {args.workers} workers"
+    )
+    with ProcessPoolExecutor(args.workers) as executor:
+        # Phases in the order of the foreign keys
+        load(executor, plan, {USER: plan.users}, args.batch)
+        load(executor, plan, {TEAM: plan.teams, GROUP: plan.groups}, args.batch)
+        load(executor, plan, {HERO: plan.heroes, ACTIVITY: plan.users}, args.batch)
+    asyncio.run(finish())
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--users", type=int, default=100_000)
+    parser.add_argument("--follows", type=float, default=20)
+    parser.add_argument("--users-per-hero", type=int, default=10)
+    parser.add_argument("--teams", type=int, default=1000)
+    parser.add_argument("--groups", type=int, default=200)
+    parser.add_argument("--sessions", type=float, default=0.5)
+    parser.add_argument("--messages", type=float, default=8)
+    parser.add_argument("--days", type=int, default=730)
+    parser.add_argument("--password", default="synthetic-password")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--batch", type=int, default=10_000)
+    parser.add_argument("--workers", type=int, default=4)
+    main(parser.parse_args())
@@ -0,0 +1,114 @@
+"""
+UUID generation: uuid4, the previous uuid7, uuid7 and uuid7_batch.
+
+Prints the IDs generated per second by each generator. With `--rows`, it also
+inserts that many IDs of each kind into a table with a uuid primary key, in
+batches, and prints the insert rate and the size of the primary key index:
+random uuid4 keys split B-tree pages all over the index, time ordered uuid7
+keys append to its right edge.
+
+Run from backend/app, against a migrated database for `--rows`:
+
+    python -m benchmarks.uuid7 --ids 200000 --rows 200000
+
+The tables are temporary.
+"""
+
+import argparse
+import asyncio
+import secrets
+import time
+import uuid
+from collections.abc import Callable
+from sqlalchemy import text
+from app.db.session import SessionLocal
+from app.utils.uuid6 import UUID, _subsec_encode, uuid7, uuid7_batch
+
+BATCH_SIZE = 1000
+
+_last_v7_timestamp = None
+
+
+def previous_uuid7() -> UUID:
+    # app.utils.uuid6.uuid7 before UUID7Generator
+    global _last_v7_timestamp
+
+    nanoseconds = time.time_ns()
+    if _last_v7_timestamp is not None and nanoseconds <= _last_v7_timestamp:
+        nanoseconds = _last_v7_timestamp + 1
+    _last_v7_timestamp = nanoseconds
+    timestamp_ms, timestamp_ns = divmod(nanoseconds, 10**6)
+    subsec = _subsec_encode(timestamp_ns)
+    subsec_a = subsec >> 8
+    subsec_b = subsec & 0xFF
+    rand = secrets.randbits(54)
+    uuid_int = (timestamp_ms & 0xFFFFFFFFFFFF) << 80
+    uuid_int |= subsec_a << 64
+    uuid_int |= subsec_b << 54
+    uuid_int |= rand
+    return UUID(int=uuid_int, version=7)
+
+
+def one_by_one(generate: Callable[[], uuid.UUID]) -> Callable[[int], list]:
+    return lambda n: [generate() for _ in range(n)]
+
+
+GENERATORS: dict[str, Callable[[int], list]] = {
+    "uuid4": one_by_one(uuid.uuid4),
+    "previous uuid7": one_by_one(previous_uuid7),
+    "uuid7": one_by_one(uuid7),
+    "uuid7_batch": uuid7_batch,
+}
+
+
+def measure(generate: Callable[[int], list], ids: int, repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for _ in range(ids // BATCH_SIZE):
+            generate(BATCH_SIZE)
+        best = min(best, time.perf_counter() - start)
+    return ids / best
+
+
+async def insert_locality(rows: int) -> None:
+    print(f"{rows} rows inserted in batches of {BATCH_SIZE}")
+    async with SessionLocal() as session:
+        for name in ("uuid4", "uuid7_batch"):
+            generate = GENERATORS[name]
+            table = name.replace(" ", "_") + "_locality"
+            await session.execute(
+                text(f"CREATE TEMP TABLE {table} (id uuid PRIMARY KEY)")
+            )
+            start = time.perf_counter()
+            for _ in range(rows // BATCH_SIZE):
+                await session.execute(
+                    text(f"INSERT INTO {table} SELECT unnest(CAST(:ids AS uuid[]))"),
+                    {"ids": generate(BATCH_SIZE)},
+                )
+            elapsed = time.perf_counter() - start
+            index_size = await session.scalar(
+                text(f"SELECT pg_relation_size('{table}_pkey')")
+            )
+            print(
+                f"{name:>15}: {rows / elapsed:10.0f} rows/s  "
+                f"index {index_size / 2**20:6.1f} MiB"
+            )
+        await session.rollback()
+
+
+def main(ids: int, rows: int, repeat: int) -> None:
+    print(f"{ids} IDs, best of {repeat}")
+    for name, generate in GENERATORS.items():
+        print(f"{name:>15}: {measure(generate, ids, repeat):10.0f} IDs/s")
+    if rows:
+        asyncio.run(insert_locality(rows))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--ids", type=int, default=200000)
+    parser.add_argument("--rows", type=int, default=0)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+    main(args.ids, args.rows, args.repeat)
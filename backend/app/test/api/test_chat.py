@@ -0,0 +1,59 @@
+import pytest
+from httpx import AsyncClient
+from app.main import app
+from typing import AsyncGenerator
+from app import crud
+from app.db.session import SessionLocal
+from app.schemas.chat_schema import ChatRoleEnum
+
+url = "http://fastapi.localhost/api/v1"
+
+@pytest.fixture(scope='function')
+async def test_client() -> AsyncGenerator[AsyncClient, None]:
+    async with AsyncClient(app=app, base_url=url) as client:
+        yield client
+
+async def _add_messages(user_id: str, *contents: str):
+    async with SessionLocal() as session:
+        chat_session = await crud.chat_session.create_for_user(user_id=user_id, title="Search", db_session=session)
+        for content in contents:
+            await crud.chat_message.create_for_session(session_id=chat_session.id, user_id=user_id, role=ChatRoleEnum.user, content=content, db_session=session)
+        return chat_session.id
+
+async def _remove_sessions(*ids) -> None:
+    async with SessionLocal() as session:
+        for id in ids:
+            await crud.chat_session.remove(id=id, db_session=session)
+
+@pytest.mark.asyncio
+class TestChatSearch:
+    async def test_best_ranked_first_and_paged_by_cursor(self, test_client, register):
+        async for client in test_client:
+            user = await register(client)
+            other = await register(client)
+            ids = [await _add_messages(user["user"]["id"], "A knight fought a dragon.", "Dragon, dragon and dragon eggs.", "Nothing to see here.")]
+            try:
+                ids.append(await _add_messages(other["user"]["id"], "Another dragon, of another user."))
+
+                response = await client.get("/chat/search", params={"q": "dragon", "size": 1}, headers=user["headers"])
+                assert response.status_code == 200
+                page = response.json()["data"]
+                assert [item["snippet"] for item in page["items"]] == ["<mark>Dragon</mark>, <mark>dragon</mark> and <mark>dragon</mark> eggs."]
+
+                response = await client.get("/chat/search", params={"q": "dragon", "size": 1, "cursor": page["next_cursor"]}, headers=user["headers"])
+                page = response.json()["data"]
+                assert [item["snippet"] for item in page["items"]] == ["A knight fought a <mark>dragon</mark>."]
+                assert page["next_cursor"] is None
+            finally:
+                await _remove_sessions(*ids)
+
+    async def test_snippets_are_escaped(self, test_client, register):
+        async for client in test_client:
+            user = await register(client)
+            id = await _add_messages(user["user"]["id"], '<img src=x onerror="alert(1)"> dragon & co')
+            try:
+                response = await client.get("/chat/search", params={"q": "dragon"}, headers=user["headers"])
+                (item,) = response.json()["data"]["items"]
+                assert item["snippet"] == "&lt;img src=x onerror=&quot;alert(1)&quot;&gt; <mark>dragon</mark> &amp; co"
+            finally:
+                await _remove_sessions(id)
@@ -0,0 +1,72 @@
+import pytest
+from httpx import AsyncClient
+from app.main import app
+from typing import AsyncGenerator
+from uuid import uuid4
+from sqlmodel import select
+from app import crud
+from app.core.authz import authorized_filter, is_authorized
+from app.db.session import SessionLocal
+from app.models.hero_model import Hero
+from app.models.user_model import User
+from app.schemas.role_schema import IRoleEnum
+from app.schemas.hero_schema import IHeroCreate
+
+url = "http://fastapi.localhost/api/v1"
+
+@pytest.fixture(scope='function')
+async def test_client() -> AsyncGenerator[AsyncClient, None]:
+    async with AsyncClient(app=app, base_url=url) as client:
+        yield client
+
+async def _add_heroes(*names: str, created_by_id=None) -> list:
+    async with SessionLocal() as session:
+        return [(await crud.hero.create(obj_in=IHeroCreate(name=name, secret_name="Secret"), created_by_id=created_by_id, db_session=session)).id for name in names]
+
+async def _remove_heroes(ids: list) -> None:
+    async with SessionLocal() as session:
+        for id in ids:
+            await crud.hero.remove(id=id, db_session=session)
+
+@pytest.mark.asyncio
+class TestHeroAutocomplete:
+    async def test_prefix_is_case_insensitive_and_escaped(self, test_client, register):
+        async for client in test_client:
+            headers = (await register(client))["headers"]
+            tag = f"auto{uuid4().hex[:8]}"
+            ids = await _add_heroes(f"{tag}_one", f"{tag}%two", f"{tag}xthree", f"{tag}\\four")
+            try:
+                response = await client.get("/hero/autocomplete", params={"prefix": tag.upper()}, headers=headers)
+                assert response.status_code == 200
+                assert response.json()["message"] == "Data got correctly"
+                assert [hero["name"] for hero in response.json()["data"]] == [f"{tag}%two", f"{tag}\\four", f"{tag}_one", f"{tag}xthree"]
+                for wildcard, name in (("_", f"{tag}_one"), ("%", f"{tag}%two"), ("\\", f"{tag}\\four")):
+                    response = await client.get("/hero/autocomplete", params={"prefix": tag + wildcard}, headers=headers)
+                    assert [hero["name"] for hero in response.json()["data"]] == [name]
+            finally:
+                await _remove_heroes(ids)
+
+
+@pytest.mark.asyncio
+class TestHeroAuthorization:
+    async def test_filter_agrees_with_is_authorized(self, test_client, register):
+        async for client in test_client:
+            owner = await register(client)
+            (owned,) = await _add_heroes("Owned", created_by_id=owner["user"]["id"])
+            (other,) = await _add_heroes("Other")
+            try:
+                async with SessionLocal() as session:
+                    heroes = (await session.execute(select(Hero).where(Hero.id.in_([owned, other])))).scalars().all()
+                    roles = {name: (await crud.role.get_role_by_name(name=name, db_session=session)).id for name in IRoleEnum}
+                    actors = {
+                        "owner": await crud.user.get(id=owner["user"]["id"], db_session=session),
+                        "manager": User(id=uuid4(), role_id=roles[IRoleEnum.manager]),
+                        "admin": User(id=uuid4(), role_id=roles[IRoleEnum.admin]),
+                    }
+                    for name, actor in actors.items():
+                        allowed = {hero.id for hero in heroes if is_authorized(actor, "update", hero)}
+                        filtered = set((await session.execute(select(Hero.id).where(Hero.id.in_([owned, other]), authorized_filter(actor, "update", Hero)))).scalars())
+                        assert allowed == filtered, name
+                        assert allowed == ({owned} if name == "owner" else {owned, other}), name
+            finally:
+                await _remove_heroes([owned, other])
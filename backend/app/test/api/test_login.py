@@ -24,7 +24,8 @@ class TestPostLogin:
         [
             ("post", "/login", {"email": "incorrect_email@gmail.com", "password": "123456"}, 400, {"detail": "Email or Password incorrect"}),
             ("post", "/login", {"email": _seed_creds()[0], "password": _seed_creds()[1]}, 200, None),  # Add expected JSON response for successful login
-            ("post", "/login/new_access_token", {"refresh_token": ""}, 403, {"detail": "Error when decoding the token. Please check your request."})
+            ("post", "/login/new_access_token", {"refresh_token": ""}, 403, {"detail": "Error when decoding the token. Please check your request."}),
+            ("post", "/login/logout", {}, 401, {"detail": "Not authenticated"}),
         ],
     )
     async def test(self, test_client, method, endpoint, data, expected_status, expected_response):
@@ -41,3 +42,49 @@ class TestPostLogin:
             assert response.status_code == expected_status
             if expected_response is not None:                
                 assert response.json() == expected_response
+
+
+def _bearer(token: str) -> dict:
+    return {"Authorization": f"Bearer {token}"}
+
+
+@pytest.mark.asyncio
+class TestTokens:
+    async def test_refresh_token_is_not_an_access_token(self, test_client, register):
+        async for client in test_client:
+            tokens = await register(client)
+            response = await client.get("/user", headers=_bearer(tokens["refresh_token"]))
+            assert response.status_code == 403
+            response = await client.post("/login/new_access_token", json={"refresh_token": tokens["access_token"]})
+            assert response.status_code == 404
+
+    async def test_logout_revokes_the_tokens_by_jti(self, test_client, register):
+        async for client in test_client:
+            tokens = await register(client)
+            # A token of another session of the user stays valid
+            other = await client.post("/login", json={"email": tokens["user"]["email"], "password": tokens["password"]})
+            response = await client.post("/login/logout", json={"refresh_token": tokens["refresh_token"]}, headers=_bearer(tokens["access_token"]))
+            assert response.status_code == 200
+
+            response = await client.get("/user", headers=_bearer(tokens["access_token"]))
+            assert response.status_code == 403
+            response = await client.post("/login/new_access_token", json={"refresh_token": tokens["refresh_token"]})
+            assert response.status_code == 403
+            response = await client.get("/user", headers=_bearer(other.json()["data"]["access_token"]))
+            assert response.status_code == 200
+
+    async def test_change_password_revokes_every_token_by_version(self, test_client, register):
+        async for client in test_client:
+            tokens = await register(client)
+            other = await client.post("/login", json={"email": tokens["user"]["email"], "password": tokens["password"]})
+            changed = await client.post("/login/change_password", json={"current_password": tokens["password"], "new_password": "new-token-test-password"}, headers=_bearer(tokens["access_token"]))
+            assert changed.status_code == 200
+
+            for token in (tokens["access_token"], other.json()["data"]["access_token"]):
+                response = await client.get("/user", headers=_bearer(token))
+                assert response.status_code == 403
+            response = await client.post("/login/new_access_token", json={"refresh_token": tokens["refresh_token"]})
+            assert response.status_code == 403
+            # The tokens issued with the new password are valid
+            response = await client.get("/user", headers=_bearer(changed.json()["data"]["access_token"]))
+            assert response.status_code == 200
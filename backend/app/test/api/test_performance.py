@@ -0,0 +1,447 @@
+"""
+Performance budgets of the v1 endpoints.
+
+Each endpoint is called once to warm the caches, once to count its database
+statements and Redis commands and trace its memory (the peak allocated while
+handling it, I/O buffers included), and REPEAT times for its p95 latency.
+Each must stay within its budgets. The app runs with its lifespan, so the
+response cache, the rate limiter and the chat client (the mock provider) are
+those of production, against the seeded database and Redis of the tests.
+
+Latency depends on the machine: PERF_LATENCY_SCALE multiplies the latency
+budgets, e.g. 3 on a slow CI runner. When a change is meant to add a
+statement or a command, update its budget here in the same commit.
+"""
+
+import asyncio
+import gc
+import os
+import statistics
+import time
+import tracemalloc
+from collections.abc import Awaitable, Callable
+from contextvars import ContextVar
+from typing import Any, NamedTuple
+from uuid import uuid4
+
+import pytest
+import pytest_asyncio
+from httpx import AsyncClient
+from redis.asyncio import Connection
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from app import crud
+from app.core.config import settings
+from app.db.session import SessionLocal
+from app.main import app
+
+url = "http://fastapi.localhost/api/v1"
+
+REPEAT = 20
+LATENCY_SCALE = float(os.getenv("PERF_LATENCY_SCALE", "1"))
+
+
+class Budget(NamedTuple):
+    method: str
+    # Formatted with the ids of the seeded rows, the `created` id and `n`
+    path: str
+    queries: int
+    redis: int
+    p95_ms: float
+    kib: int
+    json: dict[str, Any] | None = None
+    # Request made before each call, not measured. Its response's data id
+    # is `created`.
+    before: tuple[str, str, dict[str, Any] | None] | None = None
+    # DELETE made after each call, not measured, `created` being the id in
+    # the call's response, or a function removing `created` for rows without
+    # a DELETE endpoint. Keeps the tables the same size between runs.
+    after: str | Callable[[str], Awaitable[None]] | None = None
+
+
+async def _remove_chat_session(created: str) -> None:
+    async with SessionLocal() as session:
+        await crud.chat_session.remove(id=created, db_session=session)
+
+
+BUDGETS = [
+    # user
+    Budget("GET", "/user", queries=2, redis=3, p95_ms=100, kib=500),
+    Budget("GET", "/user/list", queries=4, redis=3, p95_ms=100, kib=550),
+    Budget(
+        "GET",
+        "/user/list/by_role_name?name=Adm",
+        queries=4,
+        redis=3,
+        p95_ms=100,
+        kib=550,
+    ),
+    Budget(
+        "GET",
+        "/user/search?name=admin&size=10",
+        queries=3,
+        redis=3,
+        p95_ms=100,
+        kib=550,
+    ),
+    Budget("GET", "/user/order_by_created_at", queries=4, redis=3, p95_ms=100, kib=550),
+    Budget("GET", "/user/{other}", queries=4, redis=3, p95_ms=100, kib=550),
+    Budget("GET", "/user/following", queries=4, redis=3, p95_ms=100, kib=500),
+    Budget("GET", "/user/followers", queries=4, redis=3, p95_ms=100, kib=500),
+    Budget("GET", "/user/{other}/followers", queries=5, redis=3, p95_ms=100, kib=550),
+    Budget("GET", "/user/{me}/following", queries=5, redis=3, p95_ms=100, kib=550),
+    Budget(
+        "PUT",
+        "/user/following/{other}",
+        queries=6,
+        redis=3,
+        p95_ms=150,
+        kib=550,
+        before=("DELETE", "/user/following/{other}", None),
+    ),
+    Budget(
+        "GET",
+        "/user/{me}/following/{other}",
+        queries=5,
+        redis=3,
+        p95_ms=100,
+        kib=500,
+        before=("PUT", "/user/following/{other}", None),
+    ),
+    Budget(
+        "DELETE",
+        "/user/following/{other}",
+        queries=7,
+        redis=3,
+        p95_ms=100,
+        kib=550,
+        before=("PUT", "/user/following/{other}", None),
+    ),
+    Budget(
+        "DELETE",
+        "/user/{created}",
+        queries=9,
+        redis=3,
+        p95_ms=150,
+        kib=550,
+        before=(
+            "POST",
+            "/user",
+            {
+                "first_name": "Perf",
+                "last_name": "Test",
+                "email": "perf{n}@example.com",
+                "password": "perf",
+                "role_id": "{role}",
+            },
+        ),
+    ),
+    # hero
+    Budget("GET", "/hero", queries=4, redis=3, p95_ms=100, kib=500),
+    Budget("GET", "/hero/get_by_id/{hero}", queries=3, redis=3, p95_ms=100, kib=500),
+    Budget("GET", "/hero/get_by_name/Dead", queries=4, redis=3, p95_ms=100, kib=500),
+    Budget("GET", "/hero/get_by_created_at", queries=4, redis=3, p95_ms=100, kib=500),
+    Budget(
+        "GET", "/hero/autocomplete?prefix=de", queries=3, redis=3, p95_ms=100, kib=500
+    ),
+    Budget("GET", "/hero/stats/daily", queries=3, redis=3, p95_ms=100, kib=500),
+    Budget(
+        "POST",
+        "/hero",
+        queries=5,
+        redis=4,
+        p95_ms=150,
+        kib=500,
+        json={"name": "Perf {n}", "secret_name": "Perf", "age": 3, "team_id": "{team}"},
+        after="/hero/{created}",
+    ),
+    Budget(
+        "PUT", "/hero/{hero}", queries=4, redis=4, p95_ms=100, kib=550, json={"age": 28}
+    ),
+    Budget(
+        "DELETE",
+        "/hero/{created}",
+        queries=6,
+        redis=4,
+        p95_ms=100,
+        kib=550,
+        before=("POST", "/hero", {"name": "Perf delete {n}", "secret_name": "Perf"}),
+    ),
+    # team
+    Budget("GET", "/team", queries=4, redis=3, p95_ms=100, kib=550),
+    Budget("GET", "/team/{team}", queries=3, redis=3, p95_ms=100, kib=500),
+    Budget(
+        "GET",
+        "/team/autocomplete?prefix=Z-F&limit=1",
+        queries=3,
+        redis=3,
+        p95_ms=100,
+        kib=500,
+    ),
+    Budget(
+        "POST",
+        "/team",
+        queries=5,
+        redis=3,
+        p95_ms=150,
+        kib=500,
+        json={"name": "Perf {n}", "headquarters": "HQ"},
+        after="/team/{created}",
+    ),
+    Budget(
+        "DELETE",
+        "/team/{created}",
+        queries=6,
+        redis=3,
+        p95_ms=150,
+        kib=550,
+        before=("POST", "/team", {"name": "Perf delete {n}", "headquarters": "HQ"}),
+    ),
+    # group
+    Budget("GET", "/group", queries=4, redis=3, p95_ms=100, kib=500),
+    Budget("GET", "/group/{group}", queries=4, redis=3, p95_ms=100, kib=550),
+    Budget(
+        "PUT",
+        "/group/{group}",
+        queries=4,
+        redis=3,
+        p95_ms=100,
+        kib=550,
+        json={"description": "This is the first group"},
+    ),
+    Budget(
+        "POST",
+        "/group/add_user/{other}/{group}",
+        queries=8,
+        redis=3,
+        p95_ms=150,
+        kib=600,
+    ),
+    # role
+    Budget("GET", "/role", queries=2, redis=3, p95_ms=100, kib=500),
+    Budget("GET", "/role/{role}", queries=3, redis=3, p95_ms=100, kib=500),
+    # chat
+    Budget("GET", "/chat/sessions", queries=4, redis=3, p95_ms=100, kib=500),
+    Budget("GET", "/chat/sessions/{session}", queries=3, redis=3, p95_ms=100, kib=500),
+    Budget(
+        "GET",
+        "/chat/sessions/{session}/messages",
+        queries=5,
+        redis=3,
+        p95_ms=100,
+        kib=500,
+    ),
+    Budget(
+        "GET", "/chat/search?q=hello&size=10", queries=3, redis=3, p95_ms=100, kib=500
+    ),
+    Budget(
+        "POST",
+        "/chat/sessions",
+        queries=4,
+        redis=3,
+        p95_ms=150,
+        kib=500,
+        json={"title": "Perf {n}"},
+        after=_remove_chat_session,
+    ),
+    Budget(
+        "POST",
+        "/chat/sessions/{session}/messages",
+        queries=10,
+        redis=6,
+        p95_ms=350,
+        kib=550,
+        json={"content": "hello {n}"},
+    ),
+    # report
+    Budget("GET", "/report/users_list", queries=4, redis=3, p95_ms=100, kib=600),
+    Budget("GET", "/report/heroes_list", queries=3, redis=3, p95_ms=100, kib=650),
+    # login
+    Budget(
+        "POST",
+        "/login/new_access_token",
+        queries=1,
+        redis=3,
+        p95_ms=100,
+        kib=500,
+        json={"refresh_token": "{refresh}"},
+    ),
+]
+
+
+class Counts:
+    __slots__ = ("queries", "redis")
+
+    def __init__(self) -> None:
+        self.queries = 0
+        self.redis = 0
+
+
+# Path and body values, see Budget.path
+VALUES: dict[str, Any] = {}
+
+# Only the requests of the test are counted, not background tasks
+_counts: ContextVar[Counts | None] = ContextVar("perf_counts", default=None)
+
+
+def _count_query(*args: Any) -> None:
+    counts = _counts.get()
+    if counts is not None:
+        counts.queries += 1
+
+
+def _fill(value: Any, values: dict[str, Any]) -> Any:
+    if isinstance(value, str):
+        return value.format(**values)
+    if isinstance(value, dict):
+        return {key: _fill(item, values) for key, item in value.items()}
+    return value
+
+
+@pytest.fixture(scope="module")
+def event_loop():
+    loop = asyncio.new_event_loop()
+    yield loop
+    loop.close()
+
+
+@pytest_asyncio.fixture(scope="module")
+async def perf_client():
+    with pytest.MonkeyPatch.context() as monkeypatch:
+        monkeypatch.setattr(settings, "CHAT_PROVIDER", "mock")
+        pack_command = Connection.pack_command
+
+        def counting_pack_command(self, *args):
+            counts = _counts.get()
+            if counts is not None:
+                counts.redis += 1
+            return pack_command(self, *args)
+
+        monkeypatch.setattr(Connection, "pack_command", counting_pack_command)
+        event.listen(Engine, "before_cursor_execute", _count_query)
+        try:
+            async with app.router.lifespan_context(app), AsyncClient(
+                app=app, base_url=url
+            ) as client:
+                yield client
+        finally:
+            event.remove(Engine, "before_cursor_execute", _count_query)
+
+
+@pytest_asyncio.fixture(scope="module")
+async def seeded(perf_client):
+    """
+    The headers of the superuser. Saves the ids of seeded rows in VALUES.
+    The chat session it creates is removed with the messages of the chat
+    budgets at the end.
+    """
+    response = await perf_client.post(
+        "/login",
+        json={
+            "email": settings.FIRST_SUPERUSER_EMAIL,
+            "password": settings.FIRST_SUPERUSER_PASSWORD,
+        },
+    )
+    data = response.json()["data"]
+    headers = {"Authorization": f"Bearer {data['access_token']}"}
+
+    async def first(path: str, **exclude: Any) -> dict[str, Any]:
+        response = await perf_client.get(path, headers=headers)
+        items = response.json()["data"]["items"]
+        return next(item for item in items if item["id"] not in exclude.values())
+
+    me = data["user"]["id"]
+    session = await perf_client.post(
+        "/chat/sessions", json={"title": "Perf"}, headers=headers
+    )
+    VALUES.update(
+        me=me,
+        other=(await first("/user/list", me=me))["id"],
+        role=(await first("/role"))["id"],
+        group=(await first("/group"))["id"],
+        team=(await first("/team"))["id"],
+        hero=(await first("/hero"))["id"],
+        session=session.json()["data"]["id"],
+        refresh=data["refresh_token"],
+    )
+    yield headers
+    await _remove_chat_session(VALUES["session"])
+
+
+async def _prepare(client, headers, budget: Budget) -> dict[str, Any]:
+    values = {**VALUES, "n": uuid4().hex[:12]}
+    if budget.before is not None:
+        method, path, json = budget.before
+        response = await client.request(
+            method, _fill(path, values), json=_fill(json, values), headers=headers
+        )
+        data = response.json().get("data") if response.is_success else None
+        if isinstance(data, dict) and "id" in data:
+            values["created"] = data["id"]
+    return values
+
+
+async def _request(client, headers, budget: Budget, values: dict[str, Any]):
+    return await client.request(
+        budget.method,
+        _fill(budget.path, values),
+        json=_fill(budget.json, values),
+        headers=headers,
+    )
+
+
+async def _clean_up(client, headers, budget: Budget, response) -> None:
+    if budget.after is not None and response.is_success:
+        created = response.json()["data"]["id"]
+        if callable(budget.after):
+            await budget.after(created)
+            return
+        await client.delete(
+            _fill(budget.after, {**VALUES, "created": created}), headers=headers
+        )
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize(
+    "budget", BUDGETS, ids=[f"{b.method} {b.path}" for b in BUDGETS]
+)
+async def test_budget(perf_client, seeded, budget: Budget):
+    headers = seeded
+    values = await _prepare(perf_client, headers, budget)
+    response = await _request(perf_client, headers, budget, values)
+    assert response.is_success, response.text
+    await _clean_up(perf_client, headers, budget, response)
+
+    values = await _prepare(perf_client, headers, budget)
+    counts = Counts()
+    token = _counts.set(counts)
+    tracemalloc.start()
+    try:
+        response = await _request(perf_client, headers, budget, values)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+        _counts.reset(token)
+    assert response.is_success, response.text
+    await _clean_up(perf_client, headers, budget, response)
+
+    # The garbage of the previous tests is not this endpoint's
+    gc.collect()
+    latencies = []
+    for _ in range(REPEAT):
+        values = await _prepare(perf_client, headers, budget)
+        start = time.perf_counter()
+        response = await _request(perf_client, headers, budget, values)
+        latencies.append(time.perf_counter() - start)
+        await _clean_up(perf_client, headers, budget, response)
+    p95_ms = statistics.quantiles(latencies, n=20)[18] * 1000
+
+    measured = (
+        f"{counts.queries} statements, {counts.redis} Redis commands, "
+        f"{peak / 1024:.0f} KiB, p95 {p95_ms:.1f} ms"
+    )
+    assert counts.queries <= budget.queries, measured
+    assert counts.redis <= budget.redis, measured
+    assert peak / 1024 <= budget.kib, measured
+    assert p95_ms <= budget.p95_ms * LATENCY_SCALE, measured
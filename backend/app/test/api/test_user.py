@@ -3,7 +3,12 @@ import pytest
 from httpx import AsyncClient
 from app.main import app
 from typing import AsyncGenerator
+from uuid import uuid4
+from app import crud
+from app.api.deps import get_redis_client
 from app.core.config import settings
+from app.db.session import SessionLocal
+from app.schemas.role_schema import IRoleEnum
 
 url = "http://fastapi.localhost/api/v1"
 
@@ -25,6 +30,8 @@ class TestPostLogin:
             ("get", "/user", None, 200, None),
             ("get", "/user/list", None, 200, None),
             ("get", "/user/list/by_role_name?user_status=active&page=1&size=50", None, 200, None),            
+            ("get", "/user/search?name=admin&size=10", None, 200, None),
+            ("get", "/user/search?name=admin&cursor=bm90LWEtY3Vyc29y", None, 400, None),
         ],
     )
     async def test(self, test_client, method, endpoint, data, expected_status, expected_response):        
@@ -45,3 +52,63 @@ class TestPostLogin:
             assert response.status_code == expected_status
             if expected_response is not None:                
                 assert response.json() == expected_response
+
+
+async def _set_role(email: str, role_name: str) -> None:
+    redis_client = await get_redis_client()
+    async with SessionLocal() as session:
+        role = await crud.role.get_role_by_name(name=role_name, db_session=session)
+        user = await crud.user.get_by_email(email=email, db_session=session)
+        await crud.user.update(obj_current=user, obj_new={"role_id": role.id}, db_session=session, redis_client=redis_client)
+    await redis_client.close()
+
+
+async def _login_as(client: AsyncClient, user: dict, role_name: str) -> dict:
+    await _set_role(user["user"]["email"], role_name)
+    response = await client.post("/login", json={"email": user["user"]["email"], "password": user["password"]})
+    return {"Authorization": f"Bearer {response.json()['data']['access_token']}"}
+
+
+@pytest.mark.asyncio
+class TestRoleClaims:
+    async def test_demoted_user_loses_the_role_of_its_tokens(self, test_client, register):
+        async for client in test_client:
+            user = await register(client)
+            headers = await _login_as(client, user, IRoleEnum.admin)
+            response = await client.get("/user/list", headers=headers)
+            assert response.status_code == 200
+            assert response.json()["message"] == "Data paginated correctly"
+
+            await _set_role(user["user"]["email"], IRoleEnum.user)
+            response = await client.get("/user/list", headers=headers)
+            assert response.status_code == 403
+
+    async def test_role_change_needs_a_redis_client(self, test_client, register):
+        async for client in test_client:
+            user = await register(client)
+            async with SessionLocal() as session:
+                role = await crud.role.get_role_by_name(name=IRoleEnum.admin, db_session=session)
+                current = await crud.user.get_by_email(email=user["user"]["email"], db_session=session)
+                with pytest.raises(ValueError):
+                    await crud.user.update(obj_current=current, obj_new={"role_id": role.id}, db_session=session)
+
+
+@pytest.mark.asyncio
+class TestUserSearch:
+    async def test_misspelled_name_is_found(self, test_client, register):
+        async for client in test_client:
+            last_name = f"Quenbrook{uuid4().hex[:6]}"
+            headers = await _login_as(client, await register(client, first_name="Fuzzy", last_name=last_name), IRoleEnum.admin)
+            response = await client.get("/user/search", params={"name": f"Fuzy {last_name.replace('br', 'b')}"}, headers=headers)
+            assert response.status_code == 200
+            assert response.json()["data"]["items"][0]["last_name"] == last_name
+
+    async def test_wildcards_are_matched_literally(self, test_client, register):
+        async for client in test_client:
+            headers = await _login_as(client, await register(client, first_name="Wild", last_name="Card"), IRoleEnum.admin)
+            response = await client.get("/user/search", params={"name": "%"}, headers=headers)
+            assert response.json()["data"]["items"] == []
+            response = await client.get("/user/list/by_role_name", params={"name": "%"}, headers=headers)
+            assert response.json()["data"]["total"] == 0
+            response = await client.get("/user/list/by_role_name", params={"role_name": "_"}, headers=headers)
+            assert response.json()["data"]["total"] == 0
@@ -0,0 +1,19 @@
+import pytest
+from httpx import AsyncClient
+from typing import Awaitable, Callable
+from uuid import uuid4
+
+
+@pytest.fixture(scope='function')
+def register() -> Callable[..., Awaitable[dict]]:
+    """
+    Registers a new user, with a unique email, through the client of an API test.
+    Returns the user and its tokens, its password and the headers of its access token.
+    """
+    async def register(client: AsyncClient, **fields: str) -> dict:
+        user = {"first_name": "Test", "last_name": "User", "email": f"test-{uuid4().hex}@example.com", "password": "test-user-password", **fields}
+        response = await client.post("/login/register", json=user)
+        assert response.status_code == 201
+        data = response.json()["data"]
+        return {**data, "password": user["password"], "headers": {"Authorization": f"Bearer {data['access_token']}"}}
+    return register
@@ -1,7 +1,16 @@
 import pytest
+import requests
+from fastapi import Depends, FastAPI, WebSocketDisconnect
+from fastapi.testclient import TestClient
 from httpx import AsyncClient
 from typing import AsyncGenerator
+from unittest import mock
+from uuid import uuid4
+from app.api.deps import get_redis_client
+from app.core.config import settings
 from app.main import app
+from app.utils.google_certs import CachingRequest
+from app.utils.rate_limiter import HybridRateLimiter, RateLimiter
 client = AsyncClient(app=app)
 
 url = "http://fastapi.localhost"
@@ -19,3 +28,89 @@ async def test_root(test_client):
     assert response.status_code == 200
     assert response.json() == {"message": "Hello World"}        
 
+
+@pytest.mark.asyncio
+async def test_metrics(test_client):
+    async for client in test_client:
+        await client.get('/')
+        response = await client.get('/metrics')
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain; version=0.0.4")
+    assert 'http_requests_total{method="GET",route="/",status="200"}' in response.text
+
+
+@pytest.mark.asyncio
+async def test_pubsub_push_requires_its_token(test_client):
+    message = {"message": {"data": "eyJldmVudCI6ICJyZWJ1aWxkX2hlcm9fc3RhdHMifQ=="}}
+    async for client in test_client:
+        response = await client.post('/api/v1/pubsub/push', json=message)
+        assert response.status_code == 403
+        response = await client.post('/api/v1/pubsub/push', json=message, headers={"Authorization": "Bearer not-a-google-token"})
+        assert response.status_code == 403
+
+
+def test_google_certs_are_fetched_once_per_max_age():
+    certs = requests.Response()
+    certs.status_code, certs._content = 200, b"{}"
+    certs.headers["Cache-Control"] = "public, max-age=60"
+    transport = CachingRequest()
+    with mock.patch.object(transport.session, "request", return_value=certs) as fetch:
+        for _ in range(3):
+            assert transport("https://www.googleapis.com/oauth2/v1/certs").data == b"{}"
+    assert fetch.call_count == 1
+
+
+@pytest.mark.asyncio
+async def test_rate_limit_rejects_over_the_limit():
+    limited = FastAPI()
+    limited.get("/limited", dependencies=[Depends(RateLimiter(times=2, minutes=1))])(lambda: {})
+    headers = {"X-Forwarded-For": str(uuid4())}
+    async with AsyncClient(app=limited, base_url=url) as client:
+        assert [(await client.get("/limited", headers=headers)).status_code for _ in range(2)] == [200, 200]
+        response = await client.get("/limited", headers=headers)
+    assert response.status_code == 429
+    # Sliding window: up to two windows until the oldest requests stop counting
+    assert 0 < int(response.headers["Retry-After"]) <= 120
+
+
+@pytest.mark.asyncio
+async def test_rate_limit_is_shared_by_the_instances():
+    redis_client = await get_redis_client()
+    prefix = f"rate-limit-test:{uuid4()}"
+    instances = [HybridRateLimiter(prefix=prefix), HybridRateLimiter(prefix=prefix)]
+    for instance in instances:
+        instance.init(redis_client)
+    try:
+        # Each instance leases blocks of 50 tokens, 1000 in all across both
+        allowed = [await instances[i % 2].hit("key", 1000, 60000) == 0 for i in range(1000)]
+        assert all(allowed)
+        assert await instances[0].hit("key", 1000, 60000) > 0
+        assert await instances[1].hit("key", 1000, 60000) > 0
+    finally:
+        for instance in instances:
+            await instance.close()
+
+
+def test_chat_websocket_requires_the_token_of_its_user():
+    # Not a context manager: test_performance runs the lifespan
+    client = TestClient(app)
+    credentials = {"email": settings.FIRST_SUPERUSER_EMAIL, "password": settings.FIRST_SUPERUSER_PASSWORD}
+    data = client.post(f"{settings.API_V1_STR}/login", json=credentials).json()["data"]
+    user_id, token = data["user"]["id"], data["access_token"]
+
+    for path, headers in [
+        (f"/chat/{user_id}", {}),
+        (f"/chat/{user_id}", {"Authorization": "Bearer not-a-token"}),
+        (f"/chat/{uuid4()}", {"Authorization": f"Bearer {token}"}),
+        (f"/chat/{user_id}", {"Authorization": f"Bearer {data['refresh_token']}"}),
+    ]:
+        with pytest.raises(WebSocketDisconnect) as disconnect:
+            with client.websocket_connect(path, headers=headers):
+                pass
+        assert disconnect.value.code == 1008
+
+    # Accepted, with the token in the header or as a query parameter
+    with client.websocket_connect(f"/chat/{user_id}", headers={"Authorization": f"Bearer {token}"}):
+        pass
+    with client.websocket_connect(f"/chat/{user_id}?token={token}"):
+        pass
@@ -13,7 +13,6 @@ locals {
     app = "fastapi-react"
   }
   vpc_connector_full_name = "projects/${var.project_id}/locations/${var.region}/connectors/serverless-connector-dev"
-  backend_url_for_pubsub  = var.backend_url_override != "" ? var.backend_url_override : module.cloud_run.backend_url
 }
 
 provider "google" {
@@ -136,7 +135,7 @@ module "pubsub_scheduler" {
   source              = "../../modules/pubsub_scheduler"
   project_id          = var.project_id
   region              = var.region
-  push_endpoint       = "${local.backend_url_for_pubsub}/api/v1/pubsub/push"
+  push_endpoint       = module.cloud_run.pubsub_push_endpoint
   push_service_account = module.cloud_run.backend_service_account
   labels              = local.labels
 }
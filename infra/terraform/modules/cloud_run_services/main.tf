@@ -22,9 +22,16 @@ resource "google_service_account" "frontend" {
   depends_on   = [google_project_service.iam_api]
 }
 
+data "google_project" "current" {
+  project_id = var.project_id
+}
+
 locals {
   use_cloudsql  = var.db_connection_name != ""
   db_host_value = local.use_cloudsql ? "/cloudsql/${var.db_connection_name}" : var.db_host
+  # The deterministic URL of the backend: the service cannot read its own uri
+  backend_url          = var.backend_url_override != "" ? var.backend_url_override : "https://fastapi-backend-${data.google_project.current.number}.${var.region}.run.app"
+  pubsub_push_endpoint = "${local.backend_url}/api/v1/pubsub/push"
 }
 
 resource "google_cloud_run_v2_service" "backend" {
@@ -131,6 +138,16 @@ resource "google_cloud_run_v2_service" "backend" {
         name  = "PROJECT_NAME"
         value = var.project_name
       }
+      # Pub/Sub push requests carry an OIDC token whose audience is the push
+      # endpoint, issued to the backend service account
+      env {
+        name  = "PUBSUB_AUDIENCE"
+        value = local.pubsub_push_endpoint
+      }
+      env {
+        name  = "PUBSUB_SERVICE_ACCOUNT"
+        value = google_service_account.backend.email
+      }
       dynamic "volume_mounts" {
         for_each = local.use_cloudsql ? [1] : []
         content {
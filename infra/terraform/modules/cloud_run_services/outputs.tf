@@ -17,3 +17,7 @@ output "frontend_service_name" {
 output "backend_service_account" {
   value = google_service_account.backend.email
 }
+
+output "pubsub_push_endpoint" {
+  value = local.pubsub_push_endpoint
+}